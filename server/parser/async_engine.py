@@ -0,0 +1,249 @@
+import asyncio
+import atexit
+import concurrent.futures
+import logging
+import threading
+import time
+
+from asgiref.sync import sync_to_async
+from django.db import connection
+
+from .clients import create_async_http_client
+from .checkpoints import load_done_pages, record_failed_pages
+from .conf import parser_settings
+from .crawl import CrawlProgress
+from .events import COMPLETED, ERROR, publish_progress
+from .metrics import record_fetch, track_parse_job
+from .models import SearchQueryModel
+from .services import IncompleteParsingError, MarketplaceParserService
+from .throttling import async_send_with_retries
+
+logger = logging.getLogger(__name__)
+
+
+def _close_db_connection():
+    """Закрытие соединения с БД текущего потока"""
+    connection.close()
+
+
+class AsyncParsingEngine:
+    """
+    Асинхронный движок парсинга
+
+    Все поиски процесса выполняются в одном цикле событий, работающем
+    в отдельном потоке. Запросы страниц ограничены общим семафором
+    и общим с потоковым движком лимитом частоты, запись в БД выполняется
+    через sync_to_async в одном потоке.
+    """
+
+    def __init__(self, concurrency: int | None = None):
+        self.concurrency = concurrency or parser_settings("ASYNC_CONCURRENCY")
+        self.service = MarketplaceParserService()
+        self._loop = asyncio.new_event_loop()
+        self._ready = threading.Event()
+        self._thread = threading.Thread(target=self._run_loop, daemon=True)
+        self._thread.start()
+        self._ready.wait()
+
+    def _run_loop(self):
+        """Цикл событий движка"""
+        asyncio.set_event_loop(self._loop)
+        self._loop.run_until_complete(self._setup())
+        self._ready.set()
+        self._loop.run_forever()
+
+    async def _setup(self):
+        # Клиент и семафор должны создаваться внутри цикла движка
+        self.client = create_async_http_client()
+        self.semaphore = asyncio.Semaphore(self.concurrency)
+
+    def submit(self, search_query_id: int, query_text: str) -> concurrent.futures.Future:
+        """
+        Постановка поиска в цикл событий движка
+
+        Returns:
+            concurrent.futures.Future: Завершается по окончании парсинга
+        """
+        return asyncio.run_coroutine_threadsafe(
+            self.parse_marketplace(search_query_id, query_text), self._loop
+        )
+
+    def close(self):
+        """Закрытие клиента и остановка цикла событий"""
+        if not self._loop.is_running():
+            return
+        asyncio.run_coroutine_threadsafe(self.client.aclose(), self._loop).result()
+        # Запросы к БД движка выполняются в потоке sync_to_async:
+        # закрываем его соединение, чтобы оно не пережило движок
+        asyncio.run_coroutine_threadsafe(
+            sync_to_async(_close_db_connection)(), self._loop
+        ).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._loop.close()
+
+    async def get_data(self, query_text: str, page: int = 1, return_data: bool = False) -> tuple[bool, int, list[dict], str | None]:
+        """Асинхронный аналог MarketplaceParserService.get_data"""
+        started = time.perf_counter()
+        response = None
+        try:
+            params = self.service.build_search_params(query_text, page)
+            async with self.semaphore:
+                response = await async_send_with_retries(
+                    lambda: self.client.get(parser_settings("SEARCH_URL"), params=params)
+                )
+            result = self.service.parse_search_response(response, return_data)
+
+        except Exception as e:
+            result = False, 0, [], f"Ошибка при проверке запроса: {str(e)}"
+
+        record_fetch("asyncio", time.perf_counter() - started, response, self.service.is_failed(result))
+        return result
+
+    def run(self, search_query_id: int, query_text: str):
+        """Блокирующий запуск парсинга с пробросом исключений (для воркера очереди)"""
+        asyncio.run_coroutine_threadsafe(
+            self.run_parsing(search_query_id, query_text), self._loop
+        ).result()
+
+    async def parse_marketplace(self, search_query_id: int, query_text: str):
+        """Парсинг в фоне: ошибки только выводятся в лог"""
+        try:
+            await self.run_parsing(search_query_id, query_text)
+        except IncompleteParsingError as e:
+            await sync_to_async(self.service.complete_search_query)(search_query_id)
+            logger.warning("Парсинг завершен не полностью: %s", e)
+        except SearchQueryModel.DoesNotExist:
+            logger.warning("SearchQueryModel с ID %s не найден", search_query_id)
+        except Exception as e:
+            publish_progress(search_query_id, ERROR, error=str(e))
+            logger.exception("Ошибка при парсинге запроса %s", search_query_id)
+
+    @track_parse_job("asyncio")
+    async def run_parsing(self, search_query_id: int, query_text: str) -> int:
+        """
+        Основная логика парсинга, повторяющая потоковый движок (включая возобновление)
+
+        Returns:
+            int: Количество записанных товаров
+        """
+        search_query = await SearchQueryModel.objects.aget(id=search_query_id)
+        done_pages = await sync_to_async(load_done_pages)(search_query_id)
+
+        if 1 in done_pages:
+            is_valid, total_results, error_message = True, done_pages[1].reported_total, None
+        else:
+            # Страница, уже полученная проверкой запроса, берется из общего кэша
+            first_page = self.service.take_cached_first_page(query_text)
+            if first_page is None:
+                first_page = await self.get_data(query_text, page=1, return_data=True)
+            is_valid, total_results, first_page_products, error_message = first_page
+
+        if not is_valid and error_message != self.service.NO_RESULTS_MESSAGE:
+            await sync_to_async(record_failed_pages)(search_query_id, [1], error_message)
+            raise IncompleteParsingError([1], error_message)
+
+        if not is_valid:
+            await SearchQueryModel.objects.filter(id=search_query_id).aupdate(
+                is_completed=True,
+                total_results=0,
+            )
+            publish_progress(search_query_id, COMPLETED, total_results=0, error=error_message)
+            logger.info("Невалидный запрос: %s", error_message)
+            return 0
+
+        pages_count = self.service.get_pages_count(search_query, total_results)
+        progress = CrawlProgress(max(pages_count, max(done_pages, default=0)))
+        for page, checkpoint in sorted(done_pages.items()):
+            progress.restore(page, checkpoint.fingerprint)
+
+        written = 0
+        if 1 not in done_pages:
+            progress.register(1, first_page_products)
+            written = await self._process_products(search_query, first_page_products, 1, total_results)
+
+        # Остальные страницы запрашиваются конкурентно в общем цикле событий:
+        # сопрограммы берут номера из общего итератора по возрастанию,
+        # поэтому на конце выдачи следующие страницы уже не запрашиваются
+        pages = self.service.get_pending_pages(pages_count, done_pages)
+        workers_count = max(1, min(self.concurrency, pages_count - 1))
+        failed_pages = []
+        written += sum(await asyncio.gather(
+            *(self._parse_pages(search_query, query_text, pages, progress, failed_pages, total_results)
+              for _ in range(workers_count))
+        ))
+
+        # Страницы за концом выдачи не считаются потерянными
+        failed_pages = [page for page in failed_pages if page <= progress.last_page]
+        if failed_pages:
+            error_message = "ошибка загрузки или записи страниц"
+            await sync_to_async(record_failed_pages)(search_query_id, failed_pages, error_message)
+            raise IncompleteParsingError(failed_pages, error_message)
+
+        await sync_to_async(self.service.complete_search_query)(search_query_id)
+        return written
+
+    async def _parse_pages(self, search_query: SearchQueryModel, query_text: str, pages,
+                           progress: CrawlProgress, failed_pages: list[int], reported_total: int) -> int:
+        """Последовательный парсинг страниц из общего итератора до конца выдачи"""
+        written = 0
+        for page in pages:
+            if not progress.should_fetch(page):
+                break
+            written += await self._parse_page(
+                search_query, query_text, page, progress, failed_pages, reported_total
+            )
+        return written
+
+    async def _parse_page(self, search_query: SearchQueryModel, query_text: str, page: int,
+                          progress: CrawlProgress, failed_pages: list[int], reported_total: int) -> int:
+        """Парсинг одной страницы результатов с учетом конца выдачи"""
+        try:
+            _, _, products, error_message = await self.get_data(query_text, page=page, return_data=True)
+            if not products and error_message != self.service.NO_RESULTS_MESSAGE:
+                # Запрос не удался и после повторов
+                failed_pages.append(page)
+                return 0
+            if not progress.register(page, products):
+                return 0
+            return await self._process_products(search_query, products, page, reported_total)
+
+        except Exception:
+            # Страница не записана: она попадает в незавершенные, как и
+            # не загруженная, чтобы ее дозагрузило возобновление
+            logger.exception("Ошибка при парсинге страницы %s", page)
+            failed_pages.append(page)
+            return 0
+
+    async def _process_products(self, search_query: SearchQueryModel, products: list[dict],
+                                page: int, reported_total: int) -> int:
+        """Сохранение товаров и контрольной точки страницы тем же кодом, что и в потоковом движке"""
+        return await sync_to_async(self.service._process_products)(
+            search_query, products, page, reported_total
+        )
+
+
+_engine: AsyncParsingEngine | None = None
+_engine_lock = threading.Lock()
+
+
+def get_async_engine() -> AsyncParsingEngine:
+    """Получение общего для процесса асинхронного движка"""
+    global _engine
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                _engine = AsyncParsingEngine()
+    return _engine
+
+
+def close_async_engine():
+    """Остановка общего асинхронного движка"""
+    global _engine
+    with _engine_lock:
+        if _engine is not None:
+            _engine.close()
+            _engine = None
+
+
+atexit.register(close_async_engine)
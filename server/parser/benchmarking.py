@@ -0,0 +1,261 @@
+import concurrent.futures
+import contextlib
+import itertools
+import random
+import resource
+import sys
+import threading
+import time
+
+from django.db import connection, models
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.test.utils import setup_databases, teardown_databases
+
+from .db_writer import close_db_writer
+from .fake_marketplace import FakeMarketplaceConfig, FakeMarketplaceServer, build_search_page
+from .models import ParsePageModel, ProductResultModel, SearchQueryModel
+from .services import MarketplaceParserService
+
+
+@contextlib.contextmanager
+def temporary_database():
+    """
+    Временная тестовая БД для бенчмарков
+
+    Команды бенчмарков наполняют БД синтетическими данными, поэтому
+    работают с отдельной тестовой базой, а не с рабочей.
+    """
+    old_config = setup_databases(verbosity=0, interactive=False)
+    try:
+        yield
+    finally:
+        # Соединение потока общего писателя должно быть закрыто до удаления БД
+        close_db_writer()
+        teardown_databases(old_config, verbosity=0)
+
+
+def seed_search_query(query_text: str, products_count: int) -> SearchQueryModel:
+    """
+    Создание завершенного поискового запроса с синтетическими товарами
+
+    Товары проходят тот же путь сохранения, что и при парсинге:
+    со сквозными позициями в выдаче и контрольными точками страниц.
+    """
+    search_query = SearchQueryModel.objects.create(query_text=query_text)
+    service = MarketplaceParserService()
+    config = FakeMarketplaceConfig(total=products_count, page_size=service.RESULTS_PER_PAGE)
+    pages_count = (products_count + config.page_size - 1) // config.page_size
+    for page in range(1, pages_count + 1):
+        products = build_search_page(config, query_text, page)["data"]["products"]
+        service._process_products(search_query, products, page, reported_total=products_count)
+    service.complete_search_query(search_query.id)
+    search_query.refresh_from_db()
+    return search_query
+
+
+def percentile(values: list[float], percent: float) -> float:
+    """Перцентиль по методу ближайшего ранга"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, round(percent / 100 * len(ordered) + 0.5) - 1))
+    return ordered[index]
+
+
+def peak_rss_mb() -> float:
+    """Пиковый RSS процесса с момента запуска, МБ"""
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss: килобайты в Linux, байты в macOS
+    return rss / 1024 / 1024 if sys.platform == "darwin" else rss / 1024
+
+
+def run_parse_benchmark(server: FakeMarketplaceServer, searches: int,
+                        prefix: str = "бенчмарк") -> dict:
+    """
+    Одновременный парсинг нескольких запросов с загрузкой из заглушки
+
+    Каждый запрос проходит весь путь _parse_marketplace: загрузку страниц
+    через общий HTTP-клиент и лимит частоты, конвейер и запись в БД.
+    SEARCH_URL и лимиты клиента задает вызывающий код.
+
+    Args:
+        server: Запущенная заглушка маркетплейса
+        searches: Количество одновременных парсингов
+        prefix: Префикс текстов запросов (тексты уникальны в БД)
+
+    Returns:
+        dict: Пропускная способность, перцентили времени парсинга
+        и счетчики заглушки за прогон
+    """
+    queries = SearchQueryModel.objects.bulk_create(
+        [SearchQueryModel(query_text=f"{prefix} {index}") for index in range(searches)]
+    )
+    requests_before = server.requests_count
+    throttled_before = server.throttled_count
+    errors_before = server.errors_count
+
+    def parse(search_query: SearchQueryModel) -> float:
+        started = time.perf_counter()
+        try:
+            MarketplaceParserService()._parse_marketplace(search_query.id, search_query.query_text)
+        finally:
+            # Соединения потоков не должны пережить временную БД
+            connection.close()
+        return time.perf_counter() - started
+
+    started = time.perf_counter()
+    with concurrent.futures.ThreadPoolExecutor(max_workers=searches) as executor:
+        durations = list(executor.map(parse, queries))
+    elapsed = time.perf_counter() - started
+
+    pages = dict(
+        ParsePageModel.objects.filter(search_query__in=queries)
+        .values_list("status")
+        .annotate(count=models.Count("id"))
+    )
+    rows = ProductResultModel.objects.filter(search_query__in=queries).count()
+    pages_done = pages.get(ParsePageModel.Status.DONE, 0)
+    return {
+        "searches": searches,
+        "elapsed_seconds": round(elapsed, 3),
+        "pages": pages_done,
+        "failed_pages": pages.get(ParsePageModel.Status.FAILED, 0),
+        "rows": rows,
+        "pages_per_second": round(pages_done / elapsed, 1),
+        "rows_per_second": round(rows / elapsed, 1),
+        "job_p50_seconds": round(percentile(durations, 50), 3),
+        "job_p99_seconds": round(percentile(durations, 99), 3),
+        "requests": server.requests_count - requests_before,
+        "throttled": server.throttled_count - throttled_before,
+        "server_errors": server.errors_count - errors_before,
+        "peak_rss_mb": round(peak_rss_mb(), 1),
+    }
+
+
+def build_api_plan(search_ids: list[int], products_count: int, sorts: list[str],
+                   page_sizes: list[int], depths: list[int], history_page_sizes: list[int],
+                   requests_count: int, seed: int = 1) -> list[dict]:
+    """
+    Набор запросов нагрузочного теста API
+
+    Запросы результатов перебирают сочетания сортировок, размеров и номеров
+    страниц (номер ограничен последней страницей), запросы истории - размеры
+    страниц. Сочетания повторяются по кругу до requests_count и перемешиваются.
+
+    Args:
+        search_ids: ID заполненных поисковых запросов
+        products_count: Товаров в каждом запросе (для последней страницы)
+        sorts: Параметры сортировки, например "price_sort=asc&name_sort=desc" ("" - без сортировки)
+        page_sizes: Размеры страниц результатов
+        depths: Номера страниц результатов
+        history_page_sizes: Размеры страниц истории запросов (пустой список - без истории)
+        requests_count: Количество запросов
+        seed: Начальное значение перемешивания
+
+    Returns:
+        list[dict]: Запросы {"endpoint", "path", "params", "sort", "page_size", "page"}
+    """
+    shapes = []
+    for sort, page_size, depth in itertools.product(sorts, page_sizes, depths):
+        page = min(depth, max(1, -(-products_count // page_size)))
+        sort_params = dict(param.split("=", 1) for param in sort.split("&") if param)
+        shapes.append({
+            "endpoint": "result", "path": "/api/products/result/", "sort": sort or "default",
+            "page_size": page_size, "page": page,
+            "params": {"page_size": page_size, "page": page, **sort_params},
+        })
+    for page_size in history_page_sizes:
+        shapes.append({
+            "endpoint": "history", "path": "/api/search/history/", "sort": "default",
+            "page_size": page_size, "page": 1, "params": {"page_size": page_size},
+        })
+
+    randomizer = random.Random(seed)
+    plan = []
+    for index, shape in zip(range(requests_count), itertools.cycle(shapes)):
+        request = {**shape, "params": dict(shape["params"])}
+        if request["endpoint"] == "result":
+            request["params"]["id"] = randomizer.choice(search_ids)
+        plan.append(request)
+    randomizer.shuffle(plan)
+    return plan
+
+
+def _summarize(samples: list[tuple[float, int]], elapsed: float | None = None) -> dict:
+    latencies = [latency for latency, _ in samples]
+    queries = [count for _, count in samples]
+    summary = {
+        "requests": len(samples),
+        "p50_ms": round(percentile(latencies, 50) * 1000, 2),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 2),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 2),
+        "max_ms": round(max(latencies, default=0) * 1000, 2),
+        "queries_avg": round(sum(queries) / len(queries), 2) if queries else 0.0,
+        "queries_max": max(queries, default=0),
+    }
+    if elapsed is not None:
+        summary["elapsed_seconds"] = round(elapsed, 3)
+        summary["requests_per_second"] = round(len(samples) / elapsed, 1) if elapsed else 0.0
+    return summary
+
+
+def run_api_load(plan: list[dict], concurrency: int) -> dict:
+    """
+    Выполнение запросов API в несколько потоков
+
+    Запросы проходят весь стек Django (middleware, маршрутизация, DRF)
+    в процессе без HTTP-сервера. SQL-запросы считаются отдельно для
+    каждого запроса: у каждого потока свое соединение с БД.
+
+    Args:
+        plan: Запросы из build_api_plan
+        concurrency: Количество одновременных клиентов
+
+    Returns:
+        dict: Общая сводка ("total": пропускная способность, перцентили
+        времени ответа, SQL-запросов на запрос, ошибки) и сводки по группам
+        ("groups": по endpoint, сортировке, размеру и номеру страницы)
+    """
+    requests = iter(plan)
+    lock = threading.Lock()
+    samples: dict[tuple, list[tuple[float, int]]] = {}
+    errors = [0]
+
+    def client_loop():
+        client = Client(HTTP_HOST="localhost")
+        try:
+            while True:
+                with lock:
+                    request = next(requests, None)
+                if request is None:
+                    return
+                with CaptureQueriesContext(connection) as captured:
+                    started = time.perf_counter()
+                    response = client.get(request["path"], request["params"])
+                    latency = time.perf_counter() - started
+                key = (request["endpoint"], request["sort"], request["page_size"], request["page"])
+                with lock:
+                    samples.setdefault(key, []).append((latency, len(captured.captured_queries)))
+                    if response.status_code != 200:
+                        errors[0] += 1
+        finally:
+            # Соединения потоков не должны пережить временную БД
+            connection.close()
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=client_loop) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    total = _summarize([sample for group in samples.values() for sample in group], elapsed)
+    total["concurrency"] = concurrency
+    total["errors"] = errors[0]
+    groups = [
+        {"endpoint": endpoint, "sort": sort, "page_size": page_size, "page": page, **_summarize(group)}
+        for (endpoint, sort, page_size, page), group in sorted(samples.items())
+    ]
+    return {"total": total, "groups": groups}
@@ -0,0 +1,51 @@
+from django.db import IntegrityError, transaction
+
+from .models import SearchQueryModel
+
+# Статусы запросов в ответе пакетного создания
+CREATED = "created"
+EXISTS = "exists"
+DUPLICATE = "duplicate"
+
+
+def create_search_queries(query_texts: list[str]) -> tuple[list[dict], list[SearchQueryModel]]:
+    """
+    Пакетное создание поисковых запросов
+
+    Уже существующие тексты находятся одним запросом, новые записи
+    создаются одним bulk_create. Повтор текста внутри пакета получает
+    id первого вхождения. Если такой же запрос одновременно создал
+    другой процесс, существующие записи перечитываются один раз.
+
+    Args:
+        query_texts: Тексты запросов (уже проверенные сериализатором)
+
+    Returns:
+        tuple[list[dict], list[SearchQueryModel]]: Статусы в порядке
+        query_texts ({"query_text", "id", "status"}) и созданные запросы
+    """
+    unique_texts = list(dict.fromkeys(query_texts))
+    for attempt in range(2):
+        existing = dict(
+            SearchQueryModel.objects.filter(query_text__in=unique_texts).values_list("query_text", "id")
+        )
+        new = [SearchQueryModel(query_text=text) for text in unique_texts if text not in existing]
+        try:
+            with transaction.atomic():
+                created = SearchQueryModel.objects.bulk_create(new)
+            break
+        except IntegrityError:
+            if attempt:
+                raise
+
+    # SQLite и PostgreSQL возвращают id созданных строк
+    ids = {**existing, **{search_query.query_text: search_query.id for search_query in created}}
+    items, seen = [], set()
+    for text in query_texts:
+        if text in seen:
+            item_status = DUPLICATE
+        else:
+            item_status = EXISTS if text in existing else CREATED
+            seen.add(text)
+        items.append({"query_text": text, "id": ids[text], "status": item_status})
+    return items, created
@@ -0,0 +1,67 @@
+import hashlib
+
+from django.core.cache import caches
+from django.db.models import F
+from django.utils.http import parse_etags
+
+from .conf import parser_settings
+from .models import SearchQueryModel
+
+
+def get_results_cache():
+    """Кэш страниц результатов (алиас из настройки RESULTS_CACHE_ALIAS)"""
+    return caches[parser_settings("RESULTS_CACHE_ALIAS")]
+
+
+def invalidate_results(search_query_id: int):
+    """
+    Инвалидация всех закэшированных страниц запроса
+
+    Версия хранится в строке запроса, а не в кэше, поэтому инвалидация
+    из процесса воркера видна веб-процессам даже с кэшем в памяти.
+    """
+    SearchQueryModel.objects.filter(id=search_query_id).update(
+        results_version=F("results_version") + 1
+    )
+
+
+def build_results_cache_key(search_query: SearchQueryModel, host: str, params) -> str:
+    """
+    Ключ кэша страницы результатов
+
+    Args:
+        search_query: Поисковый запрос
+        host: Хост запроса (входит в абсолютные ссылки next/previous)
+        params: Параметры запроса (QueryDict)
+
+    Returns:
+        str: Ключ, включающий версию результатов запроса
+    """
+    # Порядок параметров в URL не влияет на ответ
+    normalized = "&".join(
+        f"{name}={value}" for name, values in sorted(params.lists()) for value in values
+    )
+    digest = hashlib.sha1(f"{host}?{normalized}".encode()).hexdigest()
+    # created_at отличает запрос, созданный заново с тем же id после удаления
+    return (
+        f"results:{search_query.id}:{search_query.created_at.timestamp()}:"
+        f"{search_query.results_version}:{digest}"
+    )
+
+
+def build_etag(cache_key: str) -> str:
+    """ETag ответа, однозначно определяемый ключом кэша"""
+    return '"%s"' % hashlib.sha1(cache_key.encode()).hexdigest()
+
+
+def etag_matches(etag: str, if_none_match: str) -> bool:
+    """
+    Совпадение ETag с заголовком If-None-Match
+
+    Заголовок - список тегов через запятую или "*". Теги сравниваются
+    целиком и без учета признака слабого тега W/ (слабое сравнение, RFC 9110).
+    """
+    tags = parse_etags(if_none_match)
+    if tags == ["*"]:
+        return True
+    return etag.removeprefix("W/") in {tag.removeprefix("W/") for tag in tags}
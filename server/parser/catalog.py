@@ -0,0 +1,131 @@
+from django.db import models
+from django.db.models import F
+
+from .models import BrandModel, ProductModel, ProductResultModel, SearchQueryModel, SupplierModel
+
+
+def build_product_result(search_query_id: int, external_id: int, name: str, brand: str,
+                         supplier: str, **fields) -> ProductResultModel:
+    """
+    Несохраненный результат запроса вместе с товаром каталога
+
+    Товар, бренд и поставщик записываются в каталог функцией save_catalog
+    (ее вызывает insert_products) перед записью результата.
+
+    Args:
+        search_query_id: ID поискового запроса
+        external_id: Внешний ID товара
+        name: Название товара
+        brand: Бренд
+        supplier: Поставщик
+        **fields: Остальные поля ProductResultModel (цена, рейтинги, позиция)
+    """
+    product = ProductModel(
+        external_id=external_id,
+        name=name,
+        brand=BrandModel(name=brand),
+        supplier=SupplierModel(name=supplier),
+    )
+    return ProductResultModel(search_query_id=search_query_id, product=product, **fields)
+
+
+def resolve_names(model: type[models.Model], names: set[str]) -> dict[str, models.Model]:
+    """
+    Записи справочника (бренды, поставщики) по названиям
+
+    Отсутствующие названия добавляются; одновременная запись того же
+    названия другим процессом пропускается ограничением уникальности.
+
+    Returns:
+        dict[str, Model]: Сохраненные записи по названиям
+    """
+    resolved = {obj.name: obj for obj in model.objects.filter(name__in=names)}
+    missing = names - resolved.keys()
+    if missing:
+        model.objects.bulk_create([model(name=name) for name in missing], ignore_conflicts=True)
+        resolved.update({obj.name: obj for obj in model.objects.filter(name__in=missing)})
+    return resolved
+
+
+def save_catalog(instances: list[ProductResultModel], update: bool = False,
+                 batch_size: int = 100) -> int:
+    """
+    Запись в каталог товаров из несохраненных результатов
+
+    Товары, которые уже есть в каталоге (например, найденные другим
+    запросом), повторно не записываются: при пересекающихся запросах
+    каталог только читается по первичному ключу, а пишутся лишь строки
+    результатов. Справочники брендов и поставщиков читаются только для
+    новых и изменившихся товаров. Вызывается внутри transaction.atomic().
+
+    Изменение товара при update увеличивает results_version всех запросов
+    с этим товаром: иначе другие запросы отдавали бы из кэша и по ETag
+    старые значения.
+
+    Args:
+        instances: Результаты из build_product_result
+        update: Обновлять ли изменившиеся название, бренд и поставщика
+            (при обновлении запроса; при парсинге сохраняется первое значение)
+        batch_size: Размер пакета INSERT
+
+    Returns:
+        int: Количество добавленных и обновленных товаров каталога
+    """
+    products = {}
+    for instance in instances:
+        products.setdefault(instance.product_id, instance.product)
+    if not products:
+        return 0
+
+    known = ProductModel.objects.filter(external_id__in=list(products))
+    if update:
+        stored = {
+            row[0]: row[1:]
+            for row in known.values_list("external_id", "name", "brand__name", "supplier__name")
+        }
+    else:
+        stored = dict.fromkeys(known.values_list("external_id", flat=True))
+    new = {}
+    changed = {}
+    for external_id, product in products.items():
+        if external_id not in stored:
+            new[external_id] = product
+        elif update and stored[external_id] != (product.name, product.brand.name, product.supplier.name):
+            changed[external_id] = product
+    if not new and not changed:
+        return 0
+
+    written = [*new.values(), *changed.values()]
+    brands = resolve_names(BrandModel, {product.brand.name for product in written})
+    suppliers = resolve_names(SupplierModel, {product.supplier.name for product in written})
+    for product in written:
+        product.brand = brands[product.brand.name]
+        product.supplier = suppliers[product.supplier.name]
+
+    if new:
+        ProductModel.objects.bulk_create(list(new.values()), batch_size=batch_size, ignore_conflicts=True)
+    if changed:
+        ProductModel.objects.bulk_create(
+            list(changed.values()),
+            batch_size=batch_size,
+            update_conflicts=True,
+            unique_fields=["external_id"],
+            update_fields=["name", "brand", "supplier"],
+        )
+        invalidate_product_results(list(changed))
+    return len(new) + len(changed)
+
+
+def invalidate_product_results(external_ids: list[int]) -> int:
+    """
+    Сброс кэша результатов всех запросов с измененными товарами каталога
+
+    Args:
+        external_ids: Внешние ID измененных товаров
+
+    Returns:
+        int: Количество запросов, у которых увеличен results_version
+    """
+    return SearchQueryModel.objects.filter(
+        id__in=ProductResultModel.objects.filter(product_id__in=external_ids).values("search_query_id")
+    ).update(results_version=F("results_version") + 1)
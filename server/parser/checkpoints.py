@@ -0,0 +1,95 @@
+from functools import partial
+
+from django.db import transaction
+
+from .crawl import page_fingerprint
+from .events import PAGE, PAGE_FAILED, publish_progress
+from .models import ParsePageModel
+
+
+def build_page_checkpoint(search_query_id: int, page: int, products: list[dict],
+                          reported_total: int = 0) -> ParsePageModel:
+    """
+    Несохраненная контрольная точка загруженной страницы
+
+    Сохраняется в одной транзакции с товарами страницы
+    (см. save_page_checkpoints), поэтому страница со статусом done
+    гарантированно записана целиком.
+
+    Args:
+        search_query_id: ID поискового запроса
+        page: Номер страницы
+        products: Товары страницы
+        reported_total: Количество результатов по данным поиска
+    """
+    return ParsePageModel(
+        search_query_id=search_query_id,
+        page=page,
+        status=ParsePageModel.Status.DONE,
+        products_count=len(products),
+        reported_total=reported_total,
+        fingerprint=page_fingerprint(products),
+    )
+
+
+def save_page_checkpoints(checkpoints: list[ParsePageModel]):
+    """
+    Сохранение контрольных точек страниц
+
+    Повторная загрузка страницы (например, ранее завершившейся ошибкой)
+    обновляет существующую запись. Слушатели хода парсинга получают
+    события страниц после фиксации транзакции, то есть только о страницах,
+    действительно записанных в БД.
+    """
+    if not checkpoints:
+        return
+    ParsePageModel.objects.bulk_create(
+        checkpoints,
+        update_conflicts=True,
+        unique_fields=["search_query", "page"],
+        update_fields=["status", "products_count", "reported_total", "fingerprint", "error", "updated_at"],
+    )
+    transaction.on_commit(partial(publish_page_events, checkpoints))
+
+
+def publish_page_events(checkpoints: list[ParsePageModel]):
+    """События записанных и не загруженных страниц"""
+    for checkpoint in checkpoints:
+        if checkpoint.status == ParsePageModel.Status.DONE:
+            publish_progress(
+                checkpoint.search_query_id, PAGE,
+                page=checkpoint.page, products=checkpoint.products_count,
+            )
+        else:
+            publish_progress(
+                checkpoint.search_query_id, PAGE_FAILED,
+                page=checkpoint.page, error=checkpoint.error,
+            )
+
+
+def record_failed_pages(search_query_id: int, pages: list[int], error: str | None):
+    """Отметка страниц, не загруженных после всех повторов запроса"""
+    save_page_checkpoints([
+        ParsePageModel(
+            search_query_id=search_query_id,
+            page=page,
+            status=ParsePageModel.Status.FAILED,
+            error=error or "",
+        )
+        for page in pages
+    ])
+
+
+def load_done_pages(search_query_id: int) -> dict[int, ParsePageModel]:
+    """
+    Страницы, уже загруженные и сохраненные (для возобновления парсинга)
+
+    Returns:
+        dict[int, ParsePageModel]: Контрольные точки по номерам страниц
+    """
+    return {
+        checkpoint.page: checkpoint
+        for checkpoint in ParsePageModel.objects.filter(
+            search_query_id=search_query_id, status=ParsePageModel.Status.DONE
+        )
+    }
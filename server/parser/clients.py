@@ -0,0 +1,72 @@
+import atexit
+import importlib.util
+import threading
+
+import httpx
+
+from .conf import parser_settings
+
+
+_client: httpx.Client | None = None
+_client_lock = threading.Lock()
+
+
+def _http2_available() -> bool:
+    """Проверка наличия пакета h2, необходимого httpx для HTTP/2"""
+    return importlib.util.find_spec("h2") is not None
+
+
+def _build_client_options() -> dict:
+    """Параметры пула соединений и таймаутов из настроек парсера"""
+    return {
+        "timeout": httpx.Timeout(
+            parser_settings("HTTP_TIMEOUT"),
+            connect=parser_settings("HTTP_CONNECT_TIMEOUT"),
+        ),
+        "limits": httpx.Limits(
+            max_connections=parser_settings("HTTP_MAX_CONNECTIONS"),
+            max_keepalive_connections=parser_settings("HTTP_MAX_KEEPALIVE_CONNECTIONS"),
+            keepalive_expiry=parser_settings("HTTP_KEEPALIVE_EXPIRY"),
+        ),
+        "http2": parser_settings("HTTP2") and _http2_available(),
+    }
+
+
+def get_http_client() -> httpx.Client:
+    """
+    Получение общего для процесса HTTP-клиента
+
+    Клиент создается лениво при первом обращении и переиспользует
+    соединения (keep-alive) между запросами из любых потоков.
+
+    Returns:
+        httpx.Client: Общий клиент с пулом соединений
+    """
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = httpx.Client(**_build_client_options())
+    return _client
+
+
+def create_async_http_client() -> httpx.AsyncClient:
+    """
+    Создание асинхронного HTTP-клиента с теми же лимитами пула
+
+    Асинхронный клиент привязан к циклу событий, в котором используется,
+    поэтому им владеет асинхронный движок парсинга, а не модуль.
+    """
+    return httpx.AsyncClient(**_build_client_options())
+
+
+def close_http_client():
+    """Закрытие общего HTTP-клиента и всех соединений пула"""
+    global _client
+    with _client_lock:
+        if _client is not None:
+            _client.close()
+            _client = None
+
+
+atexit.register(close_http_client)
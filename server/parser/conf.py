@@ -0,0 +1,127 @@
+from django.conf import settings
+
+
+# Значения по умолчанию для настроек парсера.
+# Переопределяются словарем MARKETPLACE_PARSER в settings.py
+DEFAULTS = {
+    # Адрес поискового API маркетплейса
+    "SEARCH_URL": "https://search.wb.ru/exactmatch/ru/common/v13/search",
+    # Таймауты HTTP-клиента (в секундах)
+    "HTTP_TIMEOUT": 10.0,
+    "HTTP_CONNECT_TIMEOUT": 5.0,
+    # Лимиты пула соединений
+    "HTTP_MAX_CONNECTIONS": 100,
+    "HTTP_MAX_KEEPALIVE_CONNECTIONS": 20,
+    "HTTP_KEEPALIVE_EXPIRY": 30.0,
+    # HTTP/2 включается только при установленном пакете h2
+    "HTTP2": True,
+    # Общий для всех парсингов процесса лимит запросов к маркетплейсу
+    # (запросов в секунду): начальное значение, границы, запас токенов
+    # и прирост за секунду без ответов 429/503 (AIMD)
+    "RATE_LIMIT": 20.0,
+    "RATE_LIMIT_MIN": 1.0,
+    "RATE_LIMIT_MAX": 100.0,
+    "RATE_LIMIT_BURST": 20,
+    "RATE_LIMIT_INCREASE": 1.0,
+    # Повторы запросов при 429/5xx и сетевых ошибках: количество повторов,
+    # базовая и максимальная задержка (сек.) экспоненциального ожидания
+    "HTTP_MAX_RETRIES": 4,
+    "HTTP_RETRY_BACKOFF": 0.5,
+    "HTTP_RETRY_MAX_BACKOFF": 30.0,
+    # Движок парсинга:
+    # - "threads": конвейер ParsePipeline (потоки загрузки, преобразования
+    #   и записи); парсинги веб-процесса идут в общем пуле ParseThreadPool
+    #   (INLINE_CONCURRENCY), в воркере очереди - в его пуле (WORKER_CONCURRENCY)
+    # - "asyncio": общий цикл событий AsyncParsingEngine с лимитом
+    #   ASYNC_CONCURRENCY; обновление (refresh) всегда выполняет "threads"
+    "ENGINE": "threads",
+    # Максимум одновременных запросов страниц во всех поисках asyncio-движка
+    "ASYNC_CONCURRENCY": 20,
+    # Конвейер парсинга: потоки загрузки страниц, емкость очередей между
+    # стадиями (страниц) и минимальный пакет единственного писателя (строк)
+    "PIPELINE_FETCHERS": 8,
+    "PIPELINE_QUEUE_SIZE": 4,
+    "PIPELINE_WRITE_BATCH_SIZE": 500,
+    # Адаптивный лимит одновременных загрузок: от PIPELINE_MIN_FETCHERS
+    # до PIPELINE_FETCHERS, снижается, когда сглаженная задержка ответа
+    # превышает минимальную более чем в PIPELINE_LATENCY_TOLERANCE раз
+    "PIPELINE_MIN_FETCHERS": 1,
+    "PIPELINE_LATENCY_TOLERANCE": 2.0,
+    # Предел страниц глубокого обхода (deep_crawl), если у запроса не задан
+    # свой max_pages; None - до конца выдачи
+    "DEEP_CRAWL_MAX_PAGES": None,
+    # Запись результатов: "coalescing" (общий писатель процесса объединяет
+    # пакеты всех парсингов в крупные транзакции), "direct" (каждый парсинг
+    # пишет сам) или "auto" (общий писатель только для SQLite)
+    "DB_WRITER": "auto",
+    # Порог записи общего писателя по строкам и по времени (сек.)
+    "DB_WRITER_FLUSH_ROWS": 5000,
+    "DB_WRITER_FLUSH_INTERVAL": 0.05,
+    # Емкость очереди пакетов общего писателя
+    "DB_WRITER_QUEUE_SIZE": 64,
+    # Способ записи строк: "auto" (COPY для PostgreSQL, иначе bulk_create),
+    # "copy" или "bulk_create"
+    "INGEST_BACKEND": "auto",
+    # Декодер ответа поиска: "auto" (json), "ijson" (потоковый, меньше памяти),
+    # "orjson" (меньше CPU) или "json"
+    "JSON_BACKEND": "auto",
+    # Алиас кэша страниц результатов из CACHES и время жизни записей (сек.)
+    "RESULTS_CACHE_ALIAS": "default",
+    "RESULTS_CACHE_TIMEOUT": 3600,
+    # Кэш первых страниц выдачи, общий для проверки запроса и парсинга:
+    # отдельный алиас из CACHES (общий для веб-процессов и воркера очереди
+    # backend, размер - MAX_ENTRIES алиаса) и время жизни (сек.); 0 - без кэша
+    "FIRST_PAGE_CACHE_ALIAS": "first_page",
+    "FIRST_PAGE_CACHE_TTL": 60.0,
+    # Где выполняется парсинг: "inline" (фоном в веб-процессе)
+    # или "queue" (задания в БД, выполняет manage.py parse_worker)
+    "JOB_BACKEND": "inline",
+    # Брокер событий хода парсинга (SSE): класс с интерфейсом
+    # InMemoryEventBroker, емкость очереди событий слушателя
+    # и интервал keep-alive потока событий (сек.)
+    "EVENTS_BACKEND": "parser.events.InMemoryEventBroker",
+    "EVENTS_QUEUE_SIZE": 100,
+    "EVENTS_KEEPALIVE": 15.0,
+    # Интервал проверки хода парсинга по БД, если брокер молчит (сек.):
+    # события парсинга в воркере очереди брокер веб-процесса не получает
+    "EVENTS_POLL_INTERVAL": 1.0,
+    # Одновременных потоков событий в процессе: каждый занимает поток
+    # веб-сервера на все время парсинга
+    "EVENTS_MAX_STREAMS": 4,
+    # Количество одновременных парсингов в веб-процессе (JOB_BACKEND="inline",
+    # ENGINE="threads"); остальные ждут в очереди пула
+    "INLINE_CONCURRENCY": 4,
+    # Максимальное количество запросов в одном POST /api/search/bulk/
+    "BULK_MAX_QUERIES": 500,
+    # Количество одновременно выполняемых воркером заданий
+    "WORKER_CONCURRENCY": 4,
+    # Интервал опроса очереди воркером (сек.)
+    "WORKER_POLL_INTERVAL": 1.0,
+    # Общий каталог метрик процессов (веб-воркеры gunicorn и воркер очереди):
+    # каждый процесс раз в METRICS_FLUSH_INTERVAL сек. записывает в него снимок
+    # своих значений, /metrics суммирует снимки. None - метрики только процесса
+    "METRICS_DIR": None,
+    "METRICS_FLUSH_INTERVAL": 1.0,
+    # Время аренды задания, после которого оно считается зависшим (сек.)
+    "JOB_LEASE_SECONDS": 300,
+    # Максимальное количество попыток выполнения задания
+    "JOB_MAX_ATTEMPTS": 3,
+    # Базовая задержка перед повтором задания (сек.), растет экспоненциально
+    "JOB_RETRY_DELAY": 30,
+}
+
+
+def parser_settings(name: str):
+    """
+    Получение значения настройки парсера
+
+    Args:
+        name: Имя настройки
+
+    Returns:
+        Значение из MARKETPLACE_PARSER или значение по умолчанию
+    """
+    user_settings = getattr(settings, "MARKETPLACE_PARSER", {})
+    if name in user_settings:
+        return user_settings[name]
+    return DEFAULTS[name]
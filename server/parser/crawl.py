@@ -0,0 +1,154 @@
+import threading
+import time
+from contextlib import contextmanager
+
+
+def page_fingerprint(products: list[dict]) -> int:
+    """
+    Отпечаток набора id товаров страницы
+
+    Хэш целых чисел в Python не зависит от запуска процесса, поэтому
+    отпечаток сохраняется в контрольных точках и сравнивается после рестарта.
+    """
+    return hash(frozenset(item.get("id") for item in products))
+
+
+class CrawlProgress:
+    """
+    Определение конца выдачи при обходе страниц поиска
+
+    Выдача считается законченной на пустой странице или на странице,
+    повторяющей уже полученную (API отдает последнюю страницу повторно
+    за пределами доступной глубины). Для повторов хранится только отпечаток
+    набора id каждой страницы, поэтому память не зависит от числа товаров.
+    Страницы загружаются не по порядку, поэтому из двух одинаковых
+    страниц повтором считается страница с большим номером.
+    """
+
+    def __init__(self, last_page: int):
+        """
+        Args:
+            last_page: Последняя страница по количеству результатов
+        """
+        self.last_page = last_page
+        self.stop_reason = None
+        self._fingerprints: dict[int, int] = {}
+        self._lock = threading.Lock()
+
+    def should_fetch(self, page: int) -> bool:
+        """Нужно ли загружать страницу"""
+        return page <= self.last_page
+
+    def register(self, page: int, products: list[dict]) -> bool:
+        """
+        Учет загруженной страницы
+
+        Args:
+            page: Номер страницы
+            products: Товары страницы (пустой список - конец выдачи)
+
+        Returns:
+            bool: Нужно ли сохранять товары страницы
+        """
+        with self._lock:
+            if page > self.last_page:
+                return False
+            if not products:
+                self._stop(page - 1, "empty_page")
+                return False
+            return self._register_fingerprint(page, page_fingerprint(products))
+
+    def restore(self, page: int, fingerprint: int | None):
+        """Учет страницы, сохраненной до рестарта (по контрольной точке)"""
+        if fingerprint is None:
+            return
+        with self._lock:
+            self._register_fingerprint(page, fingerprint)
+
+    def _register_fingerprint(self, page: int, fingerprint: int) -> bool:
+        original = self._fingerprints.get(fingerprint)
+        if original is None or original == page:
+            self._fingerprints[fingerprint] = page
+            return True
+
+        # Повтором считается страница с большим номером
+        repeated = max(original, page)
+        self._fingerprints[fingerprint] = min(original, page)
+        self._stop(repeated - 1, "duplicate_page")
+        return page != repeated
+
+    def _stop(self, last_page: int, reason: str):
+        if last_page < self.last_page:
+            self.last_page = last_page
+            self.stop_reason = reason
+
+
+class AdaptiveConcurrencyLimiter:
+    """
+    Ограничение числа одновременных запросов по наблюдаемой задержке
+
+    Базовая задержка - минимальная замеченная (медленно забывается).
+    Пока сглаженная задержка не превышает базовую более чем в tolerance
+    раз, лимит растет на 1 после каждого ответа. Когда сервер начинает
+    отвечать медленнее (очередь на его стороне), лимит уменьшается на
+    четверть, но не чаще одного раза за limit ответов.
+    """
+
+    # Доля нового замера в сглаженной задержке
+    SMOOTHING = 0.3
+    # Рост базовой задержки за ответ, чтобы она следовала за сервером
+    BASELINE_DRIFT = 1.01
+
+    def __init__(self, min_limit: int, max_limit: int, tolerance: float = 2.0,
+                 initial_limit: int | None = None):
+        """
+        Args:
+            min_limit: Минимальный лимит
+            max_limit: Максимальный лимит
+            tolerance: Допустимое отношение сглаженной задержки к базовой
+            initial_limit: Начальный лимит (по умолчанию - середина диапазона)
+        """
+        self.min_limit = max(1, min_limit)
+        self.max_limit = max(self.min_limit, max_limit)
+        self.tolerance = tolerance
+        self.limit = initial_limit or max(self.min_limit, (self.min_limit + self.max_limit) // 2)
+        self.peak_limit = self.limit
+        self._in_flight = 0
+        self._baseline = None
+        self._smoothed = None
+        self._since_decrease = 0
+        self._condition = threading.Condition()
+
+    @contextmanager
+    def slot(self):
+        """Ожидание свободного места и замер задержки запроса"""
+        with self._condition:
+            while self._in_flight >= self.limit:
+                self._condition.wait()
+            self._in_flight += 1
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._release(time.perf_counter() - started)
+
+    def _release(self, latency: float):
+        with self._condition:
+            self._in_flight -= 1
+            self._update(latency)
+            self._condition.notify_all()
+
+    def _update(self, latency: float):
+        if self._baseline is None:
+            self._baseline = self._smoothed = latency
+        else:
+            self._baseline = min(latency, self._baseline * self.BASELINE_DRIFT)
+            self._smoothed += self.SMOOTHING * (latency - self._smoothed)
+
+        self._since_decrease += 1
+        if self._smoothed <= self._baseline * self.tolerance:
+            self.limit = min(self.max_limit, self.limit + 1)
+        elif self._since_decrease >= self.limit:
+            self.limit = max(self.min_limit, self.limit * 3 // 4)
+            self._since_decrease = 0
+        self.peak_limit = max(self.peak_limit, self.limit)
@@ -0,0 +1,238 @@
+import atexit
+import concurrent.futures
+import queue
+import threading
+import time
+from typing import Callable
+
+from django.db import connection, transaction
+
+from .conf import parser_settings
+from .ingest import insert_products
+from .models import ProductResultModel
+
+# Маркер остановки потока записи
+_STOP = object()
+
+
+class CoalescingWriter:
+    """
+    Общий писатель результатов процесса (write-behind)
+
+    Пакеты товаров от любого количества одновременных парсингов ставятся
+    в очередь и записываются одним потоком: накопленные пакеты
+    объединяются в одну транзакцию, которая фиксируется при достижении
+    порога по числу строк или по времени ожидания первого пакета.
+    Вместо десятков мелких транзакций, конкурирующих за блокировку
+    записи SQLite, выполняется несколько крупных.
+
+    Если общая транзакция не удалась, пакеты повторяются по отдельности:
+    ошибка одного парсинга (например, удаленный поисковый запрос)
+    не теряет строки остальных.
+    """
+
+    # Время простоя, после которого поток записи завершается (сек.)
+    IDLE_TIMEOUT = 5.0
+
+    def __init__(self, flush_rows: int | None = None, flush_interval: float | None = None,
+                 queue_size: int | None = None, batch_size: int = 100):
+        """
+        Args:
+            flush_rows: Порог записи по количеству накопленных строк
+            flush_interval: Максимальное ожидание первого пакета в буфере (сек.)
+            queue_size: Емкость очереди пакетов; заполненная очередь блокирует отправителей
+            batch_size: Размер пакета INSERT для bulk_create
+        """
+        self.flush_rows = flush_rows or parser_settings("DB_WRITER_FLUSH_ROWS")
+        self.flush_interval = flush_interval or parser_settings("DB_WRITER_FLUSH_INTERVAL")
+        self.batch_size = batch_size
+        self._queue = queue.Queue(maxsize=queue_size or parser_settings("DB_WRITER_QUEUE_SIZE"))
+        self._lock = threading.Lock()
+        # Отдельная блокировка запуска/остановки потока: submit держит ее
+        # во время put, а поток берет ее, только когда очередь пуста
+        self._thread_lock = threading.Lock()
+        self._thread = None
+        self._stats = {"submissions": 0, "rows": 0, "flushes": 0, "fallback_flushes": 0,
+                       "flush_seconds": 0.0}
+
+    @property
+    def stats(self) -> dict:
+        """Счетчики писателя: пакеты, строки, транзакции и время записи"""
+        with self._lock:
+            return dict(self._stats)
+
+    def submit(self, instances: list[ProductResultModel],
+               after_insert: Callable[[], None] | None = None) -> concurrent.futures.Future:
+        """
+        Постановка пакета в очередь записи
+
+        Args:
+            instances: Несохраненные объекты ProductResultModel
+            after_insert: Функция, выполняемая в той же транзакции после
+                записи пакета (например, сохранение контрольных точек страниц)
+
+        Returns:
+            concurrent.futures.Future: Результат - количество записанных объектов
+        """
+        future = concurrent.futures.Future()
+        with self._thread_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, daemon=True)
+                self._thread.start()
+            self._queue.put((instances, future, after_insert))
+        return future
+
+    def write(self, instances: list[ProductResultModel],
+              after_insert: Callable[[], None] | None = None) -> int:
+        """Запись пакета с ожиданием результата"""
+        return self.submit(instances, after_insert).result()
+
+    def close(self):
+        """Запись накопленных пакетов и остановка потока"""
+        with self._thread_lock:
+            thread = self._thread
+            if thread is not None:
+                self._queue.put(_STOP)
+        if thread is not None:
+            thread.join()
+
+    def _run(self):
+        try:
+            stopping = False
+            while not stopping:
+                try:
+                    item = self._queue.get(timeout=self.IDLE_TIMEOUT)
+                except queue.Empty:
+                    # Простаивающий поток завершается и закрывает соединение
+                    with self._thread_lock:
+                        if self._queue.empty():
+                            self._thread = None
+                            break
+                    continue
+                if item is _STOP:
+                    break
+
+                pending = [item]
+                rows = len(item[0])
+                deadline = time.monotonic() + self.flush_interval
+                # Дополняем буфер, пока не достигнут порог по строкам или времени
+                while rows < self.flush_rows:
+                    timeout = deadline - time.monotonic()
+                    if timeout <= 0:
+                        break
+                    try:
+                        item = self._queue.get(timeout=timeout)
+                    except queue.Empty:
+                        break
+                    if item is _STOP:
+                        stopping = True
+                        break
+                    pending.append(item)
+                    rows += len(item[0])
+
+                try:
+                    self._flush(pending)
+                except Exception as e:
+                    # Отправители не должны ждать результат бесконечно
+                    for _, future, _ in pending:
+                        if not future.done():
+                            future.set_exception(e)
+        finally:
+            with self._thread_lock:
+                if self._thread is threading.current_thread():
+                    self._thread = None
+                    # Пакеты, поставленные после маркера остановки, не теряются
+                    if not self._queue.empty():
+                        self._thread = threading.Thread(target=self._run, daemon=True)
+                        self._thread.start()
+            # Соединение потока писателя не должно переживать сам поток
+            connection.close()
+
+    def _flush(self, pending: list[tuple[list, concurrent.futures.Future, Callable | None]]):
+        """Запись накопленных пакетов одной транзакцией"""
+        started = time.perf_counter()
+        try:
+            with transaction.atomic():
+                counts = [self._insert(instances, after_insert) for instances, _, after_insert in pending]
+        except Exception:
+            counts = None
+
+        if counts is not None:
+            for (_, future, _), count in zip(pending, counts):
+                future.set_result(count)
+            self._record(pending, started, fallback=False)
+            return
+
+        # Общая транзакция откатилась: повторяем пакеты по отдельности
+        for instances, future, after_insert in pending:
+            try:
+                with transaction.atomic():
+                    count = self._insert(instances, after_insert)
+            except Exception as e:
+                future.set_exception(e)
+            else:
+                future.set_result(count)
+        self._record(pending, started, fallback=True)
+
+    def _insert(self, instances: list[ProductResultModel], after_insert: Callable | None) -> int:
+        count = insert_products(instances, batch_size=self.batch_size) if instances else 0
+        if after_insert is not None:
+            after_insert()
+        return count
+
+    def _record(self, pending: list, started: float, fallback: bool):
+        with self._lock:
+            self._stats["submissions"] += len(pending)
+            self._stats["rows"] += sum(len(instances) for instances, _, _ in pending)
+            self._stats["flushes"] += 1
+            self._stats["fallback_flushes"] += int(fallback)
+            self._stats["flush_seconds"] += time.perf_counter() - started
+
+
+_writer = None
+_writer_lock = threading.Lock()
+
+
+def is_db_writer_enabled() -> bool:
+    """
+    Включен ли общий писатель (настройка DB_WRITER)
+
+    "auto" включает его только для SQLite, где запись из нескольких
+    потоков упирается в единственную блокировку записи БД.
+    """
+    mode = parser_settings("DB_WRITER")
+    if mode == "auto":
+        return connection.vendor == "sqlite"
+    return mode == "coalescing"
+
+
+def get_db_writer() -> CoalescingWriter | None:
+    """
+    Общий писатель процесса
+
+    Returns:
+        CoalescingWriter | None: None, если запись идет напрямую из парсинга
+    """
+    global _writer
+    if not is_db_writer_enabled():
+        return None
+    if _writer is None:
+        with _writer_lock:
+            if _writer is None:
+                # Импорт внутри функции: сервис сам зависит от этого модуля
+                from .services import MarketplaceParserService
+
+                _writer = CoalescingWriter(batch_size=MarketplaceParserService.BATCH_SIZE)
+    return _writer
+
+
+def close_db_writer():
+    """Запись накопленных пакетов и остановка общего писателя"""
+    global _writer
+    with _writer_lock:
+        writer, _writer = _writer, None
+    if writer is not None:
+        writer.close()
+
+
+atexit.register(close_db_writer)
@@ -0,0 +1,132 @@
+import importlib.util
+import io
+import json
+
+from .conf import parser_settings
+
+
+# Размер буфера при чтении начала ответа (до списка товаров), байт
+HEAD_BUFFER_SIZE = 4096
+
+# Поля товара, которые использует парсер (кроме цены из sizes)
+PRODUCT_FIELDS = (
+    "id",
+    "name",
+    "brand",
+    "supplier",
+    "supplierRating",
+    "reviewRating",
+    "feedbacks",
+)
+
+
+def _module_available(name: str) -> bool:
+    return importlib.util.find_spec(name) is not None
+
+
+def slim_product(item: dict) -> dict:
+    """
+    Сокращение товара до используемых полей
+
+    Структура цены (sizes[0].price.product) сохраняется, чтобы
+    результат обрабатывался так же, как полный товар.
+    """
+    product = {field: item[field] for field in PRODUCT_FIELDS if field in item}
+    sizes = item.get("sizes")
+    if sizes:
+        price = sizes[0].get("price", {})
+        product["sizes"] = [{"price": {"product": price["product"]}} if "product" in price else {}]
+    return product
+
+
+def _decode_full(data) -> dict:
+    """Сокращение полностью разобранного ответа"""
+    data_section = data.get("data", {})
+    page = {"data": {"products": [slim_product(item) for item in data_section.get("products", [])]}}
+    if "total" in data_section:
+        page["data"]["total"] = data_section["total"]
+    return page
+
+
+def _decode_json(content: bytes) -> dict:
+    # Стандартный json оставляет товары целиком: сокращение
+    # не окупается по CPU без быстрого декодера
+    return json.loads(content)
+
+
+def _decode_orjson(content: bytes) -> dict:
+    import orjson
+
+    return _decode_full(orjson.loads(content))
+
+
+def _decode_ijson(content: bytes) -> dict:
+    """
+    Потоковый разбор ответа: товары собираются по одному и сразу
+    сокращаются, поэтому полное дерево документа в памяти не строится
+    """
+    import ijson
+
+    # total в ответе поиска идет перед списком товаров: он читается из начала
+    # документа, и разбор останавливается на списке товаров
+    total = None
+    products_started = False
+    for prefix, event, value in ijson.parse(io.BytesIO(content), buf_size=HEAD_BUFFER_SIZE):
+        if prefix == "data.total":
+            total = value
+        elif prefix == "data.products" and event == "start_array":
+            products_started = True
+            break
+
+    products = [
+        slim_product(item)
+        for item in ijson.items(content, "data.products.item", use_float=True)
+    ]
+    page = {"data": {"products": products}}
+    if total is None and products_started:
+        # total после списка товаров: он ищется во всем документе
+        total = next(ijson.items(content, "data.total"), None)
+    if total is not None:
+        page["data"]["total"] = total
+    return page
+
+
+DECODERS = {
+    "json": _decode_json,
+    "orjson": _decode_orjson,
+    "ijson": _decode_ijson,
+}
+
+
+def available_json_backends() -> list[str]:
+    """Декодеры, доступные в текущем окружении"""
+    return [name for name in DECODERS if name == "json" or _module_available(name)]
+
+
+def resolve_json_backend(name: str | None = None) -> str:
+    """
+    Выбор декодера ответа поиска
+
+    "auto" выбирает стандартный json: ни один из быстрых декодеров
+    не выигрывает одновременно по CPU и по памяти (см. bench_decoding).
+    orjson тратит меньше CPU, но его пиковая память примерно втрое выше,
+    ijson в разы снижает пиковую память, но тратит больше CPU.
+    """
+    name = name or parser_settings("JSON_BACKEND")
+    if name == "auto":
+        return "json"
+    return name
+
+
+def decode_search_page(content: bytes, backend: str | None = None) -> dict:
+    """
+    Разбор страницы поиска с извлечением только используемых полей товаров
+
+    Args:
+        content: Тело ответа поискового API
+        backend: Декодер ("auto", "ijson", "orjson", "json"), по умолчанию JSON_BACKEND
+
+    Returns:
+        dict: {"data": {"total": ..., "products": [...]}} в формате ответа маркетплейса
+    """
+    return DECODERS[resolve_json_backend(backend)](content)
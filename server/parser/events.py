@@ -0,0 +1,355 @@
+import json
+import queue
+import threading
+
+from django.utils.module_loading import import_string
+
+from .conf import parser_settings
+from .models import ParseJobModel, ParsePageModel, SearchQueryModel
+
+# Типы событий хода парсинга
+PROGRESS = "progress"
+PAGE = "page"
+PAGE_FAILED = "page_failed"
+COMPLETED = "completed"
+ERROR = "error"
+
+# Задержка переподключения EventSource после обрыва (мс)
+SSE_RETRY_MS = 3000
+
+
+class Subscription:
+    """Подписка слушателя на события темы"""
+
+    def __init__(self, broker: "InMemoryEventBroker", topic: str, queue_size: int):
+        self.broker = broker
+        self.topic = topic
+        self._queue = queue.Queue(maxsize=queue_size)
+
+    def put(self, event: dict):
+        """
+        Доставка события без ожидания
+
+        Отстающий слушатель теряет самые старые события, а не блокирует
+        публикацию: последнее событие (например, завершение) всегда доходит.
+        """
+        while True:
+            try:
+                self._queue.put_nowait(event)
+                return
+            except queue.Full:
+                try:
+                    self._queue.get_nowait()
+                except queue.Empty:
+                    pass
+
+    def get(self, timeout: float | None = None) -> dict | None:
+        """Следующее событие или None, если за timeout событий не было"""
+        try:
+            return self._queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def close(self):
+        self.broker.unsubscribe(self)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class InMemoryEventBroker:
+    """
+    Pub/sub событий внутри процесса
+
+    Публикация раскладывает событие по очередям подписчиков темы и не
+    обращается ни к БД, ни к сети, поэтому один парсинг обслуживает любое
+    количество слушателей. События видны только в процессе, где идет
+    парсинг: о парсинге в воркере очереди (JOB_BACKEND="queue") поток
+    событий узнает из БД (см. poll_progress), а backend с тем же
+    интерфейсом поверх внешнего брокера (настройка EVENTS_BACKEND)
+    только сокращает задержку.
+    """
+
+    def __init__(self, queue_size: int | None = None):
+        self.queue_size = queue_size or parser_settings("EVENTS_QUEUE_SIZE")
+        self._subscriptions: dict[str, set[Subscription]] = {}
+        self._lock = threading.Lock()
+
+    def publish(self, topic: str, event: dict) -> int:
+        """
+        Публикация события
+
+        Returns:
+            int: Количество подписчиков, получивших событие
+        """
+        with self._lock:
+            subscriptions = list(self._subscriptions.get(topic, ()))
+        for subscription in subscriptions:
+            subscription.put(event)
+        return len(subscriptions)
+
+    def subscribe(self, topic: str) -> Subscription:
+        """Подписка на события темы (закрывается Subscription.close)"""
+        subscription = Subscription(self, topic, self.queue_size)
+        with self._lock:
+            self._subscriptions.setdefault(topic, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        with self._lock:
+            subscriptions = self._subscriptions.get(subscription.topic)
+            if subscriptions is not None:
+                subscriptions.discard(subscription)
+                if not subscriptions:
+                    del self._subscriptions[subscription.topic]
+
+    def subscribers_count(self, topic: str) -> int:
+        with self._lock:
+            return len(self._subscriptions.get(topic, ()))
+
+
+_broker = None
+_broker_lock = threading.Lock()
+
+
+def get_event_broker():
+    """Общий для процесса брокер событий (класс из настройки EVENTS_BACKEND)"""
+    global _broker
+    if _broker is None:
+        with _broker_lock:
+            if _broker is None:
+                _broker = import_string(parser_settings("EVENTS_BACKEND"))()
+    return _broker
+
+
+def reset_event_broker():
+    """Сброс брокера (например, после изменения настроек в тестах)"""
+    global _broker
+    with _broker_lock:
+        _broker = None
+
+
+def search_topic(search_query_id: int) -> str:
+    """Тема событий поискового запроса"""
+    return f"search:{search_query_id}"
+
+
+def publish_progress(search_query_id: int, event_type: str, **data) -> int:
+    """
+    Публикация события хода парсинга поискового запроса
+
+    Args:
+        search_query_id: ID поискового запроса
+        event_type: PAGE, PAGE_FAILED, COMPLETED или ERROR
+        **data: Данные события
+
+    Returns:
+        int: Количество подписчиков, получивших событие
+    """
+    event = {"type": event_type, "search_query_id": search_query_id, **data}
+    return get_event_broker().publish(search_topic(search_query_id), event)
+
+
+def format_sse(event_type: str, data: dict) -> str:
+    """Событие в формате text/event-stream"""
+    return f"event: {event_type}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+def get_progress_snapshot(search_query_id: int) -> tuple[dict, dict[int, str]] | None:
+    """
+    Текущее состояние парсинга из БД
+
+    Returns:
+        tuple[dict, dict[int, str]] | None: Состояние и статусы сохраненных
+        страниц {номер: статус} или None, если запрос удален
+    """
+    search_query = SearchQueryModel.objects.filter(id=search_query_id).first()
+    if search_query is None:
+        return None
+    statuses = dict(search_query.pages.values_list("page", "status"))
+    pages_done = sum(status == ParsePageModel.Status.DONE for status in statuses.values())
+    snapshot = {
+        "type": PROGRESS,
+        "search_query_id": search_query_id,
+        "is_completed": search_query.is_completed,
+        "total_results": search_query.total_results,
+        "pages_done": pages_done,
+        "pages_failed": len(statuses) - pages_done,
+        "products_total": (
+            search_query.total_results if search_query.is_completed
+            else search_query.results.active().count()
+        ),
+    }
+    return snapshot, statuses
+
+
+def _completed_event(search_query_id: int, total_results: int) -> dict:
+    return {"type": COMPLETED, "search_query_id": search_query_id, "total_results": total_results}
+
+
+def poll_progress(search_query_id: int, seen: dict[int, str]) -> list[dict] | None:
+    """
+    События хода парсинга по состоянию в БД
+
+    Парсинг в другом процессе (воркер очереди, JOB_BACKEND="queue")
+    публикует события в своем брокере, и слушатель их не получает:
+    записанные страницы видны по контрольным точкам (ParsePageModel),
+    завершение - по запросу, окончательная ошибка - по заданию очереди.
+
+    Args:
+        search_query_id: ID поискового запроса
+        seen: Уже отправленные статусы страниц {номер: статус}
+
+    Returns:
+        list[dict] | None: События страниц, статус которых изменился,
+        и событие завершения или ошибки; None, если запрос удален
+    """
+    query = SearchQueryModel.objects.filter(id=search_query_id).values(
+        "is_completed", "total_results"
+    ).first()
+    if query is None:
+        return None
+
+    events = []
+    pages = ParsePageModel.objects.filter(search_query_id=search_query_id).values_list(
+        "page", "status", "products_count", "error"
+    )
+    for page, status, products_count, error in pages:
+        if seen.get(page) == status:
+            continue
+        if status == ParsePageModel.Status.DONE:
+            events.append({"type": PAGE, "search_query_id": search_query_id,
+                           "page": page, "products": products_count})
+        else:
+            events.append({"type": PAGE_FAILED, "search_query_id": search_query_id,
+                           "page": page, "error": error})
+
+    if query["is_completed"]:
+        events.append(_completed_event(search_query_id, query["total_results"]))
+        return events
+
+    last_job = ParseJobModel.objects.filter(search_query_id=search_query_id).order_by("-id").values(
+        "status", "last_error"
+    ).first()
+    if last_job is not None and last_job["status"] == ParseJobModel.Status.FAILED:
+        events.append({"type": ERROR, "search_query_id": search_query_id, "error": last_job["last_error"]})
+    return events
+
+
+def iter_progress_stream(search_query_id: int, keepalive: float | None = None,
+                         poll_interval: float | None = None):
+    """
+    Поток событий хода парсинга для SSE
+
+    Подписка оформляется до чтения состояния из БД, поэтому события между
+    ними не теряются, а страницы, уже учтенные в состоянии, не считаются
+    повторно. К событиям page добавляются накопленные количества записанных
+    страниц и товаров. Если брокер молчит poll_interval секунд, состояние
+    проверяется по БД (poll_progress): так поток работает и при парсинге
+    в процессе воркера очереди. Без событий поток каждые keepalive секунд
+    отправляет комментарий, чтобы соединение не закрыл прокси.
+
+    Yields:
+        str: Фрагменты text/event-stream
+    """
+    keepalive = keepalive or parser_settings("EVENTS_KEEPALIVE")
+    poll_interval = min(poll_interval or parser_settings("EVENTS_POLL_INTERVAL"), keepalive)
+    with get_event_broker().subscribe(search_topic(search_query_id)) as subscription:
+        state = get_progress_snapshot(search_query_id)
+        if state is None:
+            return
+        snapshot, seen = state
+        yield f"retry: {SSE_RETRY_MS}\n\n" + format_sse(PROGRESS, snapshot)
+        if snapshot["is_completed"]:
+            yield format_sse(COMPLETED, _completed_event(search_query_id, snapshot["total_results"]))
+            return
+
+        pages_done = snapshot["pages_done"]
+        products_total = snapshot["products_total"]
+        idle = 0.0
+        while True:
+            event = subscription.get(timeout=poll_interval)
+            if event is not None:
+                events = [event]
+            else:
+                events = poll_progress(search_query_id, seen)
+                if events is None:
+                    return
+            if not events:
+                idle += poll_interval
+                if idle >= keepalive:
+                    idle = 0.0
+                    yield ": keepalive\n\n"
+                continue
+
+            idle = 0.0
+            for event in events:
+                if event["type"] == PAGE:
+                    if seen.get(event["page"]) == ParsePageModel.Status.DONE:
+                        continue
+                    seen[event["page"]] = ParsePageModel.Status.DONE
+                    pages_done += 1
+                    products_total += event["products"]
+                    event = {**event, "pages_done": pages_done, "products_total": products_total}
+                elif event["type"] == PAGE_FAILED:
+                    seen[event["page"]] = ParsePageModel.Status.FAILED
+                yield format_sse(event["type"], event)
+                if event["type"] in (COMPLETED, ERROR):
+                    return
+
+
+_active_streams = 0
+_streams_lock = threading.Lock()
+
+
+class ProgressStream:
+    """
+    Поток событий, занимающий место в лимите EVENTS_MAX_STREAMS до закрытия
+
+    Ответ SSE держит поток веб-сервера все время парсинга, поэтому
+    количество одновременных потоков в процессе ограничено: остальные
+    запросы API не должны ждать свободного потока. Место освобождается
+    при закрытии ответа (Django вызывает close и для неначатого потока).
+    """
+
+    def __init__(self, search_query_id: int, keepalive: float | None = None):
+        self._events = iter_progress_stream(search_query_id, keepalive)
+        self._closed = False
+
+    def __iter__(self):
+        return self
+
+    def __next__(self) -> str:
+        return next(self._events)
+
+    def close(self):
+        global _active_streams
+        if self._closed:
+            return
+        self._closed = True
+        self._events.close()
+        with _streams_lock:
+            _active_streams -= 1
+
+
+def open_progress_stream(search_query_id: int, keepalive: float | None = None) -> ProgressStream | None:
+    """
+    Поток событий хода парсинга в пределах лимита процесса
+
+    Returns:
+        ProgressStream | None: Поток или None, если открыто EVENTS_MAX_STREAMS потоков
+    """
+    global _active_streams
+    with _streams_lock:
+        if _active_streams >= parser_settings("EVENTS_MAX_STREAMS"):
+            return None
+        _active_streams += 1
+    return ProgressStream(search_query_id, keepalive)
+
+
+def active_streams_count() -> int:
+    with _streams_lock:
+        return _active_streams
@@ -0,0 +1,86 @@
+import csv
+import json
+
+from rest_framework.negotiation import BaseContentNegotiation
+
+from .serializers import PRODUCT_RESULT_COLUMNS, PRODUCT_RESULT_FIELDS, serialize_product_row
+
+# Формат выгрузки -> Content-Type ответа
+EXPORT_CONTENT_TYPES = {
+    "csv": "text/csv; charset=utf-8",
+    "ndjson": "application/x-ndjson; charset=utf-8",
+}
+# Строк, читаемых из БД за одну выборку итератора
+EXPORT_CHUNK_SIZE = 2000
+# Строк в одном фрагменте потокового ответа
+EXPORT_LINES_PER_CHUNK = 500
+
+
+class _EchoBuffer:
+    """Псевдофайл для csv.writer: возвращает строку вместо записи"""
+
+    def write(self, value):
+        return value
+
+
+def _iter_csv_lines(rows):
+    writer = csv.writer(_EchoBuffer())
+    yield writer.writerow(PRODUCT_RESULT_FIELDS)
+    for row in rows:
+        data = serialize_product_row(row)
+        yield writer.writerow([data[field] for field in PRODUCT_RESULT_FIELDS])
+
+
+def _iter_ndjson_lines(rows):
+    for row in rows:
+        yield json.dumps(serialize_product_row(row), ensure_ascii=False) + "\n"
+
+
+_LINE_ITERATORS = {
+    "csv": _iter_csv_lines,
+    "ndjson": _iter_ndjson_lines,
+}
+
+
+def iter_export(queryset, export_format: str):
+    """
+    Потоковая выгрузка результатов поиска
+
+    Строки читаются итератором queryset порциями по EXPORT_CHUNK_SIZE
+    (на PostgreSQL - серверным курсором), поэтому память не зависит
+    от количества результатов. Строки склеиваются во фрагменты, чтобы
+    не отдавать клиенту каждую строку отдельной записью в сокет.
+
+    Args:
+        queryset: Отсортированный queryset ProductResultModel
+        export_format: Формат выгрузки (ключ EXPORT_CONTENT_TYPES)
+
+    Yields:
+        str: Фрагмент CSV или NDJSON
+    """
+    rows = queryset.values(*PRODUCT_RESULT_COLUMNS).iterator(chunk_size=EXPORT_CHUNK_SIZE)
+    chunk = []
+    for line in _LINE_ITERATORS[export_format](rows):
+        chunk.append(line)
+        if len(chunk) >= EXPORT_LINES_PER_CHUNK:
+            yield "".join(chunk)
+            chunk = []
+    if chunk:
+        yield "".join(chunk)
+
+
+class StreamingContentNegotiation(BaseContentNegotiation):
+    """
+    Согласование формата для потоковых ответов (выгрузка, поток событий)
+
+    Формат выгрузки задается параметром export_format, а поток событий
+    всегда text/event-stream, поэтому заголовок Accept (например, text/csv
+    или text/event-stream у EventSource) не должен приводить к 406:
+    ошибки отдаются первым рендерером (JSON).
+    """
+
+    def select_parser(self, request, parsers):
+        return parsers[0]
+
+    def select_renderer(self, request, renderers, format_suffix=None):
+        return renderers[0], renderers[0].media_type
@@ -0,0 +1,273 @@
+import json
+import random
+import threading
+import time
+from dataclasses import dataclass
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from .throttling import TokenBucket
+
+
+SEARCH_PATH = "/exactmatch/ru/common/v13/search"
+
+
+@dataclass
+class FakeMarketplaceConfig:
+    """Параметры локального сервера-заглушки маркетплейса"""
+
+    # Общее количество товаров, которое сообщает поиск
+    total: int = 250
+    # Количество товаров на странице
+    page_size: int = 100
+    # Последняя страница, которую отдает поиск: дальше повторяется она же,
+    # как у реального API за пределами доступной глубины. None - без предела
+    max_page: int | None = None
+    # Лимит запросов в секунду, сверх которого сервер отвечает 429
+    # (как API маркетплейса при превышении квоты). None - без лимита
+    rate_limit: float | None = None
+    # Запас запросов сверх лимита (по умолчанию - лимит за секунду)
+    rate_burst: float | None = None
+    # Значение заголовка Retry-After ответа 429; None - без заголовка
+    retry_after: str | None = "1"
+    # Ревизия выдачи: цена каждого десятого товара выше на revision рублей
+    # (имитация изменения цен между парсингами)
+    revision: int = 0
+    # Задержка ответа и ее случайный разброс (равномерный, +-), сек.
+    latency: float = 0.0
+    latency_jitter: float = 0.0
+    # Доля ответов 503 (сбой маркетплейса, повторяется клиентом), от 0 до 1
+    error_rate: float = 0.0
+    # Дополнительная нагрузка на товар, байт (увеличивает размер ответа)
+    padding: int = 0
+    # Начальное значение генератора случайных ошибок и задержек
+    seed: int | None = None
+
+
+def build_product(query_text: str, index: int, revision: int = 0, padding: int = 0) -> dict:
+    """
+    Синтетический товар в формате ответа поиска маркетплейса
+
+    Кроме полей, которые использует парсер, содержит типичную для
+    реального ответа вложенную нагрузку (цвета, размеры, остатки, логи).
+    padding добавляет строку указанной длины (размер ответа в бенчмарках).
+    """
+    product_id = 1_000_000 + index
+    # Цена в копейках; меняется у каждого десятого товара с ревизией выдачи
+    price = 100000 + index * 100 + (revision * 100 if index % 10 == 0 else 0)
+    product = {
+        "__sort": 100000 - index,
+        "ksort": index,
+        "time1": 2,
+        "time2": 48,
+        "wh": 507,
+        "dtype": 4,
+        "dist": 1234,
+        "id": product_id,
+        "root": product_id // 10,
+        "kindId": 0,
+        "brand": f"Бренд {index % 7}",
+        "brandId": 1000 + index % 7,
+        "siteBrandId": 0,
+        "colors": [{"name": "черный", "id": 0}, {"name": "синий", "id": 255}],
+        "subjectId": 11,
+        "subjectParentId": 1,
+        "name": f"{query_text} {index}",
+        "entity": "товар",
+        "matchId": product_id * 7,
+        "supplier": f"Поставщик {index % 5}",
+        "supplierId": 5000 + index % 5,
+        "supplierRating": 4.0 + (index % 10) / 10,
+        "supplierFlags": 0,
+        "pics": 12,
+        "rating": 5,
+        "reviewRating": 3.0 + (index % 20) / 10,
+        "nmReviewRating": 3.0 + (index % 20) / 10,
+        "feedbacks": index * 3,
+        "nmFeedbacks": index * 3,
+        "panelPromoId": 0,
+        "volume": 5,
+        "viewFlags": 1056784,
+        "sizes": [
+            {
+                "name": size,
+                "origName": size,
+                "rank": rank,
+                "optionId": product_id * 10 + rank,
+                "stocks": [
+                    {"wh": 117986, "dtype": 4, "dist": 1234, "qty": 10 + rank, "priority": 60, "time1": 2, "time2": 48},
+                    {"wh": 507, "dtype": 4, "dist": 1300, "qty": 3, "priority": 50, "time1": 3, "time2": 40},
+                ],
+                "time1": 2,
+                "time2": 48,
+                "wh": 117986,
+                "dtype": 4,
+                "dist": 1234,
+                "price": {
+                    "basic": 150000 + index * 100,
+                    "product": price + rank,
+                    "total": price + rank,
+                    "logistics": 0,
+                    "return": 0,
+                },
+                "saleConditions": 134217728,
+                "payload": "qOv5h9u4wR3jz2ZG1mM6yYbN8tXcVaLpKsDfEeHrIoUwQn+/=" * 2,
+            }
+            for rank, size in enumerate(("42", "44", "46", "48", "50"), start=1)
+        ],
+        "totalQuantity": 120,
+        "meta": {"tokens": [], "presetId": 0},
+        "logs": "UJx0T0h4bKpGi6Tmfn1N3yW2vzq5S8dRcLAEQwePBMZkjsXgYoHa7IuCVrDFt" * 2,
+    }
+    if padding:
+        product["description"] = "x" * padding
+    return product
+
+
+def build_search_page(config: FakeMarketplaceConfig, query_text: str, page: int) -> dict:
+    """Страница результатов поиска для указанного запроса"""
+    if config.max_page is not None:
+        page = min(page, config.max_page)
+    start = (page - 1) * config.page_size
+    stop = min(config.total, start + config.page_size)
+    products = [
+        build_product(query_text, index, config.revision, config.padding) for index in range(start, stop)
+    ]
+    return {"metadata": {"name": query_text}, "data": {"total": config.total, "products": products}}
+
+
+class FakeMarketplaceServer(ThreadingHTTPServer):
+    """
+    Локальный HTTP-сервер, имитирующий поисковое API маркетплейса
+
+    Используется в тестах и бенчмарках вместо search.wb.ru.
+    Считает принятые TCP-соединения, обработанные запросы, ответы 429
+    и случайные ответы 503 (config.error_rate).
+    """
+
+    daemon_threads = True
+
+    def __init__(self, config: FakeMarketplaceConfig | None = None):
+        self.config = config or FakeMarketplaceConfig()
+        self.connections_count = 0
+        self.requests_count = 0
+        self.throttled_count = 0
+        self.errors_count = 0
+        self._bucket = None
+        self._bucket_config = None
+        self._random = None
+        self._random_config = None
+        self._counters_lock = threading.Lock()
+        self._thread = None
+        super().__init__(("127.0.0.1", 0), FakeMarketplaceHandler)
+
+    @property
+    def search_url(self) -> str:
+        """Адрес поиска для настройки SEARCH_URL"""
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}{SEARCH_PATH}"
+
+    def process_request(self, request, client_address):
+        with self._counters_lock:
+            self.connections_count += 1
+        super().process_request(request, client_address)
+
+    def count_request(self):
+        with self._counters_lock:
+            self.requests_count += 1
+
+    def is_throttled(self) -> bool:
+        """Превышен ли лимит запросов (config.rate_limit)"""
+        config = self.config
+        if config.rate_limit is None:
+            return False
+        with self._counters_lock:
+            # Конфигурацию можно заменить на работающем сервере
+            if self._bucket_config is not config:
+                self._bucket = TokenBucket(config.rate_limit, config.rate_burst or config.rate_limit)
+                self._bucket_config = config
+            bucket = self._bucket
+        if bucket.try_acquire():
+            return False
+        with self._counters_lock:
+            self.throttled_count += 1
+        return True
+
+    def draw_fault(self) -> tuple[float, bool]:
+        """Задержка и признак сбоя для очередного ответа"""
+        config = self.config
+        if not (config.latency or config.latency_jitter or config.error_rate):
+            return 0.0, False
+        with self._counters_lock:
+            if self._random_config is not config:
+                self._random = random.Random(config.seed)
+                self._random_config = config
+            jitter = self._random.uniform(-config.latency_jitter, config.latency_jitter)
+            failed = self._random.random() < config.error_rate
+            if failed:
+                self.errors_count += 1
+        return max(0.0, config.latency + jitter), failed
+
+    def start(self) -> "FakeMarketplaceServer":
+        """Запуск сервера в фоновом потоке"""
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """Остановка сервера и освобождение порта"""
+        self.shutdown()
+        self.server_close()
+        if self._thread is not None:
+            self._thread.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+
+class FakeMarketplaceHandler(BaseHTTPRequestHandler):
+    """Обработчик запросов с поддержкой keep-alive"""
+
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        self.server.count_request()
+        url = urlparse(self.path)
+        if url.path != SEARCH_PATH:
+            self._send_json(404, {"error": "not found"})
+            return
+
+        delay, failed = self.server.draw_fault()
+        if delay:
+            time.sleep(delay)
+        if failed:
+            self._send_json(503, {"error": "service unavailable"})
+            return
+
+        if self.server.is_throttled():
+            retry_after = self.server.config.retry_after
+            headers = {"Retry-After": retry_after} if retry_after is not None else {}
+            self._send_json(429, {"error": "too many requests"}, headers)
+            return
+
+        params = parse_qs(url.query)
+        query_text = params.get("query", [""])[0]
+        page = int(params.get("page", ["1"])[0])
+        self._send_json(200, build_search_page(self.server.config, query_text, page))
+
+    def _send_json(self, status_code: int, payload: dict, headers: dict | None = None):
+        body = json.dumps(payload, ensure_ascii=False).encode()
+        self.send_response(status_code)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # Не засоряем вывод тестов логами каждого запроса
+        pass
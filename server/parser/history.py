@@ -0,0 +1,121 @@
+from datetime import datetime
+
+from django.db.models import Exists, F, OuterRef, Subquery
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .models import PriceHistoryModel, ProductResultModel
+
+
+def parse_period(params) -> tuple[datetime | None, datetime | None]:
+    """
+    Границы периода из параметров since/until (ISO 8601)
+
+    Время без часового пояса считается временем текущего пояса.
+
+    Raises:
+        ValueError: Если дата указана в неверном формате
+    """
+    period = []
+    for name in ("since", "until"):
+        value = params.get(name)
+        if not value:
+            period.append(None)
+            continue
+        moment = parse_datetime(value)
+        if moment is None:
+            raise ValueError(f"Неверный формат даты в параметре {name}: {value}")
+        if timezone.is_naive(moment):
+            moment = timezone.make_aware(moment)
+        period.append(moment)
+    return period[0], period[1]
+
+
+def get_price_series(result: ProductResultModel, since: datetime | None = None,
+                     until: datetime | None = None) -> list[dict]:
+    """
+    Ряд значений товара за период
+
+    Выбирается диапазоном по индексу (result, observed_at). Если в начале
+    периода наблюдения нет, ряд начинается в момент since со значений
+    последнего наблюдения до него: иначе период после последнего изменения
+    выглядел бы пустым. Товар без истории не менялся с момента создания:
+    ряд состоит из его текущих значений.
+
+    Returns:
+        list[dict]: Наблюдения по возрастанию времени
+    """
+    fields = ("observed_at", *PriceHistoryModel.TRACKED_FIELDS)
+    history = result.history.all()
+    window = history
+    if since is not None:
+        window = window.filter(observed_at__gte=since)
+    if until is not None:
+        window = window.filter(observed_at__lte=until)
+    series = list(window.values(*fields))
+
+    if since is not None and (until is None or since <= until) and (
+        not series or series[0]["observed_at"] > since
+    ):
+        previous = history.filter(observed_at__lt=since).order_by("-observed_at").values(*fields).first()
+        if previous is not None:
+            series.insert(0, {**previous, "observed_at": since})
+
+    if not series and not history.exists():
+        start = result.created_at if since is None else max(result.created_at, since)
+        if until is None or start <= until:
+            series = [{"observed_at": start, **{
+                name: getattr(result, name) for name in PriceHistoryModel.TRACKED_FIELDS
+            }}]
+    return series
+
+
+def get_price_changes(search_query_id: int, since: datetime,
+                      until: datetime | None = None) -> list[dict]:
+    """
+    Изменения цен товаров запроса между двумя моментами (например, обновлениями)
+
+    Цена на момент - последнее наблюдение не позже него. Изменилась цена
+    только у товаров с наблюдениями внутри периода: они отбираются
+    диапазоном по индексу (result, observed_at), а цены на оба момента
+    читаются по одной строке истории на товар.
+
+    Args:
+        search_query_id: ID поискового запроса
+        since: Начало периода
+        until: Конец периода (по умолчанию - текущий момент)
+
+    Returns:
+        list[dict]: Товары с изменившейся ценой по возрастанию id
+    """
+    in_period = PriceHistoryModel.objects.filter(result=OuterRef("pk"), observed_at__gt=since)
+    new_price = PriceHistoryModel.objects.filter(result=OuterRef("pk"))
+    if until is not None:
+        in_period = in_period.filter(observed_at__lte=until)
+        new_price = new_price.filter(observed_at__lte=until)
+    old_price = PriceHistoryModel.objects.filter(result=OuterRef("pk"), observed_at__lte=since)
+
+    rows = (
+        ProductResultModel.objects.filter(search_query_id=search_query_id)
+        .filter(Exists(in_period))
+        .annotate(
+            old_price=Subquery(old_price.order_by("-observed_at").values("price")[:1]),
+            new_price=Subquery(new_price.order_by("-observed_at").values("price")[:1]),
+        )
+        # Товара еще не было на момент since
+        .filter(old_price__isnull=False)
+        .exclude(old_price=F("new_price"))
+        .order_by("id")
+        .values_list("id", "product_id", "product__name", "old_price", "new_price")
+    )
+    return [
+        {
+            "id": result_id,
+            "external_id": external_id,
+            "name": name,
+            "old_price": old,
+            "new_price": new,
+            "delta": new - old,
+        }
+        for result_id, external_id, name, old, new in rows
+    ]
@@ -0,0 +1,169 @@
+import csv
+import io
+import time
+
+from django.core.exceptions import ImproperlyConfigured
+from django.db import connection
+
+from .catalog import save_catalog
+from .conf import parser_settings
+from .metrics import record_insert
+from .models import ProductResultModel
+
+
+class BulkCreateIngestBackend:
+    """Запись товаров через bulk_create (многострочные INSERT), любая БД"""
+
+    name = "bulk_create"
+
+    def __init__(self, batch_size: int):
+        self.batch_size = batch_size
+
+    def insert(self, instances: list[ProductResultModel]) -> int:
+        """
+        Запись объектов с пропуском дублей (search_query, product)
+
+        Returns:
+            int: Количество переданных в запись объектов (bulk_create
+            с ignore_conflicts не сообщает, сколько строк пропущено)
+        """
+        created = ProductResultModel.objects.bulk_create(
+            instances, batch_size=self.batch_size, ignore_conflicts=True
+        )
+        return len(created)
+
+
+class PostgresCopyIngestBackend:
+    """
+    Запись товаров через COPY ... FROM STDIN (PostgreSQL)
+
+    Строки передаются одним потоком COPY во временную таблицу сессии,
+    а затем переносятся в product_results одним INSERT ... SELECT
+    с ON CONFLICT (search_query_id, product_id) DO NOTHING. COPY сам
+    конфликты не обрабатывает, поэтому напрямую в product_results
+    не пишет. Поддерживаются psycopg 3 и psycopg2.
+    """
+
+    name = "copy"
+    staging_table = "product_results_staging"
+
+    def __init__(self, batch_size: int | None = None):
+        # batch_size не нужен: COPY передает все строки одним потоком
+        self.fields = [
+            field for field in ProductResultModel._meta.concrete_fields if not field.primary_key
+        ]
+        self.columns = ", ".join(connection.ops.quote_name(field.column) for field in self.fields)
+        # В CSV все значения в кавычках: для nullable-колонок пустое значение
+        # в кавычках превращается в NULL опцией FORCE_NULL
+        self.null_columns = ", ".join(
+            connection.ops.quote_name(field.column) for field in self.fields if field.null
+        )
+
+    def insert(self, instances: list[ProductResultModel]) -> int:
+        """
+        Запись объектов с пропуском дублей (search_query, product)
+
+        Returns:
+            int: Количество фактически добавленных строк
+        """
+        if not instances:
+            return 0
+
+        table = connection.ops.quote_name(ProductResultModel._meta.db_table)
+        staging = connection.ops.quote_name(self.staging_table)
+        with connection.cursor() as cursor:
+            # Временная таблица с колонками product_results без ограничений
+            cursor.execute(
+                f"CREATE TEMPORARY TABLE IF NOT EXISTS {staging} "
+                f"AS SELECT {self.columns} FROM {table} WITH NO DATA"
+            )
+            # Остатки прерванной записи в этой же сессии
+            cursor.execute(f"TRUNCATE {staging}")
+            options = "FORMAT csv"
+            if self.null_columns:
+                options += f", FORCE_NULL ({self.null_columns})"
+            self._copy(cursor, f"COPY {staging} ({self.columns}) FROM STDIN WITH ({options})",
+                       self.encode_rows(instances))
+            cursor.execute(
+                f"INSERT INTO {table} ({self.columns}) SELECT {self.columns} FROM {staging} "
+                f"ON CONFLICT (search_query_id, product_id) DO NOTHING"
+            )
+            inserted = cursor.rowcount
+            cursor.execute(f"TRUNCATE {staging}")
+        return inserted
+
+    def encode_rows(self, instances: list[ProductResultModel]) -> str:
+        """
+        Данные для COPY в формате CSV
+
+        Значения готовятся так же, как при save(): pre_save заполняет
+        created_at, get_db_prep_save приводит типы (например, дробную цену
+        к целому для BigIntegerField). Все значения в кавычках: пустая
+        строка без кавычек в CSV-режиме COPY означает NULL. None nullable-полей
+        записывается пустой строкой и читается как NULL (FORCE_NULL).
+        """
+        buffer = io.StringIO()
+        writer = csv.writer(buffer, quoting=csv.QUOTE_ALL, lineterminator="\n")
+        for instance in instances:
+            writer.writerow([
+                field.get_db_prep_save(field.pre_save(instance, True), connection)
+                for field in self.fields
+            ])
+        return buffer.getvalue()
+
+    @staticmethod
+    def _copy(cursor, sql: str, data: str):
+        raw_cursor = cursor.cursor
+        if hasattr(raw_cursor, "copy_expert"):
+            # psycopg2
+            raw_cursor.copy_expert(sql, io.StringIO(data))
+        else:
+            # psycopg 3
+            with raw_cursor.copy(sql) as copy:
+                copy.write(data)
+
+
+INGEST_BACKENDS = {
+    BulkCreateIngestBackend.name: BulkCreateIngestBackend,
+    PostgresCopyIngestBackend.name: PostgresCopyIngestBackend,
+}
+
+
+def resolve_ingest_backend() -> str:
+    """
+    Имя backend записи из настройки INGEST_BACKEND
+
+    "auto" выбирает COPY для PostgreSQL и bulk_create для остальных БД.
+    """
+    name = parser_settings("INGEST_BACKEND")
+    if name == "auto":
+        if connection.vendor == "postgresql":
+            return PostgresCopyIngestBackend.name
+        return BulkCreateIngestBackend.name
+    if name not in INGEST_BACKENDS:
+        raise ImproperlyConfigured(f"Неизвестный INGEST_BACKEND: {name}")
+    if name == PostgresCopyIngestBackend.name and connection.vendor != "postgresql":
+        raise ImproperlyConfigured("INGEST_BACKEND='copy' поддерживается только для PostgreSQL")
+    return name
+
+
+def insert_products(instances: list[ProductResultModel], batch_size: int = 100) -> int:
+    """
+    Запись объектов товаров выбранным backend
+
+    Вызывается внутри transaction.atomic(). Новые товары каталога
+    записываются в той же транзакции перед результатами запроса.
+
+    Args:
+        instances: Несохраненные объекты ProductResultModel (см. build_product_result)
+        batch_size: Размер пакета INSERT для bulk_create
+
+    Returns:
+        int: Количество записанных объектов
+    """
+    started = time.perf_counter()
+    save_catalog(instances, batch_size=batch_size)
+    backend = INGEST_BACKENDS[resolve_ingest_backend()](batch_size=batch_size)
+    inserted = backend.insert(instances)
+    record_insert(backend.name, len(instances), time.perf_counter() - started)
+    return inserted
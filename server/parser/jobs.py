@@ -0,0 +1,289 @@
+import concurrent.futures
+import logging
+import os
+import socket
+import threading
+import weakref
+from datetime import timedelta
+
+from django.db import close_old_connections, connection
+from django.db.models import F
+from django.utils import timezone
+
+from .cache import invalidate_results
+from .conf import parser_settings
+from .models import ParseJobModel, ParsePageModel, ProductResultModel, SearchQueryModel
+from .services import MarketplaceParserService
+
+logger = logging.getLogger(__name__)
+
+
+def enqueue_parse_job(search_query_id: int,
+                      kind: str = ParseJobModel.Kind.PARSE) -> ParseJobModel:
+    """Создание задания парсинга (или обновления) для воркера очереди"""
+    return ParseJobModel.objects.create(search_query_id=search_query_id, kind=kind)
+
+
+def enqueue_parse_jobs(search_query_ids: list[int],
+                       kind: str = ParseJobModel.Kind.PARSE) -> list[ParseJobModel]:
+    """Создание заданий для нескольких запросов одним INSERT"""
+    return ParseJobModel.objects.bulk_create(
+        [ParseJobModel(search_query_id=search_query_id, kind=kind) for search_query_id in search_query_ids]
+    )
+
+
+def claim_jobs(worker_id: str, limit: int) -> list[ParseJobModel]:
+    """
+    Захват доступных заданий воркером
+
+    Захват выполняется условным UPDATE по статусу, поэтому одно задание
+    не достанется двум воркерам даже без SELECT ... FOR UPDATE.
+
+    Args:
+        worker_id: Идентификатор воркера
+        limit: Максимальное количество заданий
+
+    Returns:
+        list[ParseJobModel]: Захваченные задания
+    """
+    if limit <= 0:
+        return []
+
+    now = timezone.now()
+    candidate_ids = list(
+        ParseJobModel.objects.filter(
+            status=ParseJobModel.Status.PENDING, available_at__lte=now
+        ).values_list("id", flat=True)[:limit]
+    )
+
+    claimed_ids = []
+    for job_id in candidate_ids:
+        updated = ParseJobModel.objects.filter(
+            id=job_id, status=ParseJobModel.Status.PENDING
+        ).update(
+            status=ParseJobModel.Status.RUNNING,
+            worker_id=worker_id,
+            attempts=F("attempts") + 1,
+            lease_expires_at=now + timedelta(seconds=parser_settings("JOB_LEASE_SECONDS")),
+            updated_at=now,
+        )
+        if updated:
+            claimed_ids.append(job_id)
+
+    return list(
+        ParseJobModel.objects.filter(id__in=claimed_ids).select_related("search_query")
+    )
+
+
+def renew_leases(worker_id: str, job_ids: list[int]) -> int:
+    """Продление аренды выполняющихся заданий воркера"""
+    if not job_ids:
+        return 0
+    now = timezone.now()
+    return ParseJobModel.objects.filter(
+        id__in=job_ids, worker_id=worker_id, status=ParseJobModel.Status.RUNNING
+    ).update(
+        lease_expires_at=now + timedelta(seconds=parser_settings("JOB_LEASE_SECONDS")),
+        updated_at=now,
+    )
+
+
+def recover_stuck_jobs() -> int:
+    """
+    Возврат в очередь заданий с истекшей арендой
+
+    Такие задания остаются после падения или остановки воркера.
+    Задания, исчерпавшие попытки, помечаются как ошибочные.
+
+    Returns:
+        int: Количество восстановленных заданий
+    """
+    now = timezone.now()
+    stuck = ParseJobModel.objects.filter(
+        status=ParseJobModel.Status.RUNNING, lease_expires_at__lt=now
+    )
+    stuck.filter(attempts__gte=parser_settings("JOB_MAX_ATTEMPTS")).update(
+        status=ParseJobModel.Status.FAILED,
+        last_error="Истекла аренда задания",
+        lease_expires_at=None,
+        updated_at=now,
+    )
+    return stuck.update(
+        status=ParseJobModel.Status.PENDING,
+        worker_id="",
+        lease_expires_at=None,
+        available_at=now,
+        updated_at=now,
+    )
+
+
+def complete_job(job: ParseJobModel) -> bool:
+    """Отметка успешного выполнения задания"""
+    return bool(
+        ParseJobModel.objects.filter(id=job.id, worker_id=job.worker_id).update(
+            status=ParseJobModel.Status.DONE,
+            lease_expires_at=None,
+            last_error="",
+            updated_at=timezone.now(),
+        )
+    )
+
+
+def fail_job(job: ParseJobModel, error: str) -> bool:
+    """
+    Обработка ошибки задания: повтор с экспоненциальной задержкой
+    или окончательная ошибка, если попытки исчерпаны
+    """
+    now = timezone.now()
+    jobs = ParseJobModel.objects.filter(id=job.id, worker_id=job.worker_id)
+
+    if job.attempts >= parser_settings("JOB_MAX_ATTEMPTS"):
+        return bool(
+            jobs.update(
+                status=ParseJobModel.Status.FAILED,
+                lease_expires_at=None,
+                last_error=error,
+                updated_at=now,
+            )
+        )
+
+    delay = parser_settings("JOB_RETRY_DELAY") * 2 ** (job.attempts - 1)
+    return bool(
+        jobs.update(
+            status=ParseJobModel.Status.PENDING,
+            worker_id="",
+            lease_expires_at=None,
+            available_at=now + timedelta(seconds=delay),
+            last_error=error,
+            updated_at=now,
+        )
+    )
+
+
+def run_job(job: ParseJobModel):
+    """
+    Выполнение одного задания парсинга
+
+    Повторная попытка продолжает парсинг с контрольных точек страниц.
+    Если их нет, частично сохраненные товары не привязаны ни к одной
+    странице и удаляются: парсинг начинается заново. Обновление
+    повторяется целиком и сохраненные товары не удаляет.
+    """
+    search_query = job.search_query
+    if job.kind == ParseJobModel.Kind.REFRESH:
+        MarketplaceParserService().run_parsing(
+            search_query.id, search_query.query_text, refresh=True
+        )
+        return
+
+    if job.attempts > 1 and not search_query.pages.filter(status=ParsePageModel.Status.DONE).exists():
+        ProductResultModel.objects.filter(search_query_id=search_query.id).delete()
+        SearchQueryModel.objects.filter(id=search_query.id).update(
+            is_completed=False, total_results=0
+        )
+        invalidate_results(search_query.id)
+
+    if parser_settings("ENGINE") == "asyncio":
+        from .async_engine import get_async_engine
+
+        get_async_engine().run(search_query.id, search_query.query_text)
+    else:
+        MarketplaceParserService().run_parsing(search_query.id, search_query.query_text)
+
+
+# Воркеры процесса (для метрик очереди пула воркера)
+_workers = weakref.WeakSet()
+
+
+def get_worker_jobs() -> dict[str, int]:
+    """
+    Задания воркеров процесса по состоянию
+
+    Returns:
+        dict[str, int]: {"queued": захвачены и ждут потока пула, "running": выполняются}
+    """
+    queued = running = 0
+    for worker in list(_workers):
+        for future in list(worker._active):
+            if future.running():
+                running += 1
+            elif not future.done():
+                queued += 1
+    return {"queued": queued, "running": running}
+
+
+class ParseWorker:
+    """
+    Воркер очереди заданий парсинга
+
+    Захватывает задания из таблицы parse_jobs, выполняет их в пуле потоков
+    с ограниченной конкурентностью и продлевает аренду выполняющихся заданий.
+    """
+
+    def __init__(self, concurrency: int | None = None, poll_interval: float | None = None):
+        self.concurrency = concurrency or parser_settings("WORKER_CONCURRENCY")
+        self.poll_interval = poll_interval or parser_settings("WORKER_POLL_INTERVAL")
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}"
+        self._stop_event = threading.Event()
+        self._active: dict[concurrent.futures.Future, ParseJobModel] = {}
+        self._last_renewal = timezone.now()
+        _workers.add(self)
+
+    def stop(self):
+        """Остановка захвата новых заданий"""
+        self._stop_event.set()
+
+    def run(self, once: bool = False):
+        """
+        Основной цикл воркера
+
+        Args:
+            once: Выполнить доступные задания и завершиться
+        """
+        with concurrent.futures.ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+            while not self._stop_event.is_set():
+                self._collect_finished()
+                self._renew_leases()
+                recover_stuck_jobs()
+
+                for job in claim_jobs(self.worker_id, self.concurrency - len(self._active)):
+                    self._active[executor.submit(self._execute, job)] = job
+
+                if once and not self._active:
+                    break
+
+                if self._active:
+                    concurrent.futures.wait(
+                        self._active,
+                        timeout=self.poll_interval,
+                        return_when=concurrent.futures.FIRST_COMPLETED,
+                    )
+                else:
+                    self._stop_event.wait(self.poll_interval)
+
+            # Дожидаемся выполняющихся заданий перед выходом
+            concurrent.futures.wait(self._active)
+            self._collect_finished()
+
+    def _collect_finished(self):
+        for future in [future for future in self._active if future.done()]:
+            self._active.pop(future)
+
+    def _renew_leases(self):
+        lease_seconds = parser_settings("JOB_LEASE_SECONDS")
+        if (timezone.now() - self._last_renewal).total_seconds() < lease_seconds / 3:
+            return
+        renew_leases(self.worker_id, [job.id for job in self._active.values()])
+        self._last_renewal = timezone.now()
+
+    def _execute(self, job: ParseJobModel):
+        """Выполнение задания в потоке пула"""
+        close_old_connections()
+        try:
+            run_job(job)
+            complete_job(job)
+        except Exception as e:
+            logger.exception("Ошибка при выполнении задания %s", job.id)
+            fail_job(job, str(e))
+        finally:
+            connection.close()
@@ -0,0 +1,166 @@
+import concurrent.futures
+import hashlib
+import threading
+from typing import Callable
+
+from django.core.cache import caches
+
+from .conf import parser_settings
+
+
+def normalize_query(query_text: str) -> str:
+    """Ключ запроса: без лишних пробелов и регистра (поиск их не различает)"""
+    return " ".join(query_text.split()).casefold()
+
+
+class FirstPageCache:
+    """
+    Кэш первых страниц выдачи поверх кэша Django
+
+    Страницы хранятся в алиасе FIRST_PAGE_CACHE_ALIAS: с общим для процессов
+    backend (файлы, Redis, БД) страницу, полученную проверкой запроса в одном
+    воркере gunicorn, использует парсинг в другом воркере или в parse_worker.
+    Размер кэша ограничивается настройками алиаса (MAX_ENTRIES).
+    Счетчики обращений ведутся в памяти процесса (для метрик).
+    """
+
+    def __init__(self, alias: str, ttl: float):
+        """
+        Args:
+            alias: Алиас из CACHES
+            ttl: Время жизни записи, сек. (0 - кэш выключен)
+        """
+        self.alias = alias
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    @property
+    def backend(self):
+        return caches[self.alias]
+
+    @staticmethod
+    def _key(key: str) -> str:
+        # Текст запроса может содержать пробелы и кириллицу, недопустимые в ключах memcached
+        return "first_page:" + hashlib.sha1(key.encode()).hexdigest()
+
+    def get(self, key: str, pop: bool = False):
+        """
+        Значение по ключу или None, если записи нет или она просрочена
+
+        Args:
+            key: Ключ записи
+            pop: Удалить запись после чтения
+        """
+        if self.ttl <= 0:
+            return None
+        value = self.backend.get(self._key(key))
+        with self._lock:
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        if value is not None and pop:
+            self.discard(key)
+        return value
+
+    def pop(self, key: str):
+        """Значение по ключу с удалением записи"""
+        return self.get(key, pop=True)
+
+    def discard(self, key: str):
+        """Удаление записи без учета в статистике обращений"""
+        self.backend.delete(self._key(key))
+
+    def set(self, key: str, value):
+        if self.ttl <= 0:
+            return
+        self.backend.set(self._key(key), value, self.ttl)
+
+    def clear(self):
+        """Удаление всех записей алиаса (алиас должен быть отдельным)"""
+        self.backend.clear()
+
+
+class SingleFlight:
+    """
+    Объединение одновременных одинаковых вызовов
+
+    Пока вызов с ключом выполняется, остальные вызовы с тем же ключом
+    не повторяют его, а ждут и получают тот же результат (или исключение).
+    Объединяются вызовы одного процесса: одновременные проверки одного
+    запроса в разных процессах выполнят по запросу к маркетплейсу.
+    """
+
+    def __init__(self):
+        self._calls: dict[object, concurrent.futures.Future] = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, fn: Callable):
+        """
+        Выполнение fn или ожидание уже выполняющегося вызова с тем же ключом
+
+        Returns:
+            Результат fn
+        """
+        with self._lock:
+            future = self._calls.get(key)
+            leader = future is None
+            if leader:
+                future = concurrent.futures.Future()
+                self._calls[key] = future
+        if not leader:
+            return future.result()
+
+        try:
+            result = fn()
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            with self._lock:
+                del self._calls[key]
+
+    def in_flight(self) -> int:
+        """Количество выполняющихся вызовов"""
+        with self._lock:
+            return len(self._calls)
+
+
+_first_page_cache: FirstPageCache | None = None
+_first_page_flight = SingleFlight()
+_cache_lock = threading.Lock()
+
+
+def get_first_page_cache() -> FirstPageCache:
+    """
+    Кэш первых страниц выдачи
+
+    Первую страницу запрашивают и проверка запроса (validate_query),
+    и следующий за ней парсинг: кэш позволяет обойтись одним запросом.
+    """
+    global _first_page_cache
+    if _first_page_cache is None:
+        with _cache_lock:
+            if _first_page_cache is None:
+                _first_page_cache = FirstPageCache(
+                    parser_settings("FIRST_PAGE_CACHE_ALIAS"), parser_settings("FIRST_PAGE_CACHE_TTL")
+                )
+    return _first_page_cache
+
+
+def get_first_page_flight() -> SingleFlight:
+    """Объединение одновременных запросов первой страницы одного запроса"""
+    return _first_page_flight
+
+
+def reset_first_page_cache():
+    """Сброс кэша с удалением записей (например, после изменения настроек в тестах)"""
+    global _first_page_cache
+    with _cache_lock:
+        caches[parser_settings("FIRST_PAGE_CACHE_ALIAS")].clear()
+        _first_page_cache = None
@@ -0,0 +1,114 @@
+import json
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.utils import override_settings
+
+from parser.benchmarking import build_api_plan, run_api_load, seed_search_query, temporary_database
+
+# Сортировки по умолчанию: без сортировки, по индексам результатов,
+# через JOIN с каталогом и по нескольким полям
+DEFAULT_SORTS = [
+    "",
+    "price_sort=asc",
+    "price_sort=desc",
+    "feedbacks_sort=desc",
+    "name_sort=asc",
+    "brand_sort=asc&price_sort=desc",
+]
+
+
+class Command(BaseCommand):
+    help = "Нагрузочный тест /api/products/result/ и /api/search/history/"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--searches", type=int, default=10, help="Заполненных поисковых запросов")
+        parser.add_argument("--products", type=int, default=1000, help="Товаров в каждом запросе")
+        parser.add_argument(
+            "--concurrency", type=int, nargs="+", default=[1, 8, 32], help="Одновременных клиентов"
+        )
+        parser.add_argument("--requests", type=int, default=1000, help="Запросов на сценарий")
+        parser.add_argument("--sorts", nargs="+", default=DEFAULT_SORTS, help="Параметры сортировки")
+        parser.add_argument("--page-sizes", type=int, nargs="+", default=[10, 100], help="Размеры страниц")
+        parser.add_argument(
+            "--depths", type=int, nargs="+", default=[1, 10, 1000],
+            help="Номера страниц (ограничиваются последней страницей)",
+        )
+        parser.add_argument(
+            "--history-page-sizes", type=int, nargs="*", default=[10, 100],
+            help="Размеры страниц истории запросов (без значений - история не запрашивается)",
+        )
+        parser.add_argument(
+            "--results-cache", action="store_true",
+            help="Не отключать кэш страниц результатов (по умолчанию замеряется запрос к БД)",
+        )
+        parser.add_argument("--seed", type=int, default=1, help="Начальное значение перемешивания")
+        parser.add_argument("--groups", action="store_true", help="Вывести сводку по группам запросов")
+        parser.add_argument("--output", help="Файл для результатов в JSON ('-' - stdout)")
+
+    def handle(self, *args, **options):
+        # Без кэша каждый запрос страницы выполняет SQL (timeout 0 - не сохранять)
+        cache_settings = {} if options["results_cache"] else {"RESULTS_CACHE_TIMEOUT": 0}
+        scenarios = []
+
+        with temporary_database(), override_settings(MARKETPLACE_PARSER=cache_settings):
+            self.stdout.write(f"Заполнение: {options['searches']} x {options['products']} товаров")
+            search_ids = [
+                seed_search_query(f"нагрузка {index}", options["products"]).id
+                for index in range(options["searches"])
+            ]
+            plan = build_api_plan(
+                search_ids,
+                options["products"],
+                sorts=options["sorts"],
+                page_sizes=options["page_sizes"],
+                depths=options["depths"],
+                history_page_sizes=options["history_page_sizes"],
+                requests_count=options["requests"],
+                seed=options["seed"],
+            )
+
+            self.stdout.write(
+                f"{'клиентов':>9}{'запр./с':>9}{'p50, мс':>9}{'p95, мс':>9}{'p99, мс':>9}"
+                f"{'SQL/запр.':>10}{'ошибок':>8}"
+            )
+            for concurrency in options["concurrency"]:
+                result = run_api_load(plan, concurrency)
+                scenarios.append(result)
+                total = result["total"]
+                self.stdout.write(
+                    f"{concurrency:>9}{total['requests_per_second']:>9.1f}{total['p50_ms']:>9.2f}"
+                    f"{total['p95_ms']:>9.2f}{total['p99_ms']:>9.2f}{total['queries_avg']:>10.2f}"
+                    f"{total['errors']:>8}"
+                )
+                if options["groups"]:
+                    self._write_groups(result["groups"])
+            vendor = connection.vendor
+
+        report = {
+            "benchmark": "api",
+            "database": vendor,
+            "config": {
+                name: options[name]
+                for name in (
+                    "searches", "products", "requests", "sorts", "page_sizes", "depths",
+                    "history_page_sizes", "results_cache", "seed",
+                )
+            },
+            "scenarios": scenarios,
+        }
+        output = options["output"]
+        if output == "-":
+            self.stdout.write(json.dumps(report, ensure_ascii=False, indent=2))
+        elif output:
+            with open(output, "w", encoding="utf-8") as file:
+                json.dump(report, file, ensure_ascii=False, indent=2)
+            self.stdout.write(f"Результаты записаны в {output}")
+
+    def _write_groups(self, groups: list[dict]):
+        for group in groups:
+            self.stdout.write(
+                f"    {group['endpoint']:<8}{group['sort']:<32}size={group['page_size']:<5}"
+                f"page={group['page']:<6}p50={group['p50_ms']:.2f} мс  p99={group['p99_ms']:.2f} мс  "
+                f"SQL={group['queries_avg']:.1f}"
+            )
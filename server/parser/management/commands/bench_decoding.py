@@ -0,0 +1,90 @@
+import json
+import time
+import tracemalloc
+
+from django.core.management.base import BaseCommand, CommandError
+
+from parser.decoding import DECODERS, available_json_backends
+from parser.fake_marketplace import FakeMarketplaceConfig, build_search_page
+from parser.services import MarketplaceParserService
+
+
+def _extract_full(content: bytes) -> list[tuple]:
+    """Прежний путь: полный json.loads и цепочки .get по каждому товару"""
+    data = json.loads(content)
+    return _extract_fields(data.get("data", {}).get("products", []))
+
+
+def _extract_fields(products: list[dict]) -> list[tuple]:
+    rows = []
+    for item in products:
+        price = 0
+        sizes = item.get("sizes", [])
+        if sizes:
+            price = sizes[0].get("price", {}).get("product", 0) / 100
+        rows.append((
+            item.get("id", 0),
+            item.get("name", ""),
+            item.get("brand", ""),
+            item.get("supplier", ""),
+            item.get("supplierRating", 0.0),
+            item.get("reviewRating", 0.0),
+            item.get("feedbacks", 0),
+            price,
+        ))
+    return rows
+
+
+class Command(BaseCommand):
+    help = "Сравнение декодеров страницы поиска по CPU и пиковой памяти"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--pages", type=int, default=50, help="Количество страниц в замере")
+        parser.add_argument("--page-size", type=int, default=100, help="Товаров на странице")
+
+    def handle(self, *args, **options):
+        page_size = options["page_size"]
+        config = FakeMarketplaceConfig(total=page_size, page_size=page_size)
+        content = json.dumps(build_search_page(config, "джинсы", 1), ensure_ascii=False).encode()
+        self.stdout.write(f"Размер страницы: {len(content) / 1024:.1f} КБ, товаров: {page_size}")
+
+        cases = {"response.json() + .get": _extract_full}
+        for name in available_json_backends():
+            cases[name] = lambda content, decoder=DECODERS[name]: _extract_fields(
+                decoder(content)["data"]["products"]
+            )
+
+        expected = _extract_full(content)
+        self.stdout.write(f"{'декодер':<26}{'CPU, мс/стр.':>14}{'пик памяти, КБ':>18}")
+        for name, extract in cases.items():
+            if extract(content) != expected:
+                self.stderr.write(f"{name}: результат отличается от эталонного")
+                continue
+
+            started = time.process_time()
+            for _ in range(options["pages"]):
+                extract(content)
+            cpu_ms = (time.process_time() - started) * 1000 / options["pages"]
+
+            tracemalloc.start()
+            extract(content)
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+
+            self.stdout.write(f"{name:<26}{cpu_ms:>14.2f}{peak / 1024:>18.1f}")
+
+        # Проверяем, что сервис разбирает страницу выбранным декодером
+        is_valid, total, products, _ = MarketplaceParserService.parse_search_response(
+            _BenchResponse(content), return_data=True
+        )
+        if not is_valid or total != page_size or len(products) != page_size:
+            raise CommandError("Сервис не разобрал страницу выбранным декодером")
+
+
+class _BenchResponse:
+    """Минимальная замена httpx.Response для parse_search_response"""
+
+    status_code = 200
+
+    def __init__(self, content: bytes):
+        self.content = content
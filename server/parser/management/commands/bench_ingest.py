@@ -0,0 +1,82 @@
+import concurrent.futures
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.utils import override_settings
+
+from parser.benchmarking import temporary_database
+from parser.db_writer import close_db_writer, get_db_writer
+from parser.fake_marketplace import FakeMarketplaceConfig, build_search_page
+from parser.models import ProductResultModel, SearchQueryModel
+from parser.pipeline import ParsePipeline, get_pipeline_totals
+from parser.services import MarketplaceParserService
+
+
+def _ingest(query: SearchQueryModel, pages: dict[int, list[dict]]) -> int:
+    """Преобразование и запись уже загруженных страниц одного поиска"""
+    try:
+        pipeline = ParsePipeline(MarketplaceParserService(), query, query.query_text)
+        return pipeline.run([], prefetched=pages)
+    finally:
+        # Соединения потоков не должны пережить временную БД
+        connection.close()
+
+
+class Command(BaseCommand):
+    help = "Пропускная способность записи при одновременных парсингах (DB_WRITER direct/coalescing)"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--searches", type=int, default=20, help="Одновременных парсингов")
+        parser.add_argument("--pages", type=int, default=10, help="Страниц по 100 товаров на поиск")
+        parser.add_argument("--rounds", type=int, default=3, help="Повторов каждого режима")
+        parser.add_argument(
+            "--modes", nargs="+", default=["direct", "coalescing"], help="Значения DB_WRITER"
+        )
+
+    def handle(self, *args, **options):
+        searches, pages_count = options["searches"], options["pages"]
+        # Загрузка из сети не участвует в замере: страницы готовятся заранее
+        config = FakeMarketplaceConfig(total=pages_count * 100, page_size=100)
+        pages = {
+            page: build_search_page(config, "бенчмарк", page)["data"]["products"]
+            for page in range(1, pages_count + 1)
+        }
+        expected = searches * pages_count * 100
+
+        with temporary_database():
+            self.stdout.write(
+                f"{'DB_WRITER':<12}{'сек.':>8}{'строк/с':>10}{'потеряно':>10}{'транзакций':>12}"
+            )
+            for round_number in range(options["rounds"]):
+                for mode in options["modes"]:
+                    with override_settings(MARKETPLACE_PARSER={"DB_WRITER": mode}):
+                        batches_before = get_pipeline_totals()["write"]["items"]
+                        elapsed, stored = self._run(f"{mode} {round_number}", searches, pages)
+                        writer = get_db_writer()
+                        if writer is not None:
+                            transactions = writer.stats["flushes"]
+                        else:
+                            # Без общего писателя каждый пакет конвейера - своя транзакция
+                            transactions = get_pipeline_totals()["write"]["items"] - batches_before
+                        close_db_writer()
+
+                    self.stdout.write(
+                        f"{mode:<12}{elapsed:>8.2f}{stored / elapsed:>10.0f}"
+                        f"{expected - stored:>10}{transactions:>12}"
+                    )
+
+    @staticmethod
+    def _run(prefix: str, searches: int, pages: dict) -> tuple[float, int]:
+        """Одновременная запись searches поисков; возвращает время и число строк"""
+        queries = [
+            SearchQueryModel.objects.create(query_text=f"{prefix} {index}")
+            for index in range(searches)
+        ]
+        started = time.perf_counter()
+        with concurrent.futures.ThreadPoolExecutor(max_workers=searches) as executor:
+            futures = [executor.submit(_ingest, query, pages) for query in queries]
+            concurrent.futures.wait(futures)
+        elapsed = time.perf_counter() - started
+        stored = ProductResultModel.objects.filter(search_query__in=queries).count()
+        return elapsed, stored
@@ -0,0 +1,55 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import override_settings
+
+from parser.benchmarking import temporary_database
+from parser.fake_marketplace import FakeMarketplaceConfig, build_search_page
+from parser.ingest import BulkCreateIngestBackend, PostgresCopyIngestBackend, insert_products
+from parser.models import ProductResultModel, SearchQueryModel
+from parser.services import MarketplaceParserService
+
+
+class Command(BaseCommand):
+    help = "Строк в секунду при записи результатов через bulk_create и COPY (PostgreSQL)"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--sizes", type=int, nargs="+", default=[1000, 10000, 100000], help="Количество товаров"
+        )
+
+    def handle(self, *args, **options):
+        service = MarketplaceParserService()
+        with temporary_database():
+            backends = [BulkCreateIngestBackend.name]
+            if connection.vendor == "postgresql":
+                backends.append(PostgresCopyIngestBackend.name)
+            else:
+                self.stdout.write(f"БД {connection.vendor}: COPY доступен только для PostgreSQL")
+
+            self.stdout.write(f"{'товаров':>10}{'backend':>14}{'сек.':>10}{'строк/с':>12}")
+            for size in options["sizes"]:
+                products = self._build_products(size)
+                for backend in backends:
+                    search_query = SearchQueryModel.objects.create(query_text=f"{backend} {size}")
+                    instances = service._build_product_instances(search_query, products)
+
+                    with override_settings(MARKETPLACE_PARSER={"INGEST_BACKEND": backend}):
+                        started = time.perf_counter()
+                        with transaction.atomic():
+                            insert_products(instances, batch_size=service.BATCH_SIZE)
+                        elapsed = time.perf_counter() - started
+
+                    stored = ProductResultModel.objects.filter(search_query=search_query).count()
+                    assert stored == size, f"{backend}: записано {stored} из {size}"
+                    self.stdout.write(f"{size:>10}{backend:>14}{elapsed:>10.2f}{size / elapsed:>12.0f}")
+
+    @staticmethod
+    def _build_products(size: int) -> list[dict]:
+        """Товары страниц заглушки маркетплейса с уникальными id"""
+        config = FakeMarketplaceConfig(total=size, page_size=1000)
+        products = []
+        for page in range(1, (size + config.page_size - 1) // config.page_size + 1):
+            products.extend(build_search_page(config, "бенчмарк", page)["data"]["products"])
+        return products
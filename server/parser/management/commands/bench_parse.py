@@ -0,0 +1,103 @@
+import json
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.utils import override_settings
+
+from parser.benchmarking import run_parse_benchmark, temporary_database
+from parser.clients import close_http_client
+from parser.db_writer import close_db_writer
+from parser.fake_marketplace import FakeMarketplaceConfig, FakeMarketplaceServer
+from parser.lookup_cache import reset_first_page_cache
+from parser.throttling import reset_rate_limiter
+
+
+class Command(BaseCommand):
+    help = "Парсинг от загрузки до записи с локальной заглушкой маркетплейса (1, 10, 100 поисков)"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--scenarios", type=int, nargs="+", default=[1, 10, 100], help="Одновременных поисков"
+        )
+        parser.add_argument("--pages", type=int, default=10, help="Страниц по 100 товаров на поиск")
+        parser.add_argument("--latency", type=float, default=0.05, help="Задержка ответа заглушки, сек.")
+        parser.add_argument("--latency-jitter", type=float, default=0.02, help="Разброс задержки, сек.")
+        parser.add_argument("--error-rate", type=float, default=0.0, help="Доля ответов 503")
+        parser.add_argument(
+            "--server-rate-limit", type=float, help="Лимит заглушки, запросов/с (сверх - 429)"
+        )
+        parser.add_argument("--padding", type=int, default=0, help="Доп. байт на товар в ответе")
+        parser.add_argument(
+            "--client-rate-limit", type=float, default=1000.0,
+            help="RATE_LIMIT клиента (по умолчанию не ограничивает заглушку)",
+        )
+        parser.add_argument("--seed", type=int, default=1, help="Начальное значение случайных сбоев")
+        parser.add_argument("--output", help="Файл для результатов в JSON ('-' - stdout)")
+
+    def handle(self, *args, **options):
+        config = FakeMarketplaceConfig(
+            total=options["pages"] * 100,
+            page_size=100,
+            latency=options["latency"],
+            latency_jitter=options["latency_jitter"],
+            error_rate=options["error_rate"],
+            rate_limit=options["server_rate_limit"],
+            padding=options["padding"],
+            seed=options["seed"],
+        )
+        client_rate = options["client_rate_limit"]
+        scenarios = []
+
+        with temporary_database(), FakeMarketplaceServer(config) as server:
+            marketplace_settings = {
+                "SEARCH_URL": server.search_url,
+                "RATE_LIMIT": client_rate,
+                "RATE_LIMIT_MAX": client_rate,
+                "RATE_LIMIT_BURST": client_rate,
+            }
+            self.stdout.write(
+                f"{'поисков':>8}{'сек.':>8}{'стр./с':>9}{'строк/с':>10}"
+                f"{'p50, с':>9}{'p99, с':>9}{'не загр.':>9}{'503':>6}{'429':>6}{'RSS, МБ':>9}"
+            )
+            for searches in options["scenarios"]:
+                with override_settings(MARKETPLACE_PARSER=marketplace_settings):
+                    # Каждый сценарий начинается с нового клиента, лимита и кэша
+                    close_http_client()
+                    reset_rate_limiter()
+                    reset_first_page_cache()
+                    try:
+                        result = run_parse_benchmark(server, searches, prefix=f"бенчмарк {searches}")
+                    finally:
+                        close_http_client()
+                        close_db_writer()
+                scenarios.append(result)
+                self.stdout.write(
+                    f"{searches:>8}{result['elapsed_seconds']:>8.2f}{result['pages_per_second']:>9.1f}"
+                    f"{result['rows_per_second']:>10.0f}{result['job_p50_seconds']:>9.2f}"
+                    f"{result['job_p99_seconds']:>9.2f}{result['failed_pages']:>9}{result['server_errors']:>6}"
+                    f"{result['throttled']:>6}{result['peak_rss_mb']:>9.1f}"
+                )
+            vendor = connection.vendor
+
+        report = {
+            "benchmark": "parse",
+            "database": vendor,
+            "config": {
+                "pages": options["pages"],
+                "latency": options["latency"],
+                "latency_jitter": options["latency_jitter"],
+                "error_rate": options["error_rate"],
+                "server_rate_limit": options["server_rate_limit"],
+                "padding": options["padding"],
+                "client_rate_limit": client_rate,
+                "seed": options["seed"],
+            },
+            "scenarios": scenarios,
+        }
+        output = options["output"]
+        if output == "-":
+            self.stdout.write(json.dumps(report, ensure_ascii=False, indent=2))
+        elif output:
+            with open(output, "w", encoding="utf-8") as file:
+                json.dump(report, file, ensure_ascii=False, indent=2)
+            self.stdout.write(f"Результаты записаны в {output}")
@@ -0,0 +1,55 @@
+import time
+
+from django.core.management.base import BaseCommand
+from rest_framework.renderers import JSONRenderer
+
+from parser.benchmarking import percentile, seed_search_query, temporary_database
+from parser.models import ProductResultModel
+from parser.serializers import (
+    PRODUCT_RESULT_COLUMNS,
+    ProductResultSerializer,
+    serialize_product_rows,
+)
+
+
+class Command(BaseCommand):
+    help = "Сравнение ProductResultSerializer и быстрой сериализации страниц результатов"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--iterations", type=int, default=200, help="Повторов на замер")
+        parser.add_argument(
+            "--page-sizes", type=int, nargs="+", default=[10, 100], help="Размеры страниц"
+        )
+
+    def handle(self, *args, **options):
+        with temporary_database():
+            search_query = seed_search_query("бенчмарк сериализации", 1000)
+            queryset = (
+                ProductResultModel.objects.with_catalog()
+                .filter(search_query=search_query)
+                .order_by("-price", "-id")
+            )
+            renderer = JSONRenderer()
+
+            def drf_page(page_size):
+                return ProductResultSerializer(queryset[:page_size], many=True).data
+
+            def fast_page(page_size):
+                return serialize_product_rows(queryset.values(*PRODUCT_RESULT_COLUMNS)[:page_size])
+
+            self.stdout.write(f"{'page_size':>10}{'путь':>14}{'p50, мс':>10}{'p99, мс':>10}")
+            for page_size in options["page_sizes"]:
+                if renderer.render(drf_page(page_size)) != renderer.render(fast_page(page_size)):
+                    self.stderr.write(f"page_size={page_size}: JSON отличается")
+                    continue
+
+                for name, build_page in (("serializer", drf_page), ("fast path", fast_page)):
+                    timings = []
+                    for _ in range(options["iterations"]):
+                        started = time.perf_counter()
+                        renderer.render(build_page(page_size))
+                        timings.append((time.perf_counter() - started) * 1000)
+                    self.stdout.write(
+                        f"{page_size:>10}{name:>14}"
+                        f"{percentile(timings, 50):>10.3f}{percentile(timings, 99):>10.3f}"
+                    )
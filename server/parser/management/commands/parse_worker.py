@@ -0,0 +1,61 @@
+import signal
+
+from django.core.management.base import BaseCommand
+
+from parser.jobs import ParseWorker
+from parser.metrics import serve_metrics
+
+
+class Command(BaseCommand):
+    help = "Запуск воркера очереди заданий парсинга"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--concurrency",
+            type=int,
+            help="Количество одновременно выполняемых заданий (WORKER_CONCURRENCY)",
+        )
+        parser.add_argument(
+            "--poll-interval",
+            type=float,
+            help="Интервал опроса очереди в секундах (WORKER_POLL_INTERVAL)",
+        )
+        parser.add_argument(
+            "--metrics-port",
+            type=int,
+            help="Порт HTTP-сервера /metrics воркера (по умолчанию не запускается)",
+        )
+        parser.add_argument(
+            "--once",
+            action="store_true",
+            help="Выполнить доступные задания и завершиться",
+        )
+
+    def handle(self, *args, **options):
+        worker = ParseWorker(
+            concurrency=options["concurrency"],
+            poll_interval=options["poll_interval"],
+        )
+
+        # Корректное завершение: дожидаемся выполняющихся заданий
+        def handle_signal(signum, frame):
+            self.stdout.write("Остановка воркера, ожидание текущих заданий...")
+            worker.stop()
+
+        signal.signal(signal.SIGTERM, handle_signal)
+        signal.signal(signal.SIGINT, handle_signal)
+
+        metrics_server = None
+        if options["metrics_port"]:
+            metrics_server = serve_metrics(options["metrics_port"])
+            self.stdout.write(f"Метрики воркера: http://0.0.0.0:{options['metrics_port']}/metrics")
+
+        self.stdout.write(
+            f"Воркер {worker.worker_id} запущен, заданий одновременно: {worker.concurrency}"
+        )
+        try:
+            worker.run(once=options["once"])
+        finally:
+            if metrics_server is not None:
+                metrics_server.shutdown()
+        self.stdout.write("Воркер остановлен")
@@ -0,0 +1,687 @@
+import atexit
+import fcntl
+import functools
+import inspect
+import json
+import logging
+import math
+import os
+import secrets
+import socket
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Callable
+
+from .conf import parser_settings
+
+logger = logging.getLogger(__name__)
+
+# Тип содержимого текстового формата Prometheus
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Границы гистограмм длительности по умолчанию, сек.
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# Границы гистограмм количества строк и товаров в секунду
+SIZE_BUCKETS = (10, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 25000)
+# Снимок, не обновлявшийся столько интервалов записи (но не меньше
+# RETIRE_MIN_SECONDS), принадлежит остановленному процессу
+RETIRE_INTERVALS = 30
+RETIRE_MIN_SECONDS = 60.0
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+def _format_labels(names: tuple, values: tuple, extra: tuple = ()) -> str:
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+class Metric:
+    """
+    Метрика процесса с необязательными метками
+
+    Значения хранятся в памяти процесса, запись не обращается ни к БД,
+    ни к сети. Метка передается именованным аргументом: inc(reason="http_429").
+    Значения нескольких процессов объединяет MetricsRegistry (см. METRICS_DIR).
+    """
+
+    type = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = (),
+                 registry: "MetricsRegistry | None" = None):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values: dict[tuple, object] = {}
+        self._lock = threading.Lock()
+        self.registry = registry or REGISTRY
+        self.registry.register(self)
+
+    def _key(self, labels: dict) -> tuple:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"Метрика {self.name} ожидает метки {self.labelnames}")
+        self.registry.ensure_flusher()
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def current(self) -> dict:
+        """Значения процесса {кортеж значений меток: значение}"""
+        with self._lock:
+            return dict(self._values)
+
+    @staticmethod
+    def combine(value, other):
+        """Объединение значений одних меток из разных процессов"""
+        return value + other
+
+    def samples(self, values: dict | None = None):
+        """Пары (суффикс имени и метки, значение) для вывода"""
+        values = self.current() if values is None else values
+        for key, value in sorted(values.items()):
+            yield _format_labels(self.labelnames, key), value
+
+    def render(self, values: dict | None = None) -> str:
+        lines = [f"# HELP {self.name} {_escape(self.documentation)}", f"# TYPE {self.name} {self.type}"]
+        lines.extend(
+            f"{self.name}{suffix} {_format_value(value)}" for suffix, value in self.samples(values)
+        )
+        return "\n".join(lines)
+
+    def clear(self):
+        with self._lock:
+            self._values.clear()
+
+    def _after_fork(self):
+        # Дочерний процесс ведет свои значения: родительские уже в его снимке
+        self._lock = threading.Lock()
+        self._values = {}
+
+
+class Counter(Metric):
+    """Монотонно растущий счетчик"""
+
+    type = "counter"
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels) -> float:
+        with self._lock:
+            return self._values.get(self._key(labels), 0.0)
+
+
+class Gauge(Metric):
+    """
+    Текущее значение
+
+    С function значение вычисляется при каждом выводе метрик: так
+    отдаются счетчики, которые уже ведут другие объекты (очереди, кэши).
+    function возвращает число или словарь {кортеж значений меток: число}.
+    """
+
+    type = "gauge"
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = (),
+                 function: Callable | None = None, registry: "MetricsRegistry | None" = None):
+        super().__init__(name, documentation, labelnames, registry)
+        self.function = function
+
+    def set(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def dec(self, amount: float = 1.0, **labels):
+        self.inc(-amount, **labels)
+
+    def value(self, **labels) -> float:
+        with self._lock:
+            return self._values.get(self._key(labels), 0.0)
+
+    def current(self) -> dict:
+        if self.function is None:
+            return super().current()
+        value = self.function()
+        return dict(value) if isinstance(value, dict) else {(): value}
+
+
+class CounterFunction(Gauge):
+    """Счетчик, значение которого ведет другой объект (см. Gauge.function)"""
+
+    type = "counter"
+
+
+class Histogram(Metric):
+    """Распределение значений по накопительным корзинам"""
+
+    type = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = (),
+                 buckets: tuple = DEFAULT_BUCKETS, registry: "MetricsRegistry | None" = None):
+        super().__init__(name, documentation, labelnames, registry)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                # Счетчики по корзинам, сумма и количество наблюдений
+                state = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[0][index] += 1
+                    break
+            state[1] += value
+            state[2] += 1
+
+    def count(self, **labels) -> int:
+        with self._lock:
+            state = self._values.get(self._key(labels))
+            return state[2] if state else 0
+
+    @contextmanager
+    def time(self, **labels):
+        """Наблюдение длительности блока, сек."""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def current(self) -> dict:
+        with self._lock:
+            return {key: [[*counts], total, count] for key, (counts, total, count) in self._values.items()}
+
+    @staticmethod
+    def combine(value, other):
+        return [
+            [count + other_count for count, other_count in zip(value[0], other[0])],
+            value[1] + other[1],
+            value[2] + other[2],
+        ]
+
+    def samples(self, values: dict | None = None):
+        values = self.current() if values is None else values
+        for key, (counts, total, count) in sorted(values.items()):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                le = (("le", _format_value(bound)),)
+                yield "_bucket" + _format_labels(self.labelnames, key, le), cumulative
+            yield "_sum" + _format_labels(self.labelnames, key), total
+            yield "_count" + _format_labels(self.labelnames, key), count
+
+
+class MetricsRegistry:
+    """
+    Набор метрик, выводимый в текстовом формате Prometheus
+
+    Без METRICS_DIR выводятся значения процесса. С METRICS_DIR каждый
+    процесс (веб-воркеры gunicorn, воркер очереди) раз в METRICS_FLUSH_INTERVAL
+    секунд записывает снимок своих значений в файл <имя>-<хост>-<pid>-<токен>.json
+    общего каталога, а render суммирует снимки всех процессов: счетчики
+    и гистограммы не скачут между опросами разных воркеров и не сбрасываются
+    при их перезапуске. Случайный токен процесса не дает новому процессу
+    с тем же pid затереть снимок старого.
+
+    Текущие значения (Gauge) берутся только из снимков работающих процессов -
+    обновленных за последние три интервала записи. Снимки остановленных
+    процессов при чтении переносятся в общий файл <имя>.retired.json
+    (только счетчики и гистограммы) и удаляются.
+    """
+
+    def __init__(self, name: str = "default"):
+        """
+        Args:
+            name: Префикс файлов снимков: у разных наборов метрик свои файлы
+        """
+        self.name = name
+        self._metrics: dict[str, Metric] = {}
+        self._lock = threading.Lock()
+        self._flusher_started = False
+        self._token = secrets.token_hex(4)
+        os.register_at_fork(after_in_child=self._after_fork)
+
+    def register(self, metric: Metric):
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f"Метрика {metric.name} уже зарегистрирована")
+            self._metrics[metric.name] = metric
+
+    def _all(self) -> list[Metric]:
+        with self._lock:
+            return list(self._metrics.values())
+
+    def render(self) -> str:
+        directory = parser_settings("METRICS_DIR")
+        if not directory:
+            return "\n".join(metric.render() for metric in self._all()) + "\n"
+        self.write_snapshot(directory)
+        values = self.read_snapshots(directory)
+        return "\n".join(metric.render(values[metric.name]) for metric in self._all()) + "\n"
+
+    def snapshot(self) -> dict:
+        """Значения всех метрик процесса в виде, пригодном для JSON"""
+        return {
+            metric.name: [[list(key), value] for key, value in metric.current().items()]
+            for metric in self._all()
+        }
+
+    def snapshot_filename(self) -> str:
+        return f"{self.name}-{socket.gethostname()}-{os.getpid()}-{self._token}.json"
+
+    def write_snapshot(self, directory, filename: str | None = None) -> Path:
+        """
+        Запись снимка значений процесса в каталог метрик
+
+        Файл заменяется атомарно: читатели не видят частично записанный снимок.
+        """
+        path = Path(directory) / (filename or self.snapshot_filename())
+        self._write_atomic(path, self.snapshot())
+        return path
+
+    def read_snapshots(self, directory) -> dict[str, dict]:
+        """
+        Сумма снимков всех процессов
+
+        Перед суммированием снимки остановленных процессов переносятся
+        в общий файл (см. retire_snapshots).
+
+        Returns:
+            dict[str, dict]: Значения по метрикам {имя: {кортеж меток: значение}}
+        """
+        directory = Path(directory)
+        interval = parser_settings("METRICS_FLUSH_INTERVAL")
+        now = time.time()
+        self.retire_snapshots(directory, now - max(RETIRE_INTERVALS * interval, RETIRE_MIN_SECONDS))
+
+        values = {metric.name: {} for metric in self._all()}
+        retired = self._read_snapshot(directory / self.retired_filename())
+        if retired is not None:
+            self._merge(values, retired, gauges=False)
+        live_after = now - 3 * interval
+        for path in directory.glob(f"{self.name}-*.json"):
+            try:
+                live = path.stat().st_mtime >= live_after
+            except OSError:
+                # Файл перенесен другим процессом
+                continue
+            snapshot = self._read_snapshot(path)
+            if snapshot is not None:
+                self._merge(values, snapshot, gauges=live)
+        return values
+
+    def retired_filename(self) -> str:
+        return f"{self.name}.retired.json"
+
+    def retire_snapshots(self, directory, before: float) -> int:
+        """
+        Перенос снимков, не обновлявшихся с момента before, в общий файл
+
+        Счетчики и гистограммы остановленных процессов прибавляются
+        к <имя>.retired.json, значения Gauge отбрасываются, а сами снимки
+        удаляются: каталог не растет с перезапусками процессов. Перенос
+        выполняется под блокировкой каталога, чтобы снимок не учли дважды
+        процессы, одновременно отдающие /metrics.
+
+        Returns:
+            int: Количество перенесенных снимков
+        """
+        directory = Path(directory)
+        if not any(self._modified_before(path, before) for path in directory.glob(f"{self.name}-*.json")):
+            return 0
+        with open(directory / f".{self.name}.lock", "a") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            # Под блокировкой: другой процесс мог уже перенести эти снимки
+            stale = [path for path in directory.glob(f"{self.name}-*.json")
+                     if self._modified_before(path, before)]
+            if not stale:
+                return 0
+            retired_path = directory / self.retired_filename()
+            values = {metric.name: {} for metric in self._all()}
+            retired = self._read_snapshot(retired_path)
+            if retired is not None:
+                self._merge(values, retired, gauges=False)
+            for path in stale:
+                snapshot = self._read_snapshot(path)
+                if snapshot is not None:
+                    self._merge(values, snapshot, gauges=False)
+            self._write_atomic(retired_path, {
+                name: [[list(key), value] for key, value in items.items()]
+                for name, items in values.items() if items
+            })
+            for path in stale:
+                path.unlink(missing_ok=True)
+        return len(stale)
+
+    def _merge(self, values: dict[str, dict], snapshot: dict, gauges: bool):
+        """Прибавление снимка к values; gauges - учитывать ли значения Gauge"""
+        metrics = {metric.name: metric for metric in self._all()}
+        for name, items in snapshot.items():
+            metric = metrics.get(name)
+            if metric is None or (metric.type == "gauge" and not gauges):
+                continue
+            merged = values[name]
+            for key, value in items:
+                key = tuple(key)
+                merged[key] = metric.combine(merged[key], value) if key in merged else value
+
+    @staticmethod
+    def _read_snapshot(path: Path) -> dict | None:
+        try:
+            return json.loads(path.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            # Файл удален или заменяется в этот момент
+            return None
+
+    @staticmethod
+    def _modified_before(path: Path, before: float) -> bool:
+        try:
+            return path.stat().st_mtime < before
+        except OSError:
+            return False
+
+    @staticmethod
+    def _write_atomic(path: Path, data: dict):
+        """Запись JSON с атомарной заменой: читатели не видят частично записанный файл"""
+        path.parent.mkdir(parents=True, exist_ok=True)
+        temporary = path.with_name(f".{path.name}.tmp")
+        temporary.write_text(json.dumps(data), encoding="utf-8")
+        os.replace(temporary, path)
+
+    def flush(self):
+        """Запись снимка процесса, если задан METRICS_DIR"""
+        directory = parser_settings("METRICS_DIR")
+        if directory:
+            self.write_snapshot(directory)
+
+    def ensure_flusher(self):
+        """
+        Запуск фоновой записи снимков при первом изменении метрик процесса
+
+        Без METRICS_DIR снимки не пишутся, и поток не запускается.
+        """
+        if self._flusher_started or not parser_settings("METRICS_DIR"):
+            return
+        with self._lock:
+            if self._flusher_started:
+                return
+            self._flusher_started = True
+        threading.Thread(target=self._flush_loop, daemon=True).start()
+        atexit.register(self._flush_quietly)
+
+    def _flush_loop(self):
+        while True:
+            time.sleep(parser_settings("METRICS_FLUSH_INTERVAL"))
+            self._flush_quietly()
+
+    def _flush_quietly(self):
+        try:
+            self.flush()
+        except Exception:
+            logger.exception("Не удалось записать снимок метрик")
+
+    def _after_fork(self):
+        # Поток записи не переживает fork: дочерний процесс запускает свой
+        self._lock = threading.Lock()
+        self._flusher_started = False
+        self._token = secrets.token_hex(4)
+        for metric in self._metrics.values():
+            metric._after_fork()
+
+    def clear(self):
+        """Сброс значений всех метрик (например, между тестами)"""
+        for metric in self._all():
+            metric.clear()
+
+
+REGISTRY = MetricsRegistry("parser")
+
+
+def _pool_stats() -> dict:
+    # Импорт внутри функции: сервис парсинга сам пишет метрики
+    from . import services
+
+    pool = services._parse_pool
+    return {
+        "queue_depth": pool.queue_depth if pool is not None else 0,
+        "active": pool.active if pool is not None else 0,
+    }
+
+
+def _rate_limiter_throttled() -> int:
+    from . import throttling
+
+    limiter = throttling._limiter
+    return limiter.throttled_count if limiter is not None else 0
+
+
+def _first_page_cache_lookups() -> dict:
+    from . import lookup_cache
+
+    cache = lookup_cache._first_page_cache
+    if cache is None:
+        return {("hit",): 0, ("miss",): 0}
+    return {("hit",): cache.hits, ("miss",): cache.misses}
+
+
+def _worker_jobs() -> dict:
+    from .jobs import get_worker_jobs
+
+    return {(state,): count for state, count in get_worker_jobs().items()}
+
+
+def _pipeline_queue_depths() -> dict:
+    from .pipeline import get_queue_depths
+
+    return {(name,): depth for name, depth in get_queue_depths().items()}
+
+
+def _pipeline_products() -> dict:
+    from .pipeline import get_pipeline_totals
+
+    return {(stage,): stats["products"] for stage, stats in get_pipeline_totals().items()}
+
+
+FETCH_SECONDS = Histogram(
+    "parser_fetch_seconds",
+    "Загрузка страницы выдачи маркетплейса вместе с повторами, сек.",
+    ("engine",),
+)
+PAGE_FAILURES = Counter(
+    "parser_page_failures_total",
+    "Страницы, не загруженные после всех повторов, по причине",
+    ("reason",),
+)
+PRODUCTS_PER_SECOND = Histogram(
+    "parser_products_per_second",
+    "Товаров в секунду за парсинг (от начала задания до записи последней страницы)",
+    ("engine",),
+    buckets=SIZE_BUCKETS,
+)
+DB_INSERT_SECONDS = Histogram(
+    "parser_db_insert_seconds",
+    "Запись пакета товаров вместе с каталогом (bulk_create или COPY), сек.",
+    ("backend",),
+)
+DB_INSERT_BATCH_ROWS = Histogram(
+    "parser_db_insert_batch_rows",
+    "Размер пакета записи товаров, строк",
+    ("backend",),
+    buckets=SIZE_BUCKETS,
+)
+ACTIVE_PARSE_JOBS = Gauge(
+    "parser_active_parse_jobs",
+    "Выполняющиеся парсинги процесса",
+    ("engine",),
+)
+PARSE_POOL_QUEUE_DEPTH = Gauge(
+    "parser_pool_queue_depth",
+    "Парсинги, ожидающие свободного потока общего пула (INLINE_CONCURRENCY)",
+    function=lambda: _pool_stats()["queue_depth"],
+)
+PARSE_POOL_ACTIVE = Gauge(
+    "parser_pool_active_threads",
+    "Занятые потоки общего пула парсинга",
+    function=lambda: _pool_stats()["active"],
+)
+WORKER_JOBS = Gauge(
+    "parser_worker_jobs",
+    "Задания воркера очереди: ожидающие потока его пула (queued) и выполняющиеся (running)",
+    ("state",),
+    function=_worker_jobs,
+)
+PIPELINE_QUEUE_DEPTH = Gauge(
+    "parser_pipeline_queue_depth",
+    "Элементы в очередях между стадиями выполняющихся конвейеров (fetched - к transform, "
+    "transformed - к записи)",
+    ("queue",),
+    function=_pipeline_queue_depths,
+)
+RATE_LIMITED = CounterFunction(
+    "parser_rate_limited_total",
+    "Ответы 429/503, снизившие общий лимит запросов процесса",
+    function=_rate_limiter_throttled,
+)
+FIRST_PAGE_CACHE_LOOKUPS = CounterFunction(
+    "parser_first_page_cache_lookups_total",
+    "Обращения к кэшу первых страниц выдачи по результату",
+    ("result",),
+    function=_first_page_cache_lookups,
+)
+PIPELINE_PRODUCTS = CounterFunction(
+    "parser_pipeline_products_total",
+    "Товары, прошедшие стадию конвейера парсинга",
+    ("stage",),
+    function=_pipeline_products,
+)
+RESULT_SECONDS = Histogram(
+    "api_products_result_seconds",
+    "Ответ GET /api/products/result/ по сортировке, сек.",
+    ("sort",),
+)
+
+
+def record_fetch(engine: str, seconds: float, response=None, failed: bool = False):
+    """
+    Учет загрузки страницы выдачи
+
+    Args:
+        engine: Движок парсинга (threads или asyncio)
+        seconds: Длительность загрузки с повторами
+        response: Последний ответ маркетплейса (None - сетевая ошибка)
+        failed: Страница не загружена (пустая выдача ошибкой не считается)
+    """
+    FETCH_SECONDS.observe(seconds, engine=engine)
+    if not failed:
+        return
+    if response is None:
+        reason = "network"
+    elif response.status_code != 200:
+        reason = f"http_{response.status_code}"
+    else:
+        reason = "decode"
+    PAGE_FAILURES.inc(reason=reason)
+
+
+def record_insert(backend: str, rows: int, seconds: float):
+    """Учет записи пакета товаров"""
+    DB_INSERT_SECONDS.observe(seconds, backend=backend)
+    DB_INSERT_BATCH_ROWS.observe(rows, backend=backend)
+
+
+def track_parse_job(engine: str):
+    """
+    Декоратор парсинга: учет выполняющихся заданий и товаров в секунду
+
+    Обернутая функция (обычная или сопрограмма) возвращает количество
+    записанных товаров; парсинги без товаров в скорость не попадают.
+    """
+
+    def observe(started: float, products):
+        seconds = time.perf_counter() - started
+        if products and seconds > 0:
+            PRODUCTS_PER_SECOND.observe(products / seconds, engine=engine)
+
+    def decorator(fn):
+        if inspect.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def async_wrapper(*args, **kwargs):
+                ACTIVE_PARSE_JOBS.inc(engine=engine)
+                started = time.perf_counter()
+                try:
+                    products = await fn(*args, **kwargs)
+                finally:
+                    ACTIVE_PARSE_JOBS.dec(engine=engine)
+                observe(started, products)
+                return products
+
+            return async_wrapper
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            ACTIVE_PARSE_JOBS.inc(engine=engine)
+            started = time.perf_counter()
+            try:
+                products = fn(*args, **kwargs)
+            finally:
+                ACTIVE_PARSE_JOBS.dec(engine=engine)
+            observe(started, products)
+            return products
+
+        return wrapper
+
+    return decorator
+
+
+def render_metrics() -> str:
+    """Метрики процесса в текстовом формате Prometheus"""
+    return REGISTRY.render()
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = render_metrics().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", CONTENT_TYPE)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve_metrics(port: int, host: str = "0.0.0.0") -> ThreadingHTTPServer:
+    """
+    HTTP-сервер /metrics в фоновом потоке
+
+    Нужен процессам без веб-сервера (воркер очереди), если METRICS_DIR
+    не задан: тогда /metrics веб-приложения не видит парсинги воркера.
+    """
+    server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
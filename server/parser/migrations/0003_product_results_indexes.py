@@ -0,0 +1,92 @@
+# Generated by Django 5.2.18 on 2026-10-17 19:08
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Min
+
+
+def remove_duplicate_results(apps, schema_editor):
+    """Удаление дублей (search_query, external_id) перед созданием ограничения"""
+    ProductResultModel = apps.get_model("parser", "ProductResultModel")
+    keep_ids = (
+        ProductResultModel.objects.values("search_query_id", "external_id")
+        .annotate(min_id=Min("id"))
+        .values("min_id")
+    )
+    ProductResultModel.objects.exclude(id__in=keep_ids).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("parser", "0002_parse_jobs"),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicate_results, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name="productresultmodel",
+            name="search_query",
+            field=models.ForeignKey(
+                db_index=False,
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="results",
+                to="parser.searchquerymodel",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="productresultmodel",
+            index=models.Index(fields=["search_query", "id"], name="pr_query_id_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="productresultmodel",
+            index=models.Index(
+                fields=["search_query", "name", "id"], name="pr_query_name_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="productresultmodel",
+            index=models.Index(
+                fields=["search_query", "brand", "id"], name="pr_query_brand_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="productresultmodel",
+            index=models.Index(
+                fields=["search_query", "supplier", "id"], name="pr_query_supplier_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="productresultmodel",
+            index=models.Index(
+                fields=["search_query", "supplier_rating", "id"],
+                name="pr_query_supp_rating_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="productresultmodel",
+            index=models.Index(
+                fields=["search_query", "review_rating", "id"],
+                name="pr_query_rev_rating_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="productresultmodel",
+            index=models.Index(
+                fields=["search_query", "feedbacks", "id"],
+                name="pr_query_feedbacks_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="productresultmodel",
+            index=models.Index(
+                fields=["search_query", "price", "id"], name="pr_query_price_idx"
+            ),
+        ),
+        migrations.AddConstraint(
+            model_name="productresultmodel",
+            constraint=models.UniqueConstraint(
+                fields=("search_query", "external_id"), name="pr_query_external_id_uniq"
+            ),
+        ),
+    ]
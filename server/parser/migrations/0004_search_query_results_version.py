@@ -0,0 +1,20 @@
+# Generated by Django 5.2.18 on 2026-10-17 19:11
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("parser", "0003_product_results_indexes"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="searchquerymodel",
+            name="results_version",
+            field=models.PositiveIntegerField(
+                default=0, verbose_name="Версия результатов"
+            ),
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 5.2.18 on 2026-10-17 19:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("parser", "0004_search_query_results_version"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="searchquerymodel",
+            name="deep_crawl",
+            field=models.BooleanField(default=False, verbose_name="Глубокий обход"),
+        ),
+        migrations.AddField(
+            model_name="searchquerymodel",
+            name="max_pages",
+            field=models.PositiveIntegerField(
+                blank=True, null=True, verbose_name="Предел страниц глубокого обхода"
+            ),
+        ),
+    ]
@@ -0,0 +1,82 @@
+# Generated by Django 5.2.18 on 2026-10-17 19:38
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("parser", "0005_search_query_deep_crawl"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ParsePageModel",
+            fields=[
+                (
+                    "id",
+                    models.AutoField(
+                        primary_key=True, serialize=False, verbose_name="ID"
+                    ),
+                ),
+                ("page", models.PositiveIntegerField(verbose_name="Номер страницы")),
+                (
+                    "status",
+                    models.CharField(
+                        choices=[
+                            ("done", "Загружена и сохранена"),
+                            ("failed", "Ошибка загрузки"),
+                        ],
+                        max_length=16,
+                        verbose_name="Статус",
+                    ),
+                ),
+                (
+                    "products_count",
+                    models.PositiveIntegerField(
+                        default=0, verbose_name="Количество товаров"
+                    ),
+                ),
+                (
+                    "reported_total",
+                    models.IntegerField(
+                        default=0, verbose_name="Количество результатов поиска"
+                    ),
+                ),
+                (
+                    "fingerprint",
+                    models.BigIntegerField(
+                        blank=True, null=True, verbose_name="Отпечаток страницы"
+                    ),
+                ),
+                (
+                    "error",
+                    models.TextField(blank=True, default="", verbose_name="Ошибка"),
+                ),
+                (
+                    "updated_at",
+                    models.DateTimeField(auto_now=True, verbose_name="Дата обновления"),
+                ),
+                (
+                    "search_query",
+                    models.ForeignKey(
+                        db_index=False,
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="pages",
+                        to="parser.searchquerymodel",
+                    ),
+                ),
+            ],
+            options={
+                "db_table": "parse_pages",
+                "ordering": ["search_query", "page"],
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("search_query", "page"),
+                        name="parse_pages_query_page_uniq",
+                    )
+                ],
+            },
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 5.2.18 on 2026-10-17 19:42
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("parser", "0006_parse_pages"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="parsejobmodel",
+            name="kind",
+            field=models.CharField(
+                choices=[("parse", "Парсинг"), ("refresh", "Обновление")],
+                default="parse",
+                max_length=16,
+                verbose_name="Тип задания",
+            ),
+        ),
+        migrations.AddField(
+            model_name="productresultmodel",
+            name="removed_at",
+            field=models.DateTimeField(
+                blank=True, null=True, verbose_name="Дата удаления из выдачи"
+            ),
+        ),
+    ]
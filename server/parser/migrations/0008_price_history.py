@@ -0,0 +1,52 @@
+# Generated by Django 5.2.18 on 2026-10-17 19:44
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("parser", "0007_product_refresh"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="PriceHistoryModel",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        primary_key=True, serialize=False, verbose_name="ID"
+                    ),
+                ),
+                ("observed_at", models.DateTimeField(verbose_name="Время наблюдения")),
+                ("price", models.BigIntegerField(verbose_name="Цена")),
+                ("feedbacks", models.IntegerField(verbose_name="Количество отзывов")),
+                (
+                    "supplier_rating",
+                    models.FloatField(verbose_name="Рейтинг поставщика"),
+                ),
+                ("review_rating", models.FloatField(verbose_name="Рейтинг отзывов")),
+                (
+                    "product",
+                    models.ForeignKey(
+                        db_index=False,
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="history",
+                        to="parser.productresultmodel",
+                    ),
+                ),
+            ],
+            options={
+                "db_table": "price_history",
+                "ordering": ["product", "observed_at"],
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("product", "observed_at"),
+                        name="price_history_product_time_uniq",
+                    )
+                ],
+            },
+        ),
+    ]
@@ -0,0 +1,229 @@
+# Generated by Django 5.2.18 on 2026-10-17 19:49
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+# Строк результатов, читаемых за одну выборку при переносе в каталог
+CHUNK_SIZE = 2000
+
+
+def fill_catalog(apps, schema_editor):
+    """
+    Перенос названий, брендов и поставщиков результатов в каталог
+
+    Результаты читаются пакетами по CHUNK_SIZE строк, в памяти
+    одновременно только один пакет.
+    """
+    BrandModel = apps.get_model("parser", "BrandModel")
+    SupplierModel = apps.get_model("parser", "SupplierModel")
+    ProductModel = apps.get_model("parser", "ProductModel")
+    ProductResultModel = apps.get_model("parser", "ProductResultModel")
+
+    # Для товара из нескольких запросов берутся значения последнего результата:
+    # строки идут от новых к старым, а записанный товар не перезаписывается
+    rows = ProductResultModel.objects.order_by("-id").values_list(
+        "external_id", "name", "brand", "supplier"
+    )
+    chunk = []
+    for row in rows.iterator(chunk_size=CHUNK_SIZE):
+        chunk.append(row)
+        if len(chunk) == CHUNK_SIZE:
+            _save_products(BrandModel, SupplierModel, ProductModel, chunk)
+            chunk = []
+    if chunk:
+        _save_products(BrandModel, SupplierModel, ProductModel, chunk)
+    ProductResultModel.objects.update(product_id=models.F("external_id"))
+
+
+def _save_products(BrandModel, SupplierModel, ProductModel, rows):
+    """Запись пакета товаров и их брендов и поставщиков в каталог"""
+    products = {}
+    for external_id, name, brand, supplier in rows:
+        products.setdefault(external_id, (name, brand, supplier))
+
+    brands = {brand for _, brand, _ in products.values()}
+    suppliers = {supplier for _, _, supplier in products.values()}
+    BrandModel.objects.bulk_create(
+        [BrandModel(name=name) for name in brands], ignore_conflicts=True
+    )
+    SupplierModel.objects.bulk_create(
+        [SupplierModel(name=name) for name in suppliers], ignore_conflicts=True
+    )
+    brand_ids = dict(
+        BrandModel.objects.filter(name__in=brands).values_list("name", "id")
+    )
+    supplier_ids = dict(
+        SupplierModel.objects.filter(name__in=suppliers).values_list("name", "id")
+    )
+
+    ProductModel.objects.bulk_create(
+        [
+            ProductModel(
+                external_id=external_id,
+                name=name,
+                brand_id=brand_ids[brand],
+                supplier_id=supplier_ids[supplier],
+            )
+            for external_id, (name, brand, supplier) in products.items()
+        ],
+        batch_size=500,
+        ignore_conflicts=True,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("parser", "0008_price_history"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="BrandModel",
+            fields=[
+                (
+                    "id",
+                    models.AutoField(
+                        primary_key=True, serialize=False, verbose_name="ID"
+                    ),
+                ),
+                (
+                    "name",
+                    models.CharField(
+                        max_length=255, unique=True, verbose_name="Название бренда"
+                    ),
+                ),
+            ],
+            options={
+                "db_table": "brands",
+                "ordering": ["name"],
+            },
+        ),
+        migrations.CreateModel(
+            name="SupplierModel",
+            fields=[
+                (
+                    "id",
+                    models.AutoField(
+                        primary_key=True, serialize=False, verbose_name="ID"
+                    ),
+                ),
+                (
+                    "name",
+                    models.CharField(
+                        max_length=255, unique=True, verbose_name="Название поставщика"
+                    ),
+                ),
+            ],
+            options={
+                "db_table": "suppliers",
+                "ordering": ["name"],
+            },
+        ),
+        migrations.CreateModel(
+            name="ProductModel",
+            fields=[
+                (
+                    "external_id",
+                    models.BigIntegerField(
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="Внешний ID товара",
+                    ),
+                ),
+                (
+                    "name",
+                    models.CharField(max_length=255, verbose_name="Название товара"),
+                ),
+                (
+                    "brand",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.PROTECT,
+                        related_name="products",
+                        to="parser.brandmodel",
+                        verbose_name="Бренд",
+                    ),
+                ),
+                (
+                    "supplier",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.PROTECT,
+                        related_name="products",
+                        to="parser.suppliermodel",
+                        verbose_name="Поставщик",
+                    ),
+                ),
+            ],
+            options={
+                "db_table": "products",
+                "ordering": ["external_id"],
+            },
+        ),
+        migrations.AddField(
+            model_name="productresultmodel",
+            name="product",
+            field=models.ForeignKey(
+                db_index=False,
+                null=True,
+                on_delete=django.db.models.deletion.PROTECT,
+                related_name="results",
+                to="parser.productmodel",
+            ),
+        ),
+        migrations.AddField(
+            model_name="productresultmodel",
+            name="position",
+            field=models.PositiveIntegerField(
+                default=0, verbose_name="Позиция в выдаче"
+            ),
+        ),
+        migrations.RunPython(fill_catalog, migrations.RunPython.noop),
+        migrations.RemoveConstraint(
+            model_name="productresultmodel",
+            name="pr_query_external_id_uniq",
+        ),
+        migrations.RemoveIndex(
+            model_name="productresultmodel",
+            name="pr_query_name_idx",
+        ),
+        migrations.RemoveIndex(
+            model_name="productresultmodel",
+            name="pr_query_brand_idx",
+        ),
+        migrations.RemoveIndex(
+            model_name="productresultmodel",
+            name="pr_query_supplier_idx",
+        ),
+        migrations.RemoveField(
+            model_name="productresultmodel",
+            name="brand",
+        ),
+        migrations.RemoveField(
+            model_name="productresultmodel",
+            name="external_id",
+        ),
+        migrations.RemoveField(
+            model_name="productresultmodel",
+            name="name",
+        ),
+        migrations.RemoveField(
+            model_name="productresultmodel",
+            name="supplier",
+        ),
+        migrations.AlterField(
+            model_name="productresultmodel",
+            name="product",
+            field=models.ForeignKey(
+                db_index=False,
+                on_delete=django.db.models.deletion.PROTECT,
+                related_name="results",
+                to="parser.productmodel",
+            ),
+        ),
+        migrations.AddConstraint(
+            model_name="productresultmodel",
+            constraint=models.UniqueConstraint(
+                fields=("search_query", "product"), name="pr_query_product_uniq"
+            ),
+        ),
+    ]
@@ -0,0 +1,36 @@
+from django.db import migrations
+from django.db.models import Count, F, Q
+
+
+def recount_total_results(apps, schema_editor):
+    """
+    Пересчет total_results завершенных запросов по сохраненным товарам
+
+    Пагинация завершенного запроса берет количество из total_results,
+    а 0003 удалила дубли без пересчета: такие запросы сообщали больше
+    страниц, чем есть строк. Версия результатов увеличивается, чтобы
+    закэшированные страницы с неверным count не отдавались.
+    """
+    SearchQueryModel = apps.get_model("parser", "SearchQueryModel")
+    queries = SearchQueryModel.objects.filter(is_completed=True).annotate(
+        active_count=Count("results", filter=Q(results__removed_at__isnull=True))
+    )
+    for query_id, total_results, active_count in queries.values_list(
+        "id", "total_results", "active_count"
+    ).iterator():
+        if total_results != active_count:
+            SearchQueryModel.objects.filter(id=query_id).update(
+                total_results=active_count,
+                results_version=F("results_version") + 1,
+            )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("parser", "0009_product_catalog"),
+    ]
+
+    operations = [
+        migrations.RunPython(recount_total_results, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,107 @@
+# Generated by Django 5.2.18 on 2026-10-17 20:23
+
+from django.db import migrations, models
+from django.db.models import Max, OuterRef, Subquery
+
+# Строк результатов, обновляемых одним пакетом при заполнении позиций
+CHUNK_SIZE = 2000
+
+
+def copy_catalog_values(apps, schema_editor):
+    """Копирование названия, бренда и поставщика из каталога в результаты"""
+    ProductModel = apps.get_model("parser", "ProductModel")
+    ProductResultModel = apps.get_model("parser", "ProductResultModel")
+    products = ProductModel.objects.filter(external_id=OuterRef("product_id"))
+    # Один UPDATE с подзапросами: строки не загружаются в память
+    ProductResultModel.objects.update(
+        name=Subquery(products.values("name")[:1]),
+        brand=Subquery(products.values("brand__name")[:1]),
+        supplier=Subquery(products.values("supplier__name")[:1]),
+    )
+
+
+def fill_positions(apps, schema_editor):
+    """
+    Позиции результатов, сохраненных до появления поля position
+
+    Такие строки записаны в порядке выдачи, поэтому нумеруются по id
+    после уже известных позиций запроса.
+    """
+    ProductResultModel = apps.get_model("parser", "ProductResultModel")
+    query_ids = (
+        ProductResultModel.objects.filter(position=0)
+        .order_by()
+        .values_list("search_query_id", flat=True)
+        .distinct()
+    )
+    for query_id in list(query_ids):
+        results = ProductResultModel.objects.filter(search_query_id=query_id)
+        position = results.aggregate(last=Max("position"))["last"] or 0
+        last_id = 0
+        while True:
+            # Пакеты по id: строки не перечитываются после обновления
+            ids = list(
+                results.filter(position=0, id__gt=last_id)
+                .order_by("id")
+                .values_list("id", flat=True)[:CHUNK_SIZE]
+            )
+            if not ids:
+                break
+            batch = []
+            for result_id in ids:
+                position += 1
+                batch.append(ProductResultModel(id=result_id, position=position))
+            ProductResultModel.objects.bulk_update(batch, ["position"])
+            last_id = ids[-1]
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("parser", "0010_recount_total_results"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="productresultmodel",
+            name="brand",
+            field=models.CharField(default="", max_length=255, verbose_name="Бренд"),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name="productresultmodel",
+            name="name",
+            field=models.CharField(
+                default="", max_length=255, verbose_name="Название товара"
+            ),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name="productresultmodel",
+            name="supplier",
+            field=models.CharField(
+                default="", max_length=255, verbose_name="Поставщик"
+            ),
+            preserve_default=False,
+        ),
+        migrations.RunPython(copy_catalog_values, migrations.RunPython.noop),
+        migrations.RunPython(fill_positions, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name="productresultmodel",
+            index=models.Index(
+                fields=["search_query", "name", "id"], name="pr_query_name_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="productresultmodel",
+            index=models.Index(
+                fields=["search_query", "brand", "id"], name="pr_query_brand_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="productresultmodel",
+            index=models.Index(
+                fields=["search_query", "supplier", "id"], name="pr_query_supplier_idx"
+            ),
+        ),
+    ]
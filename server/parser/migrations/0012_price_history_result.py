@@ -0,0 +1,32 @@
+# Generated by Django 5.2.18 on 2026-10-17 20:36
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("parser", "0011_product_result_sort_columns"),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name="pricehistorymodel",
+            options={"ordering": ["result", "observed_at"]},
+        ),
+        migrations.RemoveConstraint(
+            model_name="pricehistorymodel",
+            name="price_history_product_time_uniq",
+        ),
+        migrations.RenameField(
+            model_name="pricehistorymodel",
+            old_name="product",
+            new_name="result",
+        ),
+        migrations.AddConstraint(
+            model_name="pricehistorymodel",
+            constraint=models.UniqueConstraint(
+                fields=("result", "observed_at"), name="price_history_result_time_uniq"
+            ),
+        ),
+    ]
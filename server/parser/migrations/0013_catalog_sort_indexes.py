@@ -0,0 +1,43 @@
+# Generated by Django 5.2.18 on 2026-10-17 21:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("parser", "0012_price_history_result"),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name="productresultmodel",
+            name="pr_query_name_idx",
+        ),
+        migrations.RemoveIndex(
+            model_name="productresultmodel",
+            name="pr_query_brand_idx",
+        ),
+        migrations.RemoveIndex(
+            model_name="productresultmodel",
+            name="pr_query_supplier_idx",
+        ),
+        migrations.RemoveField(
+            model_name="productresultmodel",
+            name="brand",
+        ),
+        migrations.RemoveField(
+            model_name="productresultmodel",
+            name="name",
+        ),
+        migrations.RemoveField(
+            model_name="productresultmodel",
+            name="supplier",
+        ),
+        migrations.AddIndex(
+            model_name="productmodel",
+            index=models.Index(
+                fields=["name", "external_id"], name="products_name_idx"
+            ),
+        ),
+    ]
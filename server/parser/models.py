@@ -1,4 +1,6 @@
 from django.db import models
+from django.db.models import F
+from django.utils import timezone
 
 
 class SearchQueryModel(models.Model):
@@ -8,6 +10,13 @@ class SearchQueryModel(models.Model):
     created_at = models.DateTimeField(auto_now_add=True, verbose_name="Дата создания")
     is_completed = models.BooleanField(default=False, verbose_name="Завершен ли парсинг")
     total_results = models.IntegerField(default=0, verbose_name="Общее количество результатов")
+    # Увеличивается при каждом изменении результатов (входит в ключ кэша страниц и ETag)
+    results_version = models.PositiveIntegerField(default=0, verbose_name="Версия результатов")
+    # Глубокий обход: все страницы выдачи, а не только первые MAX_PAGES
+    deep_crawl = models.BooleanField(default=False, verbose_name="Глубокий обход")
+    max_pages = models.PositiveIntegerField(
+        null=True, blank=True, verbose_name="Предел страниц глубокого обхода"
+    )
 
     class Meta:
         db_table = 'search_queries'
@@ -17,29 +26,268 @@ class SearchQueryModel(models.Model):
         return f"{self.query_text} ({self.created_at.strftime('%d.%m.%Y %H:%M')})"
 
 
+class BrandModel(models.Model):
+    """Справочник брендов каталога"""
+    id = models.AutoField(primary_key=True, verbose_name="ID")
+    name = models.CharField(max_length=255, unique=True, verbose_name="Название бренда")
+
+    class Meta:
+        db_table = 'brands'
+        ordering = ['name']
+
+    def __str__(self):
+        return self.name
+
+
+class SupplierModel(models.Model):
+    """Справочник поставщиков каталога"""
+    id = models.AutoField(primary_key=True, verbose_name="ID")
+    name = models.CharField(max_length=255, unique=True, verbose_name="Название поставщика")
+
+    class Meta:
+        db_table = 'suppliers'
+        ordering = ['name']
+
+    def __str__(self):
+        return self.name
+
+
+class ProductModel(models.Model):
+    """
+    Модель каталога товаров маркетплейса
+
+    Один товар хранится один раз, сколько бы запросов его ни нашли:
+    результаты запросов (ProductResultModel) ссылаются на него по external_id.
+    """
+    # Внешний ID товара служит первичным ключом: ссылку на товар можно
+    # построить без поиска его строки в каталоге
+    external_id = models.BigIntegerField(primary_key=True, verbose_name="Внешний ID товара")
+    name = models.CharField(max_length=255, verbose_name="Название товара")
+    brand = models.ForeignKey(
+        BrandModel, on_delete=models.PROTECT, related_name='products', verbose_name="Бренд"
+    )
+    supplier = models.ForeignKey(
+        SupplierModel, on_delete=models.PROTECT, related_name='products', verbose_name="Поставщик"
+    )
+
+    class Meta:
+        db_table = 'products'
+        ordering = ['external_id']
+        # Название для сортировки результатов через JOIN с каталогом
+        # (бренд и поставщик - уникальные индексы справочников)
+        indexes = [
+            models.Index(fields=['name', 'external_id'], name='products_name_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.external_id} - {self.name}"
+
+
+class ProductResultQuerySet(models.QuerySet):
+    """Запросы к результатам парсинга"""
+
+    def active(self):
+        """Товары последней выдачи: без отмеченных удаленными при обновлении"""
+        return self.filter(removed_at__isnull=True)
+
+    def with_catalog(self):
+        """
+        Результаты с полями товара из каталога
+
+        Аннотации называются так же, как поля ответа API, поэтому
+        по ним работают сортировка, курсорная пагинация и values().
+        """
+        return self.annotate(
+            external_id=F('product_id'),
+            name=F('product__name'),
+            brand=F('product__brand__name'),
+            supplier=F('product__supplier__name'),
+        )
+
+
 class ProductResultModel(models.Model):
-    """Модель для хранения результатов парсинга товаров"""
+    """
+    Модель результата парсинга: товар каталога в выдаче поискового запроса
+
+    Название, бренд и поставщик хранятся только в каталоге (ProductModel),
+    здесь - позиция и значения, наблюдавшиеся при парсинге запроса
+    (по ним ведется история).
+    """
     id = models.AutoField(primary_key=True, verbose_name="ID")
     search_query = models.ForeignKey(
         SearchQueryModel, 
         on_delete=models.CASCADE,
-        related_name='results'
+        related_name='results',
+        # Покрывается составными индексами, начинающимися с search_query
+        db_index=False,
+    )
+    product = models.ForeignKey(
+        ProductModel,
+        on_delete=models.PROTECT,
+        related_name='results',
+        # Результаты по товару не выбираются: индекс только замедлял бы запись
+        db_index=False,
     )
 
-    external_id = models.BigIntegerField(verbose_name="Внешний ID товара")
-    name = models.CharField(max_length=255, verbose_name="Название товара")
-    brand = models.CharField(max_length=255, verbose_name="Бренд")
-    supplier = models.CharField(max_length=255, verbose_name="Поставщик")
+    position = models.PositiveIntegerField(default=0, verbose_name="Позиция в выдаче")
     supplier_rating = models.FloatField(verbose_name="Рейтинг поставщика")
     review_rating = models.FloatField(verbose_name="Рейтинг отзывов")
     feedbacks = models.IntegerField(verbose_name="Количество отзывов")
     price = models.BigIntegerField(verbose_name="Цена")
     created_at = models.DateTimeField(auto_now_add=True, verbose_name="Дата создания")
+    # Товар пропал из выдачи при обновлении запроса (см. refresh)
+    removed_at = models.DateTimeField(null=True, blank=True, verbose_name="Дата удаления из выдачи")
+
+    objects = ProductResultQuerySet.as_manager()
+
+    # Поля, по которым результаты сортируются в /api/products/result/
+    # (name, brand и supplier - аннотации with_catalog)
+    SORT_FIELDS = (
+        'name', 'brand', 'supplier', 'supplier_rating', 'review_rating', 'feedbacks', 'price',
+    )
 
     class Meta:
         db_table = 'product_results'
         ordering = ['id']
+        # Индексы вида (search_query_id, <поле сортировки>, id): выборка
+        # страницы результатов запроса идет по индексу без сортировки в памяти.
+        # Поля каталога сортируются по индексам каталога (см. ProductModel)
+        indexes = [
+            models.Index(fields=['search_query', 'id'], name='pr_query_id_idx'),
+            models.Index(fields=['search_query', 'supplier_rating', 'id'], name='pr_query_supp_rating_idx'),
+            models.Index(fields=['search_query', 'review_rating', 'id'], name='pr_query_rev_rating_idx'),
+            models.Index(fields=['search_query', 'feedbacks', 'id'], name='pr_query_feedbacks_idx'),
+            models.Index(fields=['search_query', 'price', 'id'], name='pr_query_price_idx'),
+        ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=['search_query', 'product'], name='pr_query_product_uniq'
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.search_query_id} - {self.product_id}"
+
+
+class PriceHistoryModel(models.Model):
+    """
+    Модель истории цен и оценок товара
+
+    Строка добавляется, только когда значение меняется при обновлении
+    запроса. Неизменные поля товара (название, бренд, поставщик)
+    хранятся только в каталоге (ProductModel).
+    """
+    id = models.BigAutoField(primary_key=True, verbose_name="ID")
+    # Результат запроса, а не товар каталога: история ведется по выдаче запроса
+    result = models.ForeignKey(
+        ProductResultModel,
+        on_delete=models.CASCADE,
+        related_name='history',
+        # Покрывается уникальным ограничением (result, observed_at)
+        db_index=False,
+    )
+    observed_at = models.DateTimeField(verbose_name="Время наблюдения")
+    price = models.BigIntegerField(verbose_name="Цена")
+    feedbacks = models.IntegerField(verbose_name="Количество отзывов")
+    supplier_rating = models.FloatField(verbose_name="Рейтинг поставщика")
+    review_rating = models.FloatField(verbose_name="Рейтинг отзывов")
+
+    # Поля товара, изменения которых попадают в историю
+    TRACKED_FIELDS = ('price', 'feedbacks', 'supplier_rating', 'review_rating')
+
+    class Meta:
+        db_table = 'price_history'
+        ordering = ['result', 'observed_at']
+        # Ряд товара за период читается диапазоном по этому индексу
+        constraints = [
+            models.UniqueConstraint(
+                fields=['result', 'observed_at'], name='price_history_result_time_uniq'
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.result_id} - {self.observed_at:%d.%m.%Y %H:%M}: {self.price}"
+
+
+class ParsePageModel(models.Model):
+    """Модель контрольной точки парсинга: состояние загрузки страницы выдачи"""
+
+    class Status(models.TextChoices):
+        DONE = 'done', 'Загружена и сохранена'
+        FAILED = 'failed', 'Ошибка загрузки'
+
+    id = models.AutoField(primary_key=True, verbose_name="ID")
+    search_query = models.ForeignKey(
+        SearchQueryModel,
+        on_delete=models.CASCADE,
+        related_name='pages',
+        # Покрывается уникальным ограничением (search_query, page)
+        db_index=False,
+    )
+
+    page = models.PositiveIntegerField(verbose_name="Номер страницы")
+    status = models.CharField(max_length=16, choices=Status.choices, verbose_name="Статус")
+    products_count = models.PositiveIntegerField(default=0, verbose_name="Количество товаров")
+    # Количество результатов по данным поиска: при возобновлении заменяет
+    # повторный запрос первой страницы
+    reported_total = models.IntegerField(default=0, verbose_name="Количество результатов поиска")
+    # Отпечаток набора id товаров страницы для определения конца выдачи
+    fingerprint = models.BigIntegerField(null=True, blank=True, verbose_name="Отпечаток страницы")
+    error = models.TextField(blank=True, default="", verbose_name="Ошибка")
+    updated_at = models.DateTimeField(auto_now=True, verbose_name="Дата обновления")
+
+    class Meta:
+        db_table = 'parse_pages'
+        ordering = ['search_query', 'page']
+        constraints = [
+            models.UniqueConstraint(fields=['search_query', 'page'], name='parse_pages_query_page_uniq'),
+        ]
 
     def __str__(self):
-        return f"{self.name} - {self.brand}"
+        return f"{self.search_query_id} - {self.page} ({self.status})"
+
+
+class ParseJobModel(models.Model):
+    """Модель задания парсинга в очереди воркера"""
+
+    class Kind(models.TextChoices):
+        PARSE = 'parse', 'Парсинг'
+        REFRESH = 'refresh', 'Обновление'
+
+    class Status(models.TextChoices):
+        PENDING = 'pending', 'В очереди'
+        RUNNING = 'running', 'Выполняется'
+        DONE = 'done', 'Завершено'
+        FAILED = 'failed', 'Ошибка'
+
+    id = models.AutoField(primary_key=True, verbose_name="ID")
+    search_query = models.ForeignKey(
+        SearchQueryModel,
+        on_delete=models.CASCADE,
+        related_name='jobs'
+    )
+
+    status = models.CharField(
+        max_length=16, choices=Status.choices, default=Status.PENDING, verbose_name="Статус"
+    )
+    kind = models.CharField(
+        max_length=16, choices=Kind.choices, default=Kind.PARSE, verbose_name="Тип задания"
+    )
+    attempts = models.PositiveIntegerField(default=0, verbose_name="Количество попыток")
+    available_at = models.DateTimeField(default=timezone.now, verbose_name="Доступно для запуска с")
+    lease_expires_at = models.DateTimeField(null=True, blank=True, verbose_name="Аренда истекает")
+    worker_id = models.CharField(max_length=255, blank=True, default="", verbose_name="ID воркера")
+    last_error = models.TextField(blank=True, default="", verbose_name="Последняя ошибка")
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name="Дата создания")
+    updated_at = models.DateTimeField(auto_now=True, verbose_name="Дата обновления")
 
+    class Meta:
+        db_table = 'parse_jobs'
+        ordering = ['id']
+        indexes = [
+            models.Index(fields=['status', 'available_at'], name='parse_jobs_status_avail_idx'),
+            models.Index(fields=['status', 'lease_expires_at'], name='parse_jobs_status_lease_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.search_query_id} - {self.status}"
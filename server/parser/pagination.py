@@ -0,0 +1,198 @@
+import base64
+import json
+
+from django.core.paginator import Paginator as DjangoPaginator
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+class KnownCountPaginator(DjangoPaginator):
+    """Paginator, которому количество объектов может быть передано заранее"""
+
+    def __init__(self, *args, count: int | None = None, **kwargs):
+        super().__init__(*args, **kwargs)
+        if count is not None:
+            # count - cached_property: заполняем кэш, и COUNT(*) не выполняется
+            self.__dict__["count"] = count
+
+
+class StandardResultsSetPagination(PageNumberPagination):
+    """Стандартная пагинация по 10 элементов"""
+
+    page_size = 10
+    max_page_size = 100
+    page_size_query_param = "page_size"
+    # Известное количество объектов (например, total_results завершенного запроса)
+    known_count = None
+
+    def django_paginator_class(self, queryset, page_size):
+        """Создание paginator с известным количеством объектов, если оно задано"""
+        return KnownCountPaginator(queryset, page_size, count=self.known_count)
+
+    def get_paginated_response(self, data):
+        """Дополняем стандартный ответ информацией о текущей странице"""
+        return Response(
+            {
+                "count": self.page.paginator.count,
+                "next": self.get_next_link(),
+                "previous": self.get_previous_link(),
+                "current_page": self.page.number,
+                "total_pages": self.page.paginator.num_pages,
+                "results": data,
+            }
+        )
+
+
+class KeysetPagination(BasePagination):
+    """
+    Курсорная (keyset) пагинация
+
+    Курсор хранит значения полей сортировки последней строки страницы,
+    включая id. Следующая страница выбирается условием "после курсора"
+    по тем же полям, поэтому не требует ни COUNT(*), ни OFFSET, и стоимость
+    выборки не зависит от глубины страницы.
+
+    Включается параметром pagination=cursor или наличием параметра cursor.
+    """
+
+    page_size = StandardResultsSetPagination.page_size
+    max_page_size = StandardResultsSetPagination.max_page_size
+    page_size_query_param = StandardResultsSetPagination.page_size_query_param
+    cursor_query_param = "cursor"
+    mode_query_param = "pagination"
+
+    @classmethod
+    def is_requested(cls, request) -> bool:
+        """Запрошена ли курсорная пагинация"""
+        params = request.query_params
+        return params.get(cls.mode_query_param) == "cursor" or cls.cursor_query_param in params
+
+    def get_page_size(self, request) -> int:
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        if page_size <= 0:
+            return self.page_size
+        return min(page_size, self.max_page_size)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        self.ordering = self._get_ordering(queryset)
+
+        cursor = self.decode_cursor(request)
+        reverse = bool(cursor and cursor["reverse"])
+
+        # Страница "назад": идем в обратном порядке и разворачиваем результат
+        if reverse:
+            ordering = [self._invert(field) for field in self.ordering]
+        else:
+            ordering = self.ordering
+        queryset = queryset.order_by(*ordering)
+
+        if cursor:
+            queryset = queryset.filter(self._after_position(ordering, cursor["position"]))
+
+        rows = list(queryset[: self.page_size + 1])
+        has_more = len(rows) > self.page_size
+        rows = rows[: self.page_size]
+        if reverse:
+            rows.reverse()
+
+        self.page = rows
+        if reverse:
+            self.has_next, self.has_previous = True, has_more
+        else:
+            self.has_next, self.has_previous = has_more, cursor is not None
+        return rows
+
+    def get_paginated_response(self, data):
+        return Response(
+            {
+                "next": self.get_next_link(),
+                "previous": self.get_previous_link(),
+                "page_size": self.page_size,
+                "results": data,
+            }
+        )
+
+    def get_next_link(self) -> str | None:
+        if not self.has_next or not self.page:
+            return None
+        return self._build_link(self.page[-1], reverse=False)
+
+    def get_previous_link(self) -> str | None:
+        if not self.has_previous or not self.page:
+            return None
+        return self._build_link(self.page[0], reverse=True)
+
+    def decode_cursor(self, request) -> dict | None:
+        """Разбор курсора из параметров запроса"""
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            cursor = json.loads(base64.urlsafe_b64decode(encoded.encode()))
+            position = cursor["p"]
+            if len(position) != len(self.ordering):
+                raise ValueError
+            return {"position": position, "reverse": bool(cursor.get("r"))}
+        except (TypeError, ValueError, KeyError):
+            raise NotFound("Неверный курсор")
+
+    def encode_cursor(self, position: list, reverse: bool) -> str:
+        payload = {"p": position}
+        if reverse:
+            payload["r"] = 1
+        return base64.urlsafe_b64encode(json.dumps(payload).encode()).decode()
+
+    def _build_link(self, row, reverse: bool) -> str:
+        position = [self._get_value(row, self._field_name(field)) for field in self.ordering]
+        url = self.request.build_absolute_uri()
+        url = remove_query_param(url, "page")
+        return replace_query_param(url, self.cursor_query_param, self.encode_cursor(position, reverse))
+
+    @staticmethod
+    def _get_ordering(queryset) -> list[str]:
+        ordering = list(queryset.query.order_by) or list(queryset.model._meta.ordering)
+        if not any(KeysetPagination._field_name(field) in ("id", "pk") for field in ordering):
+            # id гарантирует однозначную позицию курсора
+            ordering.append("id")
+        return ordering
+
+    @staticmethod
+    def _get_value(row, field: str):
+        return row[field] if isinstance(row, dict) else getattr(row, field)
+
+    @staticmethod
+    def _field_name(field: str) -> str:
+        return field.lstrip("-")
+
+    @staticmethod
+    def _invert(field: str) -> str:
+        return field[1:] if field.startswith("-") else f"-{field}"
+
+    @classmethod
+    def _after_position(cls, ordering: list[str], position: list) -> Q:
+        """
+        Условие "строка после позиции" для лексикографического порядка:
+        (a > x) OR (a = x AND b > y) OR (a = x AND b = y AND id > z)
+
+        Дополнительная граница a >= x позволяет БД начать чтение индекса
+        сразу с позиции курсора, а не фильтровать строки с начала.
+        """
+        condition = Q()
+        equal = Q()
+        for field, value in zip(ordering, position):
+            name = cls._field_name(field)
+            lookup = "lt" if field.startswith("-") else "gt"
+            condition |= equal & Q(**{f"{name}__{lookup}": value})
+            equal &= Q(**{name: value})
+
+        first_field = ordering[0]
+        lookup = "lte" if first_field.startswith("-") else "gte"
+        return Q(**{f"{cls._field_name(first_field)}__{lookup}": position[0]}) & condition
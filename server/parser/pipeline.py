@@ -0,0 +1,404 @@
+import logging
+import queue
+import sys
+import threading
+import time
+import weakref
+from dataclasses import dataclass, field
+from functools import partial
+
+from django.db import transaction
+
+from .checkpoints import build_page_checkpoint, save_page_checkpoints
+from .conf import parser_settings
+from .crawl import AdaptiveConcurrencyLimiter, CrawlProgress
+from .db_writer import get_db_writer
+from .ingest import insert_products
+from .models import SearchQueryModel
+from .refresh import ProductDiff
+
+logger = logging.getLogger(__name__)
+
+# Стадии конвейера в порядке прохождения данных
+STAGES = ("fetch", "transform", "write")
+
+# Маркер завершения работы стадии
+_DONE = object()
+
+
+@dataclass
+class StageStats:
+    """Счетчики стадии конвейера"""
+
+    # Обработано единиц: страниц для fetch/transform, пакетов для write
+    items: int = 0
+    # Товаров, прошедших через стадию
+    products: int = 0
+    # Ошибок стадии
+    errors: int = 0
+    # Время работы (без ожидания очередей), сек.; у fetch суммируется по потокам
+    busy_seconds: float = 0.0
+    _lock: threading.Lock = field(default_factory=threading.Lock, repr=False, compare=False)
+
+    def add(self, items: int = 0, products: int = 0, errors: int = 0, busy_seconds: float = 0.0):
+        with self._lock:
+            self.items += items
+            self.products += products
+            self.errors += errors
+            self.busy_seconds += busy_seconds
+
+    def merge(self, other: "StageStats"):
+        """Добавление счетчиков другой стадии"""
+        self.add(other.items, other.products, other.errors, other.busy_seconds)
+
+    def as_dict(self) -> dict:
+        with self._lock:
+            return {
+                "items": self.items,
+                "products": self.products,
+                "errors": self.errors,
+                "busy_seconds": round(self.busy_seconds, 6),
+                # Пропускная способность стадии без учета простоя
+                "products_per_second": (
+                    round(self.products / self.busy_seconds, 1) if self.busy_seconds else 0.0
+                ),
+            }
+
+
+# Суммарные счетчики всех конвейеров процесса
+_totals = {stage: StageStats() for stage in STAGES}
+
+
+def get_pipeline_totals() -> dict[str, dict]:
+    """Суммарные счетчики стадий всех конвейеров процесса"""
+    return {stage: stats.as_dict() for stage, stats in _totals.items()}
+
+
+# Выполняющиеся конвейеры процесса (для метрик глубины очередей)
+_running = weakref.WeakSet()
+_running_lock = threading.Lock()
+
+
+def get_queue_depths() -> dict[str, int]:
+    """Суммарная заполненность очередей между стадиями выполняющихся конвейеров"""
+    with _running_lock:
+        pipelines = list(_running)
+    return {
+        "fetched": sum(pipeline._fetched.qsize() for pipeline in pipelines),
+        "transformed": sum(pipeline._transformed.qsize() for pipeline in pipelines),
+    }
+
+
+class ParsePipeline:
+    """
+    Конвейер парсинга: загрузка -> преобразование -> запись
+
+    Потоки загрузки получают страницы из API, поток преобразования строит
+    объекты моделей, а запись выполняет единственный писатель пакетами
+    в вызывающем потоке. Стадии связаны очередями ограниченного размера:
+    если запись отстает, загрузчики блокируются на заполненной очереди
+    вместо накопления страниц в памяти. Загрузка следующих страниц идет
+    одновременно с записью предыдущих, а на SQLite блокировку записи
+    никогда не ждут несколько потоков сразу.
+
+    Вместе с товарами в той же транзакции сохраняются контрольные точки
+    страниц (ParsePageModel): после рестарта записанные страницы
+    не загружаются повторно.
+    """
+
+    def __init__(self, service, search_query: SearchQueryModel, query_text: str,
+                 fetchers: int | None = None, queue_size: int | None = None,
+                 write_batch_size: int | None = None, reported_total: int = 0,
+                 diff: ProductDiff | None = None):
+        """
+        Args:
+            service: MarketplaceParserService (загрузка страниц и построение объектов)
+            search_query: Объект поискового запроса
+            query_text: Текст запроса
+            fetchers: Количество потоков загрузки
+            queue_size: Емкость очередей между стадиями
+            write_batch_size: Минимальный размер пакета записи (строк)
+            reported_total: Количество результатов по данным поиска (для контрольных точек)
+            diff: Обновление сохраненных товаров вместо добавления (см. ProductDiff)
+        """
+        self.service = service
+        self.search_query = search_query
+        self.query_text = query_text
+        self.reported_total = reported_total
+        self.diff = diff
+        self.fetchers = fetchers or parser_settings("PIPELINE_FETCHERS")
+        self.write_batch_size = write_batch_size or parser_settings("PIPELINE_WRITE_BATCH_SIZE")
+        queue_size = queue_size or parser_settings("PIPELINE_QUEUE_SIZE")
+
+        self.stats = {stage: StageStats() for stage in STAGES}
+        self.progress = None
+        # Страницы, не загруженные после всех повторов запроса или не
+        # обработанные стадией transform, и последняя ошибка
+        self._failed_pages = []
+        self.last_fetch_error = None
+        self.limiter = AdaptiveConcurrencyLimiter(
+            min_limit=parser_settings("PIPELINE_MIN_FETCHERS"),
+            max_limit=self.fetchers,
+            tolerance=parser_settings("PIPELINE_LATENCY_TOLERANCE"),
+        )
+        self._pages = None
+        self._pages_lock = threading.Lock()
+        self._fetched = queue.Queue(maxsize=queue_size)
+        self._transformed = queue.Queue(maxsize=queue_size)
+        self._stop = threading.Event()
+
+    def run(self, pages, prefetched: dict[int, list[dict]] | None = None,
+            checkpoints: dict | None = None, last_page: int | None = None) -> int:
+        """
+        Выполнение конвейера
+
+        Страницы загружаются по возрастанию номеров; пустая страница или
+        повтор уже полученной останавливает загрузку следующих (см. CrawlProgress).
+
+        Args:
+            pages: Номера страниц для загрузки по возрастанию: любой итерируемый
+                объект, в том числе итератор (номера не собираются в список)
+            prefetched: Уже загруженные страницы {номер: товары}, минуют стадию fetch
+            checkpoints: Страницы, сохраненные до рестарта {номер: ParsePageModel};
+                не загружаются, но учитываются при определении конца выдачи
+            last_page: Последняя страница по количеству результатов; без нее
+                конец выдачи определяется только по пустой странице или повтору
+
+        Returns:
+            int: Количество записанных товаров
+        """
+        prefetched = prefetched or {}
+        checkpoints = checkpoints or {}
+        self.progress = CrawlProgress(sys.maxsize if last_page is None else last_page)
+        for page, checkpoint in sorted(checkpoints.items()):
+            self.progress.restore(page, checkpoint.fingerprint)
+        # Номера страниц выдаются итератором: очередь всех страниц не создается
+        self._pages = iter(pages)
+
+        # Загрузчик без страниц сразу завершается: их число заранее не известно
+        fetchers_count = max(1, self.fetchers)
+        threads = [
+            threading.Thread(target=self._fetch_worker, daemon=True)
+            for _ in range(fetchers_count)
+        ]
+        # Готовые страницы передает отдельный поставщик: вызывающий поток
+        # занят записью и не должен блокироваться на очереди transform
+        threads.append(
+            threading.Thread(target=self._feed_prefetched, args=(prefetched,), daemon=True)
+        )
+        threads.append(
+            threading.Thread(target=self._transform_worker, args=(fetchers_count + 1,), daemon=True)
+        )
+        with _running_lock:
+            _running.add(self)
+        for thread in threads:
+            thread.start()
+
+        try:
+            return self._write()
+        finally:
+            for thread in threads:
+                thread.join()
+            with _running_lock:
+                _running.discard(self)
+            for stage, stats in self.stats.items():
+                _totals[stage].merge(stats)
+
+    @property
+    def failed_pages(self) -> list[int]:
+        """Не загруженные или не обработанные страницы в пределах выдачи (за ее концом потерь нет)"""
+        last_page = self.progress.last_page if self.progress is not None else None
+        return sorted(
+            page for page in self._failed_pages if last_page is None or page <= last_page
+        )
+
+    def _mark_failed(self, page: int, error_message: str | None):
+        """Учет страницы, которая не дошла до записи: парсинг не будет завершен"""
+        with self._pages_lock:
+            self._failed_pages.append(page)
+            self.last_fetch_error = error_message
+
+    def _put(self, target: queue.Queue, item) -> bool:
+        """Помещение в очередь с ожиданием, прерываемым остановкой конвейера"""
+        while not self._stop.is_set():
+            try:
+                target.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _feed_prefetched(self, prefetched: dict[int, list[dict]]):
+        """Передача уже загруженных страниц стадии transform"""
+        try:
+            for page, products in prefetched.items():
+                self.stats["fetch"].add(items=1, products=len(products))
+                if not self.progress.register(page, products):
+                    continue
+                if not self._put(self._fetched, (page, products)):
+                    break
+        finally:
+            self._fetched.put(_DONE)
+
+    def _fetch_worker(self):
+        """Стадия fetch: загрузка страниц из API"""
+        try:
+            while not self._stop.is_set():
+                with self._pages_lock:
+                    page = next(self._pages, None)
+                # Страницы идут по возрастанию: за концом выдачи грузить нечего
+                if page is None or not self.progress.should_fetch(page):
+                    break
+
+                started = time.perf_counter()
+                with self.limiter.slot():
+                    _, _, products, error_message = self.service.get_data(
+                        self.query_text, page=page, return_data=True
+                    )
+                # Пустая выдача - конец обхода, ошибка (после повторов запроса)
+                # запоминается: такие страницы не пропускаются молча
+                failed = not products and error_message != self.service.NO_RESULTS_MESSAGE
+                self.stats["fetch"].add(
+                    items=1, products=len(products), errors=int(failed),
+                    busy_seconds=time.perf_counter() - started,
+                )
+                if failed:
+                    self._mark_failed(page, error_message)
+                    continue
+                if not self.progress.register(page, products):
+                    continue
+                if not self._put(self._fetched, (page, products)):
+                    break
+        finally:
+            # Маркер ставится без прерывания: его ждет стадия transform
+            self._fetched.put(_DONE)
+
+    def _transform_worker(self, producers_count: int):
+        """Стадия transform: построение объектов моделей из товаров страниц"""
+        remaining = producers_count
+        try:
+            while remaining:
+                item = self._fetched.get()
+                if item is _DONE:
+                    remaining -= 1
+                    continue
+                if self._stop.is_set():
+                    # Запись прервана: только освобождаем очередь загрузчикам
+                    continue
+
+                page, products = item
+                started = time.perf_counter()
+                try:
+                    instances = self.service._build_product_instances(self.search_query, products, page)
+                except Exception as e:
+                    self.stats["transform"].add(errors=1)
+                    logger.exception("Ошибка при обработке страницы %s", page)
+                    # Страница без контрольной точки: ее дозагрузит возобновление
+                    self._mark_failed(page, f"ошибка обработки страницы: {e}")
+                    continue
+                checkpoint = build_page_checkpoint(
+                    self.search_query.id, page, products, self.reported_total
+                )
+                self.stats["transform"].add(
+                    items=1, products=len(instances), busy_seconds=time.perf_counter() - started
+                )
+                self._put(self._transformed, (checkpoint, instances))
+        finally:
+            self._transformed.put(_DONE)
+
+    def _write(self) -> int:
+        """
+        Стадия write: единственный писатель конвейера
+
+        Пакет дополняется всем, что уже накопилось в очереди, поэтому
+        при медленной записи строки нескольких страниц пишутся одной
+        транзакцией, а при быстрой - запись не ждет заполнения пакета.
+        При включенном общем писателе процесса (DB_WRITER) пакеты
+        передаются ему без ожидания, а результаты собираются в конце.
+        Обновление (diff) сравнивает пакет с сохраненными строками и пишет
+        напрямую: общий писатель только добавляет строки.
+        """
+        writer = get_db_writer() if self.diff is None else None
+        futures = []
+        # Ошибки пакетов общего писателя в порядке их завершения
+        writer_errors = []
+        written = 0
+        error = None
+        finished = False
+        started_at = time.perf_counter()
+        while not finished:
+            batch = []
+            checkpoints = []
+            item = self._transformed.get()
+            while True:
+                if item is _DONE:
+                    finished = True
+                    break
+                checkpoint, instances = item
+                checkpoints.append(checkpoint)
+                batch.extend(instances)
+                if len(batch) >= self.write_batch_size:
+                    break
+                try:
+                    item = self._transformed.get_nowait()
+                except queue.Empty:
+                    break
+
+            if not checkpoints or error is not None:
+                continue
+
+            if writer is not None:
+                future = writer.submit(batch, partial(save_page_checkpoints, checkpoints))
+                future.add_done_callback(partial(self._on_written, writer_errors))
+                futures.append(future)
+                if writer_errors:
+                    error = writer_errors[0]
+                continue
+
+            started = time.perf_counter()
+            try:
+                with transaction.atomic():
+                    if self.diff is not None:
+                        created_count = self.diff.apply(batch)
+                    else:
+                        created_count = insert_products(batch, batch_size=self.service.BATCH_SIZE)
+                    save_page_checkpoints(checkpoints)
+            except Exception as e:
+                # Останавливаем загрузку и дочитываем очередь до маркера
+                error = e
+                self._stop.set()
+                self.stats["write"].add(errors=1)
+                continue
+            written += created_count
+            self.stats["write"].add(
+                items=1, products=created_count, busy_seconds=time.perf_counter() - started
+            )
+
+        for future in futures:
+            try:
+                created_count = future.result()
+            except Exception as e:
+                error = error or e
+                self.stats["write"].add(errors=1)
+                continue
+            written += created_count
+            self.stats["write"].add(items=1, products=created_count)
+        if futures:
+            # Запись общим писателем идет параллельно стадиям: учитываем время
+            # от первого пакета до подтверждения последнего
+            self.stats["write"].add(busy_seconds=time.perf_counter() - started_at)
+
+        if error is not None:
+            raise error
+        return written
+
+    def _on_written(self, errors: list, future):
+        """
+        Завершение пакета общего писателя: ошибка сразу останавливает загрузку
+
+        Вызывается потоком писателя (или сразу, если пакет уже записан),
+        поэтому отправленные пакеты не перебираются на каждой итерации.
+        """
+        if not future.cancelled() and future.exception() is not None:
+            errors.append(future.exception())
+            self._stop.set()
@@ -0,0 +1,160 @@
+from django.utils import timezone
+
+from .catalog import save_catalog
+from .models import PriceHistoryModel, ProductResultModel
+
+# Размер пакета UPDATE при отметке удаленных товаров
+REMOVED_BATCH_SIZE = 500
+
+
+class ProductDiff:
+    """
+    Обновление сохраненных товаров запроса по свежей выдаче
+
+    Товары пакета сравниваются с сохраненными по товару каталога: записываются
+    только новые и изменившиеся (одним INSERT ... ON CONFLICT DO UPDATE
+    на пакет), неизменные строки не трогаются. Товары, которых не было
+    ни на одной странице свежей выдачи, отмечаются удаленными (removed_at)
+    в mark_removed. На стабильной выдаче запись сводится к единицам строк
+    вместо перезаписи всех результатов. Изменившиеся название, бренд
+    и поставщик обновляются в каталоге (save_catalog).
+
+    Изменения цены, отзывов и рейтингов записываются в историю
+    (PriceHistoryModel) с общим для всего обновления временем наблюдения.
+    При первом изменении товара в историю добавляются и прежние значения
+    на момент его создания: история не пишется при обычном парсинге.
+    """
+
+    # Поля результата, изменение которых требует записи
+    FIELDS = ("position", "supplier_rating", "review_rating", "feedbacks", "price")
+
+    def __init__(self, search_query_id: int, batch_size: int = 100):
+        """
+        Args:
+            search_query_id: ID поискового запроса
+            batch_size: Размер пакета INSERT
+        """
+        self.search_query_id = search_query_id
+        self.batch_size = batch_size
+        self.stats = {"inserted": 0, "updated": 0, "unchanged": 0, "removed": 0, "history": 0}
+        self.observed_at = timezone.now()
+        self._seen: set[int] = set()
+        self._fields = [ProductResultModel._meta.get_field(name) for name in self.FIELDS]
+        self._tracked_fields = [
+            ProductResultModel._meta.get_field(name) for name in PriceHistoryModel.TRACKED_FIELDS
+        ]
+
+    def apply(self, instances: list[ProductResultModel]) -> int:
+        """
+        Запись новых и изменившихся товаров пакета
+
+        Вызывается внутри transaction.atomic() единственным писателем.
+
+        Returns:
+            int: Количество записанных строк
+        """
+        fresh = {}
+        for instance in instances:
+            # Товар, уже встреченный на другой странице, не перезаписывается
+            if instance.product_id not in self._seen:
+                fresh.setdefault(instance.product_id, instance)
+        self._seen.update(fresh)
+        if not fresh:
+            return 0
+
+        save_catalog(list(fresh.values()), update=True, batch_size=self.batch_size)
+        stored = {
+            row["product_id"]: row
+            for row in ProductResultModel.objects.filter(
+                search_query_id=self.search_query_id, product_id__in=list(fresh)
+            ).values("id", "product_id", "created_at", "removed_at", *self.FIELDS)
+        }
+
+        changed = []
+        history_changes = []
+        for product_id, instance in fresh.items():
+            row = stored.get(product_id)
+            if row is None:
+                self.stats["inserted"] += 1
+            elif row["removed_at"] is not None or self._differs(instance, row, self._fields):
+                # Вернувшийся в выдачу товар снова становится активным
+                self.stats["updated"] += 1
+                if self._differs(instance, row, self._tracked_fields):
+                    history_changes.append((row, instance))
+            else:
+                self.stats["unchanged"] += 1
+                continue
+            changed.append(instance)
+
+        if changed:
+            ProductResultModel.objects.bulk_create(
+                changed,
+                batch_size=self.batch_size,
+                update_conflicts=True,
+                unique_fields=["search_query", "product"],
+                update_fields=[*self.FIELDS, "removed_at"],
+            )
+        if history_changes:
+            self._write_history(history_changes)
+        return len(changed)
+
+    def _write_history(self, changes: list[tuple[dict, ProductResultModel]]):
+        """Запись изменившихся значений (и исходных - для товаров без истории)"""
+        result_ids = [row["id"] for row, _ in changes]
+        with_history = set(
+            PriceHistoryModel.objects.filter(result_id__in=result_ids)
+            .values_list("result_id", flat=True)
+            .distinct()
+        )
+
+        entries = []
+        for row, instance in changes:
+            if row["id"] not in with_history:
+                entries.append(self._history_entry(row["id"], row["created_at"], row))
+            entries.append(self._history_entry(row["id"], self.observed_at, {
+                field.name: field.get_prep_value(getattr(instance, field.attname))
+                for field in self._tracked_fields
+            }))
+        PriceHistoryModel.objects.bulk_create(entries, batch_size=self.batch_size)
+        self.stats["history"] += len(entries)
+
+    @staticmethod
+    def _history_entry(result_id: int, observed_at, values: dict) -> PriceHistoryModel:
+        return PriceHistoryModel(
+            result_id=result_id,
+            observed_at=observed_at,
+            **{name: values[name] for name in PriceHistoryModel.TRACKED_FIELDS},
+        )
+
+    def mark_removed(self) -> int:
+        """
+        Отметка товаров, которых нет в свежей выдаче
+
+        Вызывается только после загрузки всех страниц: иначе товары
+        незагруженных страниц были бы ошибочно отмечены удаленными.
+
+        Returns:
+            int: Количество отмеченных товаров
+        """
+        active = ProductResultModel.objects.active().filter(search_query_id=self.search_query_id)
+        removed_ids = [
+            pk
+            for pk, product_id in active.values_list("id", "product_id").iterator(chunk_size=2000)
+            if product_id not in self._seen
+        ]
+
+        removed_at = timezone.now()
+        for start in range(0, len(removed_ids), REMOVED_BATCH_SIZE):
+            ProductResultModel.objects.filter(
+                id__in=removed_ids[start:start + REMOVED_BATCH_SIZE]
+            ).update(removed_at=removed_at)
+        self.stats["removed"] += len(removed_ids)
+        return len(removed_ids)
+
+    @staticmethod
+    def _differs(instance: ProductResultModel, row: dict, fields: list) -> bool:
+        # Значения приводятся так же, как при записи (например, дробная цена к целой)
+        return any(
+            field.get_prep_value(getattr(instance, field.attname)) != row[field.name]
+            for field in fields
+        )
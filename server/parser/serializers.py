@@ -1,4 +1,6 @@
+from django.utils import timezone
 from rest_framework import serializers
+from .conf import parser_settings
 from .models import SearchQueryModel, ProductResultModel
 
 
@@ -7,15 +9,82 @@ class SearchQuerySerializer(serializers.ModelSerializer):
 
     class Meta:
         model = SearchQueryModel
-        fields = ["id", "query_text", "created_at", "is_completed", "total_results"]
+        fields = [
+            "id", "query_text", "created_at", "is_completed", "total_results",
+            "deep_crawl", "max_pages",
+        ]
+
+
+# Поля результата в ответе API: поля каталога выводятся наравне
+# с полями результата, как до выноса товаров в каталог
+PRODUCT_RESULT_FIELDS = (
+    "id", "external_id", "name", "brand", "supplier", "supplier_rating",
+    "review_rating", "feedbacks", "price", "created_at", "search_query",
+)
 
 
 class ProductResultSerializer(serializers.ModelSerializer):
     """Сериализатор для модели результата поиска"""
 
+    # Поля товара из каталога: аннотации ProductResultQuerySet.with_catalog()
+    external_id = serializers.IntegerField(read_only=True)
+    name = serializers.CharField(read_only=True)
+    brand = serializers.CharField(read_only=True)
+    supplier = serializers.CharField(read_only=True)
+
     class Meta:
         model = ProductResultModel
-        fields = "__all__"
+        # removed_at и position служебные и в ответ не попадают
+        fields = PRODUCT_RESULT_FIELDS
+
+
+# Колонки для queryset.values(): внешний ключ читается как id без JOIN
+PRODUCT_RESULT_COLUMNS = PRODUCT_RESULT_FIELDS[:-1] + ("search_query_id",)
+
+
+def format_datetime(value):
+    """Дата в формате DateTimeField DRF (ISO 8601, UTC как "Z")"""
+    if value is None:
+        return None
+    if timezone.is_aware(value):
+        value = timezone.localtime(value)
+    value = value.isoformat()
+    if value.endswith("+00:00"):
+        value = value[:-6] + "Z"
+    return value
+
+
+def serialize_product_row(row: dict) -> dict:
+    """Сериализация одной строки из queryset.values(*PRODUCT_RESULT_COLUMNS)"""
+    return {
+        "id": row["id"],
+        "external_id": row["external_id"],
+        "name": row["name"],
+        "brand": row["brand"],
+        "supplier": row["supplier"],
+        "supplier_rating": row["supplier_rating"],
+        "review_rating": row["review_rating"],
+        "feedbacks": row["feedbacks"],
+        "price": row["price"],
+        "created_at": format_datetime(row["created_at"]),
+        "search_query": row["search_query_id"],
+    }
+
+
+def serialize_product_rows(rows) -> list[dict]:
+    """
+    Быстрая сериализация строк результатов из queryset.values(*PRODUCT_RESULT_COLUMNS)
+
+    Дает тот же JSON, что и ProductResultSerializer, но без создания
+    объектов модели и без обхода полей сериализатора для каждой строки.
+
+    Args:
+        rows: Словари строк с ключами PRODUCT_RESULT_COLUMNS
+
+    Returns:
+        list[dict]: Данные в формате ProductResultSerializer(many=True).data
+    """
+    return [serialize_product_row(row) for row in rows]
 
 
 class CreateSearchQuerySerializer(serializers.ModelSerializer):
@@ -23,7 +92,21 @@ class CreateSearchQuerySerializer(serializers.ModelSerializer):
 
     class Meta:
         model = SearchQueryModel
-        fields = ["query_text"]
+        fields = ["query_text", "deep_crawl", "max_pages"]
+
+
+class BulkSearchQuerySerializer(serializers.Serializer):
+    """Сериализатор пакетного создания поисковых запросов"""
+
+    queries = serializers.ListField(
+        child=serializers.CharField(max_length=255), allow_empty=False
+    )
+
+    def validate_queries(self, value):
+        limit = parser_settings("BULK_MAX_QUERIES")
+        if len(value) > limit:
+            raise serializers.ValidationError(f"Не более {limit} запросов за раз")
+        return value
 
 
 class QueryTextSerializer(serializers.Serializer):
@@ -38,7 +121,13 @@ class SearchQueryDetailSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = SearchQueryModel
-        fields = ['id', 'query_text', 'created_at', 'is_completed', 'total_results', 'results_count']
+        fields = [
+            'id', 'query_text', 'created_at', 'is_completed', 'total_results', 'results_count',
+            'deep_crawl', 'max_pages',
+        ]
 
     def get_results_count(self, obj):
-        return obj.results.count()
+        # У завершенного запроса количество сохранено, считаем только идущие
+        if obj.is_completed:
+            return obj.total_results
+        return obj.results.active().count()
@@ -1,159 +1,348 @@
+import logging
+import queue
 import threading
-import concurrent.futures
-import httpx
-from django.db import transaction
+import time
+from collections.abc import Iterator
+from functools import partial
+from django.db import connection, transaction
+from django.db.models import F
 
-from .models import SearchQueryModel, ProductResultModel
+from .catalog import build_product_result
+from .checkpoints import (
+    build_page_checkpoint,
+    load_done_pages,
+    record_failed_pages,
+    save_page_checkpoints,
+)
+from .clients import get_http_client
+from .conf import parser_settings
+from .db_writer import get_db_writer
+from .events import COMPLETED, ERROR, publish_progress
+from .decoding import decode_search_page
+from .ingest import insert_products
+from .lookup_cache import get_first_page_cache, get_first_page_flight, normalize_query
+from .metrics import record_fetch, track_parse_job
+from .models import ParseJobModel, SearchQueryModel, ProductResultModel
+from .pipeline import ParsePipeline
+from .refresh import ProductDiff
+from .throttling import send_with_retries
+
+logger = logging.getLogger(__name__)
+
+
+class IncompleteParsingError(Exception):
+    """Страницы выдачи не загружены даже после повторов запросов или не записаны"""
+
+    def __init__(self, pages: list[int], error_message: str | None = None):
+        self.pages = sorted(pages)
+        super().__init__(
+            f"Не загружены страницы {', '.join(map(str, self.pages))}: {error_message}"
+        )
+
+
+class ParseThreadPool:
+    """
+    Пул фоновых потоков парсинга с общим для процесса лимитом
+
+    Парсинги сверх лимита ждут в очереди, а не запускают по потоку
+    на каждый запрос. Потоки-демоны создаются при первой задаче
+    и не задерживают завершение процесса.
+    """
+
+    def __init__(self, workers: int):
+        self.workers = workers
+        self.active = 0
+        self._tasks = queue.SimpleQueue()
+        self._threads: list[threading.Thread] = []
+        self._lock = threading.Lock()
+
+    def submit(self, fn, *args):
+        """Постановка задачи в очередь пула"""
+        self._tasks.put((fn, args))
+        with self._lock:
+            while len(self._threads) < self.workers:
+                thread = threading.Thread(target=self._run, daemon=True)
+                self._threads.append(thread)
+                thread.start()
+
+    @property
+    def queue_depth(self) -> int:
+        """Задачи, ожидающие свободного потока"""
+        return self._tasks.qsize()
+
+    def _run(self):
+        while True:
+            fn, args = self._tasks.get()
+            with self._lock:
+                self.active += 1
+            try:
+                fn(*args)
+            except Exception:
+                logger.exception("Ошибка фоновой задачи парсинга")
+            finally:
+                with self._lock:
+                    self.active -= 1
+                # Поток живет дольше задачи: соединение с БД не держим
+                connection.close()
+
+
+_parse_pool: ParseThreadPool | None = None
+_parse_pool_lock = threading.Lock()
+
+
+def get_parse_pool() -> ParseThreadPool:
+    """Общий пул фоновых парсингов процесса (размер - INLINE_CONCURRENCY)"""
+    global _parse_pool
+    if _parse_pool is None:
+        with _parse_pool_lock:
+            if _parse_pool is None:
+                _parse_pool = ParseThreadPool(parser_settings("INLINE_CONCURRENCY"))
+    return _parse_pool
 
 
 class MarketplaceParserService:
     """Сервис для парсинга маркетплейса"""
 
+    # Счетчики стадий конвейера последнего парсинга (см. ParsePipeline)
+    last_pipeline_stats = None
+
     # Максимальное количество страниц для парсинга
     MAX_PAGES = 10
     # Количество результатов на странице
     RESULTS_PER_PAGE = 100
     # Оптимальный размер пакета для массового создания
     BATCH_SIZE = 100
+    # Ошибка get_data для корректного ответа без товаров (конец выдачи)
+    NO_RESULTS_MESSAGE = "Не найдено результатов"
 
-    def start_parsing(self, search_query_id: int, query_text: str):
-        """Запуск парсинга в отдельном потоке"""
-        thread = threading.Thread(
-            target=self._parse_marketplace, args=(search_query_id, query_text)
-        )
-        thread.daemon = True
-        thread.start()
+    def start_parsing(self, search_query_id: int, query_text: str, refresh: bool = False):
+        """
+        Запуск парсинга в фоне
 
-    def _parse_marketplace(self, search_query_id: int, query_text: str):
-        """Основная логика парсинга маркетплейса"""
-        try:
-            # Получаем объект запроса и проверяем валидность
-            search_query = SearchQueryModel.objects.get(id=search_query_id)
+        При JOB_BACKEND="queue" создается задание для воркера parse_worker,
+        иначе парсинг запускается в текущем процессе движком из настройки ENGINE.
+        Обновление (refresh) всегда выполняется конвейером потокового движка.
+        Потоковый движок выполняет парсинги в общем пуле (INLINE_CONCURRENCY).
+        """
+        if parser_settings("JOB_BACKEND") == "queue":
+            # Импорт внутри функции: очередь сама зависит от этого модуля
+            from .jobs import enqueue_parse_job
 
-            # Проверяем валидность запроса и получаем общее количество результатов
-            is_valid, total_results, first_page_products, error_message = self.get_data(
-                query_text, page=1, return_data=True
-            )
+            kind = ParseJobModel.Kind.REFRESH if refresh else ParseJobModel.Kind.PARSE
+            enqueue_parse_job(search_query_id, kind)
+            return
 
-            if not is_valid:
-                # Запрос невалидный, обновляем запись
-                with transaction.atomic():
-                    search_query.is_completed = True  # Парсинг завершен, но с ошибкой
-                    search_query.total_results = 0
-                    search_query.save()
-                print(f"Невалидный запрос: {error_message}")
-                return
-            
-            # Определяем количество страниц для парсинга
-            # Ограничиваем максимальным количеством страниц
-            pages_count = min(
-                self.MAX_PAGES, 
-                (total_results + self.RESULTS_PER_PAGE - 1) // self.RESULTS_PER_PAGE
-            )
-            
-            # Создаем общий счетчик результатов
-            created_count = 0
-            
-            # Начинаем транзакцию для первой страницы
-            with transaction.atomic():
-                # Сначала обрабатываем результаты с первой страницы
-                created_count += self._process_products(search_query, first_page_products)
-            
-            # Если есть дополнительные страницы, обрабатываем их в отдельных потоках
-            if pages_count > 1:
-                created_count += self._parse_additional_pages(search_query, query_text, pages_count)
-            
-            # Обновляем статус запроса внутри транзакции
-            with transaction.atomic():
-                search_query.refresh_from_db()  # Получаем свежие данные из БД
-                search_query.is_completed = True
-                search_query.total_results = created_count
-                search_query.save()
+        if parser_settings("ENGINE") == "asyncio" and not refresh:
+            # Импорт внутри функции: движок сам зависит от этого модуля
+            from .async_engine import get_async_engine
+
+            get_async_engine().submit(search_query_id, query_text)
+            return
+
+        get_parse_pool().submit(self._parse_marketplace, search_query_id, query_text, refresh)
+
+    def start_parsing_many(self, search_queries: list[SearchQueryModel]):
+        """
+        Запуск парсинга нескольких запросов
+
+        Для очереди задания создаются одним INSERT, в текущем процессе
+        парсинги ограничены общим лимитом движка (пул потоков или
+        ASYNC_CONCURRENCY), а не запускаются все сразу.
+        """
+        if parser_settings("JOB_BACKEND") == "queue":
+            from .jobs import enqueue_parse_jobs
+
+            enqueue_parse_jobs([search_query.id for search_query in search_queries])
+            return
 
+        for search_query in search_queries:
+            self.start_parsing(search_query.id, search_query.query_text)
+
+    def _parse_marketplace(self, search_query_id: int, query_text: str, refresh: bool = False):
+        """Парсинг маркетплейса в фоне: ошибки только выводятся в лог"""
+        try:
+            self.run_parsing(search_query_id, query_text, refresh=refresh)
+        except IncompleteParsingError as e:
+            # Повторить задание некому: сохраняем то, что удалось загрузить
+            self.complete_search_query(search_query_id)
+            logger.warning("Парсинг завершен не полностью: %s", e)
         except SearchQueryModel.DoesNotExist:
-            print(f"SearchQueryModel с ID {search_query_id} не найден")
+            logger.warning("SearchQueryModel с ID %s не найден", search_query_id)
         except Exception as e:
-            print(f"Ошибка при парсинге: {e}")
-    
-    def _parse_additional_pages(self, search_query: SearchQueryModel, query_text: str, pages_count: int) -> int:
+            publish_progress(search_query_id, ERROR, error=str(e))
+            logger.exception("Ошибка при парсинге запроса %s", search_query_id)
+
+    @track_parse_job("threads")
+    def run_parsing(self, search_query_id: int, query_text: str, refresh: bool = False) -> int:
         """
-        Парсинг дополнительных страниц в отдельных потоках
-        
-        Args:
-            search_query: Объект поискового запроса
-            query_text: Текст запроса
-            pages_count: Общее количество страниц
-            
+        Основная логика парсинга маркетплейса
+
+        В отличие от _parse_marketplace пробрасывает исключения,
+        чтобы воркер очереди мог повторить задание. Повторный запуск
+        продолжает парсинг с контрольных точек: страницы, уже записанные
+        целиком, не загружаются снова.
+
+        Обновление (refresh) загружает все страницы заново и сравнивает
+        их с сохраненными товарами (см. ProductDiff): записываются только
+        новые и изменившиеся, пропавшие из выдачи отмечаются удаленными.
+
         Returns:
-            int: Количество созданных записей о товарах
-        """
-        created_count = 0
-        # Используем ThreadPoolExecutor для параллельного выполнения запросов
-        with concurrent.futures.ThreadPoolExecutor(max_workers=min(self.MAX_PAGES, pages_count - 1)) as executor:
-            # Создаем список задач для обработки страниц со 2-й по pages_count
-            futures = [
-                executor.submit(self._parse_page, search_query, query_text, page)
-                for page in range(2, pages_count + 1)
-            ]
-            
-            # Обрабатываем результаты по мере их завершения
-            for future in concurrent.futures.as_completed(futures):
-                try:
-                    page_results_count = future.result()
-                    created_count += page_results_count
-                except Exception as e:
-                    print(f"Ошибка при обработке страницы: {e}")
-        
-        return created_count
-    
-    def _parse_page(self, search_query: SearchQueryModel, query_text: str, page: int) -> int:
+            int: Количество записанных (при обновлении - измененных) товаров
+
+        Raises:
+            IncompleteParsingError: Если страницы не загрузились после всех
+                повторов (429, 5xx, сетевые ошибки): такие страницы не
+                пропускаются молча, а запрос не отмечается завершенным
         """
-        Парсинг одной страницы результатов
+        # Получаем объект запроса и проверяем валидность
+        search_query = SearchQueryModel.objects.get(id=search_query_id)
+        done_pages = {} if refresh else load_done_pages(search_query_id)
+        diff = ProductDiff(search_query_id, batch_size=self.BATCH_SIZE) if refresh else None
+        prefetched = {}
+
+        if 1 in done_pages:
+            # Возобновление: количество результатов известно из контрольной точки
+            is_valid, total_results, error_message = True, done_pages[1].reported_total, None
+        else:
+            # Проверяем валидность запроса и получаем общее количество результатов.
+            # Обновлению нужна свежая выдача, парсинг берет страницу, уже
+            # полученную проверкой запроса (validate_query)
+            if refresh:
+                first_page = self.get_data(query_text, page=1, return_data=True)
+            else:
+                first_page = self.get_first_page(query_text, consume=True)
+            is_valid, total_results, first_page_products, error_message = first_page
+            prefetched[1] = first_page_products
+
+        if not is_valid and error_message != self.NO_RESULTS_MESSAGE:
+            # Сбой маркетплейса, а не пустая выдача: запрос не помечается невалидным
+            record_failed_pages(search_query_id, [1], error_message)
+            raise IncompleteParsingError([1], error_message)
+
+        if not is_valid and diff is not None:
+            # Выдача опустела: все сохраненные товары пропали из нее
+            diff.mark_removed()
+            self.last_pipeline_stats = {"refresh": diff.stats}
+            self.complete_search_query(search_query_id)
+            return 0
+
+        if not is_valid:
+            # Запрос невалидный, обновляем запись
+            # update() не воссоздает запись, если запрос успели удалить
+            SearchQueryModel.objects.filter(id=search_query_id).update(
+                is_completed=True,  # Парсинг завершен, но с ошибкой
+                total_results=0,
+            )
+            publish_progress(search_query_id, COMPLETED, total_results=0, error=error_message)
+            logger.info("Невалидный запрос: %s", error_message)
+            return 0
+        
+        # Определяем количество страниц для парсинга
+        pages_count = self.get_pages_count(search_query, total_results)
+        
+        # Страницы загружаются, преобразуются и записываются конвейером:
+        # первая страница уже получена и сразу уходит на запись
+        pipeline = ParsePipeline(
+            self, search_query, query_text, reported_total=total_results, diff=diff
+        )
+        written = pipeline.run(
+            self.get_pending_pages(pages_count, done_pages),
+            prefetched=prefetched,
+            checkpoints=done_pages,
+            last_page=max(pages_count, max(done_pages, default=0)),
+        )
+        self.last_pipeline_stats = {stage: stats.as_dict() for stage, stats in pipeline.stats.items()}
+        self.last_pipeline_stats["crawl"] = {
+            "pages_planned": pages_count,
+            "last_page": pipeline.progress.last_page,
+            "stop_reason": pipeline.progress.stop_reason,
+            "peak_concurrency": pipeline.limiter.peak_limit,
+            "failed_pages": pipeline.failed_pages,
+            "resumed_pages": len(done_pages),
+        }
+        if pipeline.failed_pages:
+            record_failed_pages(search_query_id, pipeline.failed_pages, pipeline.last_fetch_error)
+            raise IncompleteParsingError(pipeline.failed_pages, pipeline.last_fetch_error)
+
+        if diff is not None:
+            diff.mark_removed()
+            self.last_pipeline_stats["refresh"] = diff.stats
         
+        # Обновляем статус запроса
+        self.complete_search_query(search_query_id)
+        return written
+
+    def get_pages_count(self, search_query: SearchQueryModel, total_results: int) -> int:
+        """
+        Количество страниц для обхода
+
+        Обычный парсинг ограничен MAX_PAGES. Глубокий обход (deep_crawl)
+        идет до конца выдачи с ограничением max_pages запроса или
+        настройки DEEP_CRAWL_MAX_PAGES, если они заданы.
+
         Args:
             search_query: Объект поискового запроса
-            query_text: Текст запроса
-            page: Номер страницы
-            
+            total_results: Количество результатов, которое сообщает поиск
+
         Returns:
-            int: Количество созданных записей о товарах
+            int: Номер последней страницы для загрузки
         """
-        try:
-            # Получаем данные для указанной страницы
-            _, _, products, _ = self.get_data(
-                query_text, page=page, return_data=True
-            )
-            
-            # Если нет данных, ничего не делаем
-            if not products:
-                return 0
-                
-            # Обрабатываем полученные товары в транзакции
-            with transaction.atomic():
-                return self._process_products(search_query, products)
-            
-        except Exception as e:
-            print(f"Ошибка при парсинге страницы {page}: {e}")
-            return 0
-    
-    def _process_products(self, search_query: SearchQueryModel, products: list[dict]) -> int:
+        pages_count = (total_results + self.RESULTS_PER_PAGE - 1) // self.RESULTS_PER_PAGE
+        if not search_query.deep_crawl:
+            return min(self.MAX_PAGES, pages_count)
+
+        max_pages = search_query.max_pages or parser_settings("DEEP_CRAWL_MAX_PAGES")
+        if max_pages:
+            return min(max_pages, pages_count)
+        return pages_count
+
+    @staticmethod
+    def get_pending_pages(pages_count: int, done_pages: dict) -> Iterator[int]:
+        """Страницы со второй по pages_count, которые еще не записаны (по возрастанию)"""
+        return (page for page in range(2, pages_count + 1) if page not in done_pages)
+
+    @staticmethod
+    def complete_search_query(search_query_id: int) -> int:
         """
-        Обработка и сохранение данных о товарах массово
-        
+        Завершение парсинга с сохранением фактического количества товаров
+
+        total_results завершенного запроса используется вместо COUNT(*)
+        в пагинации и сериализаторах. Считаем строки в БД, а не созданные
+        объекты: bulk_create с ignore_conflicts возвращает и пропущенные дубли.
+        Товары, отмеченные удаленными из выдачи, не учитываются.
+        Слушатели хода парсинга получают событие завершения.
+
+        Returns:
+            int: Количество сохраненных товаров
+        """
+        results_count = ProductResultModel.objects.active().filter(search_query_id=search_query_id).count()
+        SearchQueryModel.objects.filter(id=search_query_id).update(
+            is_completed=True,
+            total_results=results_count,
+            # Повторный парсинг мог изменить результаты: сбрасываем кэш страниц
+            results_version=F("results_version") + 1,
+        )
+        publish_progress(search_query_id, COMPLETED, total_results=results_count)
+        return results_count
+
+    def _build_product_instances(self, search_query: SearchQueryModel, products: list[dict],
+                                 page: int = 1) -> list[ProductResultModel]:
+        """
+        Подготовка несохраненных объектов товаров из данных маркетплейса
+
         Args:
             search_query: Объект поискового запроса
             products: Список товаров
-            
+            page: Номер страницы (для позиции товара в выдаче)
+
         Returns:
-            int: Количество созданных записей
+            list[ProductResultModel]: Объекты для массового создания
         """
-        if not products:
-            return 0
-            
         # Подготавливаем список объектов для массового создания
         product_instances = []
+        first_position = (page - 1) * self.RESULTS_PER_PAGE + 1
         
-        for item in products:
+        for position, item in enumerate(products, start=first_position):
             try:
                 # Извлекаем цену из первого размера если есть
                 price = 0
@@ -164,38 +353,153 @@ class MarketplaceParserService:
                     # Получаем цену и переводим в рубли
                     price = price_data.get("product", 0) / 100
                 
-                # Создаем экземпляр модели, но не сохраняем в БД
+                # Создаем экземпляр модели вместе с товаром каталога, но не сохраняем в БД
                 product_instances.append(
-                    ProductResultModel(
-                        search_query=search_query,
+                    build_product_result(
+                        search_query.id,
                         external_id=item.get("id", 0),
                         name=item.get("name", ""),
                         brand=item.get("brand", ""),
                         supplier=item.get("supplier", ""),
+                        position=position,
                         supplier_rating=item.get("supplierRating", 0.0),
                         review_rating=item.get("reviewRating", 0.0),
                         feedbacks=item.get("feedbacks", 0),
                         price=price,
                     )
                 )
-            except Exception as e:
-                print(f"Ошибка при подготовке данных товара: {e}")
+            except Exception:
+                logger.exception("Ошибка при подготовке данных товара")
+
+        return product_instances
+
+    def _process_products(self, search_query: SearchQueryModel, products: list[dict],
+                          page: int | None = None, reported_total: int = 0) -> int:
+        """
+        Обработка и сохранение данных о товарах массово
         
+        Args:
+            search_query: Объект поискового запроса
+            products: Список товаров
+            page: Номер страницы: ее контрольная точка сохраняется в той же транзакции
+            reported_total: Количество результатов по данным поиска
+            
+        Returns:
+            int: Количество созданных записей
+        """
+        if not products:
+            return 0
+
+        product_instances = self._build_product_instances(search_query, products, page or 1)
+        checkpoints = []
+        if page is not None:
+            checkpoints.append(
+                build_page_checkpoint(search_query.id, page, products, reported_total)
+            )
+
         # Если есть данные для создания, выполняем массовое создание в транзакции
-        if product_instances:
+        if product_instances or checkpoints:
+            # На SQLite запись идет через общий писатель процесса
+            writer = get_db_writer()
+            if writer is not None:
+                return writer.write(product_instances, partial(save_page_checkpoints, checkpoints))
+
             with transaction.atomic():
-                # Используем bulk_create для массового создания записей
-                created_products = ProductResultModel.objects.bulk_create(
-                    product_instances, 
-                    batch_size=self.BATCH_SIZE,
-                    ignore_conflicts=True
-                )
-                return len(created_products)
+                # COPY для PostgreSQL, bulk_create для остальных БД
+                created_count = insert_products(product_instances, batch_size=self.BATCH_SIZE)
+                save_page_checkpoints(checkpoints)
+                return created_count
         
         return 0
 
+    def get_first_page(self, query_text: str,
+                       consume: bool = False) -> tuple[bool, int, list[dict], str | None]:
+        """
+        Первая страница выдачи через общий кэш (FIRST_PAGE_CACHE_ALIAS)
+
+        Страницу, полученную проверкой запроса, берет парсинг в любом
+        процессе, в том числе в воркере очереди. Одновременные запросы одной
+        и той же страницы в процессе (например, проверки запроса при наборе
+        текста) объединяются в один запрос к маркетплейсу.
+        Кэшируются только ответы маркетплейса: сбои (429, 5xx после повторов,
+        сетевые ошибки) при следующем обращении запрашиваются снова.
+
+        Args:
+            query_text: Текст запроса
+            consume: Удалить страницу из кэша (парсинг получает ее один раз)
+
+        Returns:
+            tuple: Результат get_data(query_text, page=1, return_data=True)
+        """
+        key = normalize_query(query_text)
+        cache = get_first_page_cache()
+        first_page = cache.get(key, pop=consume)
+        if first_page is not None:
+            return first_page
+
+        first_page = get_first_page_flight().do(key, partial(self._fetch_first_page, query_text, key))
+        if consume:
+            cache.discard(key)
+        return first_page
+
+    def take_cached_first_page(self, query_text: str) -> tuple | None:
+        """Первая страница из кэша (с удалением) без запроса к маркетплейсу"""
+        return get_first_page_cache().pop(normalize_query(query_text))
+
+    def _fetch_first_page(self, query_text: str, key: str) -> tuple:
+        first_page = self.get_data(query_text, page=1, return_data=True)
+        is_valid, _, _, error_message = first_page
+        if is_valid or error_message == self.NO_RESULTS_MESSAGE:
+            get_first_page_cache().set(key, first_page)
+        return first_page
+
+    @staticmethod
+    def build_search_params(query_text: str, page: int = 1) -> dict:
+        """Параметры запроса к поисковому API маркетплейса"""
+        return {
+            "curr": "rub",
+            "dest": -1255987,
+            "page": page,
+            "query": query_text,
+            "resultset": "catalog",
+            "sort": "popular",
+        }
+
     @staticmethod
-    def get_data(query_text: str, page: int = 1, return_data: bool = False) -> tuple[bool, int, list[dict], str | None]:
+    def parse_search_response(response, return_data: bool = False) -> tuple[bool, int, list[dict], str | None]:
+        """
+        Разбор ответа поискового API маркетплейса
+
+        Args:
+            response: Ответ httpx (синхронного или асинхронного клиента)
+            return_data: Флаг, указывающий нужно ли возвращать данные товаров
+
+        Returns:
+            Tuple в формате get_data
+        """
+        if response.status_code != 200:
+            return False, 0, [], f"Ошибка запроса к маркетплейсу. Код: {response.status_code}"
+
+        # Безопасно получаем JSON данные, оставляя у товаров только нужные поля
+        try:
+            data = decode_search_page(response.content)
+        except Exception:
+            return False, 0, [], "Ошибка при разборе ответа от маркетплейса"
+
+        # Безопасно проверяем наличие данных и продуктов
+        data_section = data.get("data", {})
+        products = data_section.get("products", [])
+
+        if products and len(products) > 0:
+            # Безопасно получаем общее количество результатов
+            total_results = data_section.get("total", len(products))
+            result_products = products if return_data else []
+            return True, total_results, result_products, None
+        else:
+            return False, 0, [], MarketplaceParserService.NO_RESULTS_MESSAGE
+
+    @classmethod
+    def get_data(cls, query_text: str, page: int = 1, return_data: bool = False) -> tuple[bool, int, list[dict], str | None]:
         """
         Получение всех данных или количество товаров
         
@@ -211,36 +515,26 @@ class MarketplaceParserService:
             - list[dict]: Данные товаров (если return_data=True) или пустой список
             - str | None: Сообщение об ошибке (если запрос невалидный)
         """
+        started = time.perf_counter()
+        response = None
         try:
-            url = (
-                f"https://search.wb.ru/exactmatch/ru/common/v13/search?curr=rub&"
-                f"dest=-1255987&page={page}&query={query_text}&resultset=catalog&sort=popular&"
+            # Выполняем запрос к Wildberries через общий пул соединений
+            # с общим лимитом частоты и повторами при 429/5xx
+            client = get_http_client()
+            params = cls.build_search_params(query_text, page)
+            response = send_with_retries(
+                lambda: client.get(parser_settings("SEARCH_URL"), params=params)
             )
+            result = cls.parse_search_response(response, return_data)
 
-            # Выполняем запрос к Wildberries
-            with httpx.Client() as client:
-                response = client.get(url)
-
-            if response.status_code != 200:
-                return False, 0, [], f"Ошибка запроса к маркетплейсу. Код: {response.status_code}"
-
-            # Безопасно получаем JSON данные
-            try:
-                data = response.json()
-            except Exception:
-                return False, 0, [], "Ошибка при разборе ответа от маркетплейса"
+        except Exception as e:
+            result = False, 0, [], f"Ошибка при проверке запроса: {str(e)}"
 
-            # Безопасно проверяем наличие данных и продуктов
-            data_section = data.get("data", {})
-            products = data_section.get("products", [])
-            
-            if products and len(products) > 0:
-                # Безопасно получаем общее количество результатов
-                total_results = data_section.get("total", len(products))
-                result_products = products if return_data else []
-                return True, total_results, result_products, None
-            else:
-                return False, 0, [], "Не найдено результатов"
+        record_fetch("threads", time.perf_counter() - started, response, cls.is_failed(result))
+        return result
 
-        except Exception as e:
-            return False, 0, [], f"Ошибка при проверке запроса: {str(e)}"
\ No newline at end of file
+    @classmethod
+    def is_failed(cls, result: tuple) -> bool:
+        """Ответ get_data - сбой загрузки, а не пустая выдача"""
+        is_valid, _, _, error_message = result
+        return not is_valid and error_message != cls.NO_RESULTS_MESSAGE
@@ -1,11 +1,98 @@
-from django.test import TransactionTestCase
+from django.test import SimpleTestCase, TransactionTestCase, override_settings
 from django.urls import reverse
-from rest_framework.test import APIClient
+from rest_framework.request import Request
+from rest_framework.test import APIClient, APIRequestFactory
 from rest_framework import status
-from .models import SearchQueryModel, ProductResultModel
+from rest_framework.renderers import JSONRenderer
+from .async_engine import AsyncParsingEngine
+from .benchmarking import build_api_plan, run_api_load, run_parse_benchmark, seed_search_query
+from .cache import get_results_cache, invalidate_results
+from .catalog import build_product_result, save_catalog
+from .clients import close_http_client, get_http_client
+from .conf import parser_settings
+from .crawl import AdaptiveConcurrencyLimiter, CrawlProgress, page_fingerprint
+from .db_writer import CoalescingWriter, close_db_writer
+from .decoding import available_json_backends, decode_search_page, resolve_json_backend
+from .events import InMemoryEventBroker, active_streams_count, reset_event_broker
+from .fake_marketplace import FakeMarketplaceConfig, build_search_page
+from .ingest import PostgresCopyIngestBackend, insert_products, resolve_ingest_backend
+from .fake_marketplace import FakeMarketplaceServer
+from .history import get_price_changes, get_price_series
+from .jobs import ParseWorker, claim_jobs, get_worker_jobs, recover_stuck_jobs
+from .lookup_cache import FirstPageCache, SingleFlight, normalize_query, reset_first_page_cache
+from .metrics import (
+    ACTIVE_PARSE_JOBS,
+    DB_INSERT_BATCH_ROWS,
+    FETCH_SECONDS,
+    PAGE_FAILURES,
+    PRODUCTS_PER_SECOND,
+    RESULT_SECONDS,
+    Counter,
+    Gauge,
+    Histogram,
+    MetricsRegistry,
+)
+from .models import (
+    BrandModel,
+    ParseJobModel,
+    ParsePageModel,
+    PriceHistoryModel,
+    ProductModel,
+    ProductResultModel,
+    SearchQueryModel,
+    SupplierModel,
+)
+from .pipeline import ParsePipeline, get_pipeline_totals
+from .serializers import (
+    PRODUCT_RESULT_COLUMNS,
+    PRODUCT_RESULT_FIELDS,
+    ProductResultSerializer,
+    SearchQueryDetailSerializer,
+    serialize_product_rows,
+)
+from .services import IncompleteParsingError, MarketplaceParserService, ParseThreadPool
+from .throttling import (
+    AdaptiveRateLimiter,
+    RetryPolicy,
+    TokenBucket,
+    get_rate_limiter,
+    parse_retry_after,
+    reset_rate_limiter,
+)
+from .views import ProductResultViewSet
+import concurrent.futures
+import csv
+import io
+import json
+import os
+import tempfile
+import threading
+import time
+import unittest
+from importlib import import_module
+from datetime import timedelta
+from django.apps import apps as django_apps
+from django.core.exceptions import ImproperlyConfigured
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
 from unittest.mock import patch
 
 
+def tearDownModule():
+    # Поток общего писателя держит соединение с тестовой БД
+    close_db_writer()
+
+
+def create_product_result(search_query, **fields) -> ProductResultModel:
+    """Сохранение результата запроса вместе с товаром каталога"""
+    instance = build_product_result(search_query.id, **fields)
+    save_catalog([instance])
+    instance.save()
+    return instance
+
+
 class SearchQueryAPITests(TransactionTestCase):
     """Тесты для API поисковых запросов"""
 
@@ -20,7 +107,7 @@ class SearchQueryAPITests(TransactionTestCase):
 
         # Создаем несколько результатов для этого запроса
         for i in range(5):
-            ProductResultModel.objects.create(
+            create_product_result(
                 search_query=self.test_query,
                 external_id=10000 + i,
                 name=f"Товар {i+1}",
@@ -36,9 +123,12 @@ class SearchQueryAPITests(TransactionTestCase):
         """Тест создания нового поискового запроса"""
         url = reverse("search-list")
         data = {"query_text": "джинсы мужские"}
-        response = self.client.post(url, data, format="json")
+        # Фоновый парсинг обращался бы к настоящему маркетплейсу и переживал тест
+        with patch.object(MarketplaceParserService, "start_parsing") as start_parsing:
+            response = self.client.post(url, data, format="json")
 
         self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        start_parsing.assert_called_once()
         self.assertEqual(SearchQueryModel.objects.count(), 2)  # 1 из setUp + 1 новый
 
         # Проверяем, что запрос создан с правильными данными
@@ -86,12 +176,12 @@ class SearchQueryAPITests(TransactionTestCase):
         # Мокаем сервис MarketplaceParserService для теста
         with patch("parser.views.MarketplaceParserService") as MockParserService:
             mock_instance = MockParserService.return_value
-            mock_instance.get_data.return_value = (True, 100, [], None)
+            mock_instance.get_first_page.return_value = (True, 100, [], None)
 
             response = self.client.post(url, data, format="json")
 
             # Проверяем, что сервис был вызван
-            mock_instance.get_data.assert_called_once()
+            mock_instance.get_first_page.assert_called_once()
             # Проверяем ответ
             self.assertEqual(response.status_code, status.HTTP_200_OK)
             self.assertEqual(response.data.get("total"), 100)
@@ -143,7 +233,7 @@ class ProductResultAPITests(TransactionTestCase):
 
         # Создаем результаты для тестирования
         for i in range(8):
-            ProductResultModel.objects.create(
+            create_product_result(
                 search_query=self.test_query,
                 external_id=20001 + i,
                 name=f"Товар {i+1}",
@@ -166,7 +256,7 @@ class ProductResultAPITests(TransactionTestCase):
 
     def test_get_product_detail(self):
         """Тест получения деталей конкретного товара"""
-        product = ProductResultModel.objects.first()
+        product = ProductResultModel.objects.with_catalog().first()
         url = reverse("products-detail", args=[product.id])
         response = self.client.get(url)
 
@@ -220,3 +310,1923 @@ class ProductResultAPITests(TransactionTestCase):
 
         self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
         self.assertIn("error", response.data)
+
+
+class FakeMarketplaceTestCase(TransactionTestCase):
+    """Базовый класс тестов, работающих с локальной заглушкой маркетплейса"""
+
+    # Заглушка не ограничивает частоту: лимит клиента не замедляет тесты
+    PARSER_SETTINGS = {"RATE_LIMIT": 1000.0, "RATE_LIMIT_MAX": 1000.0, "RATE_LIMIT_BURST": 1000}
+
+    def setUp(self):
+        close_http_client()
+        reset_rate_limiter()
+        reset_first_page_cache()
+        self.server = FakeMarketplaceServer().start()
+        self.settings_override = override_settings(
+            MARKETPLACE_PARSER={"SEARCH_URL": self.server.search_url, **self.PARSER_SETTINGS}
+        )
+        self.settings_override.enable()
+
+    def tearDown(self):
+        self.settings_override.disable()
+        close_http_client()
+        reset_rate_limiter()
+        reset_first_page_cache()
+        self.server.stop()
+
+    def override_parser_settings(self, **options):
+        """Переопределение настроек парсера с сохранением адреса заглушки"""
+        return override_settings(
+            MARKETPLACE_PARSER={"SEARCH_URL": self.server.search_url, **self.PARSER_SETTINGS, **options}
+        )
+
+
+class MarketplaceHttpClientTests(FakeMarketplaceTestCase):
+    """Тесты общего пула HTTP-соединений на локальной заглушке маркетплейса"""
+
+    def test_get_data_reuses_connection(self):
+        """Последовательные запросы страниц идут через одно соединение"""
+        service = MarketplaceParserService()
+        for page in range(1, 4):
+            is_valid, total, products, error = service.get_data(
+                "джинсы", page=page, return_data=True
+            )
+            self.assertTrue(is_valid, error)
+            self.assertEqual(total, 250)
+        service.get_data("джинсы", return_data=False)
+
+        self.assertEqual(self.server.requests_count, 4)
+        self.assertEqual(self.server.connections_count, 1)
+
+    def test_parse_jobs_share_connections(self):
+        """Несколько заданий парсинга открывают меньше одного соединения на задание"""
+        service = MarketplaceParserService()
+        jobs_count = 3
+        for index in range(jobs_count):
+            query = SearchQueryModel.objects.create(query_text=f"запрос {index}")
+            service._parse_marketplace(query.id, query.query_text)
+
+            query.refresh_from_db()
+            self.assertTrue(query.is_completed)
+            self.assertEqual(query.results.count(), 250)
+
+        self.assertEqual(self.server.requests_count, jobs_count * 3)
+        self.assertLess(self.server.connections_count, jobs_count)
+
+
+class AsyncParsingEngineTests(FakeMarketplaceTestCase):
+    """Тесты асинхронного движка парсинга"""
+
+    ROW_FIELDS = (
+        "external_id", "name", "brand", "supplier",
+        "supplier_rating", "review_rating", "feedbacks", "price", "position",
+    )
+
+    def _rows(self, query):
+        return set(query.results.with_catalog().values_list(*self.ROW_FIELDS))
+
+    def test_same_rows_as_threaded_engine(self):
+        """Асинхронный и потоковый движки сохраняют одинаковые товары"""
+        threaded_query = SearchQueryModel.objects.create(query_text="куртка")
+        MarketplaceParserService()._parse_marketplace(threaded_query.id, "куртка")
+
+        async_query = SearchQueryModel.objects.create(query_text="куртка ")
+        engine = AsyncParsingEngine(concurrency=4)
+        try:
+            engine.submit(async_query.id, "куртка").result(timeout=30)
+        finally:
+            engine.close()
+
+        async_query.refresh_from_db()
+        self.assertTrue(async_query.is_completed)
+        self.assertEqual(async_query.total_results, 250)
+        self.assertEqual(self._rows(async_query), self._rows(threaded_query))
+
+    def test_engine_runs_concurrent_searches(self):
+        """Один цикл событий обрабатывает несколько поисков одновременно"""
+        queries = [
+            SearchQueryModel.objects.create(query_text=f"поиск {index}")
+            for index in range(5)
+        ]
+        engine = AsyncParsingEngine(concurrency=3)
+        try:
+            futures = [engine.submit(query.id, query.query_text) for query in queries]
+            for future in futures:
+                future.result(timeout=30)
+        finally:
+            engine.close()
+
+        for query in queries:
+            query.refresh_from_db()
+            self.assertTrue(query.is_completed)
+            self.assertEqual(query.results.count(), 250)
+
+
+class ParseJobQueueTests(FakeMarketplaceTestCase):
+    """Тесты очереди заданий парсинга и воркера"""
+
+    def _create_query(self, query_text="платье"):
+        with self.override_parser_settings(JOB_BACKEND="queue"):
+            MarketplaceParserService().start_parsing(
+                SearchQueryModel.objects.create(query_text=query_text).id, query_text
+            )
+        return SearchQueryModel.objects.get(query_text=query_text)
+
+    def test_start_parsing_enqueues_job(self):
+        """В режиме очереди создание запроса только ставит задание"""
+        query = self._create_query()
+
+        job = ParseJobModel.objects.get(search_query=query)
+        self.assertEqual(job.status, ParseJobModel.Status.PENDING)
+        self.assertEqual(self.server.requests_count, 0)
+
+    def test_worker_runs_jobs(self):
+        """Воркер выполняет задания с ограниченной конкурентностью"""
+        queries = [self._create_query(f"платье {index}") for index in range(3)]
+
+        ParseWorker(concurrency=2, poll_interval=0.05).run(once=True)
+
+        for query in queries:
+            query.refresh_from_db()
+            self.assertTrue(query.is_completed)
+            self.assertEqual(query.results.count(), 250)
+            self.assertEqual(query.jobs.get().status, ParseJobModel.Status.DONE)
+
+    def test_job_is_claimed_once(self):
+        """Одно задание не достается двум воркерам"""
+        self._create_query()
+
+        self.assertEqual(len(claim_jobs("worker-1", 10)), 1)
+        self.assertEqual(claim_jobs("worker-2", 10), [])
+
+    def test_stuck_job_is_recovered_and_retried(self):
+        """Задание с истекшей арендой возвращается в очередь и перезапускается"""
+        query = self._create_query()
+        job = claim_jobs("dead-worker", 1)[0]
+        # Частично сохраненные данные упавшего воркера
+        create_product_result(
+            search_query=query, external_id=1, name="", brand="", supplier="",
+            supplier_rating=0, review_rating=0, feedbacks=0, price=0,
+        )
+        ParseJobModel.objects.filter(id=job.id).update(
+            lease_expires_at=timezone.now() - timedelta(seconds=1)
+        )
+
+        self.assertEqual(recover_stuck_jobs(), 1)
+        ParseWorker(concurrency=1, poll_interval=0.05).run(once=True)
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, ParseJobModel.Status.DONE)
+        self.assertEqual(job.attempts, 2)
+        self.assertEqual(query.results.count(), 250)
+
+    def test_failed_job_is_rescheduled(self):
+        """Ошибка задания приводит к повтору с задержкой, затем к статусу failed"""
+        query = self._create_query()
+        worker = ParseWorker(concurrency=1, poll_interval=0.05)
+
+        with self.override_parser_settings(JOB_MAX_ATTEMPTS=2, JOB_RETRY_DELAY=60):
+            with patch.object(MarketplaceParserService, "run_parsing", side_effect=RuntimeError("сбой")):
+                with self.assertLogs("parser.jobs", "ERROR") as logs:
+                    worker.run(once=True)
+                job = query.jobs.get()
+                self.assertEqual(job.status, ParseJobModel.Status.PENDING)
+                self.assertGreater(job.available_at, timezone.now())
+                self.assertEqual(job.last_error, "сбой")
+                self.assertIn(f"Ошибка при выполнении задания {job.id}", logs.output[0])
+
+                ParseJobModel.objects.filter(id=job.id).update(available_at=timezone.now())
+                with self.assertLogs("parser.jobs", "ERROR"):
+                    worker.run(once=True)
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, ParseJobModel.Status.FAILED)
+        self.assertEqual(job.attempts, 2)
+
+
+class SearchPageDecodingTests(SimpleTestCase):
+    """Тесты декодеров страницы поиска"""
+
+    def setUp(self):
+        config = FakeMarketplaceConfig(total=30, page_size=30)
+        self.page = build_search_page(config, "рубашка", 1)
+        self.page["data"]["products"][0]["sizes"] = []
+        self.content = json.dumps(self.page, ensure_ascii=False).encode()
+
+    def _instances(self, data):
+        query = SearchQueryModel(id=1, query_text="рубашка")
+        instances = MarketplaceParserService()._build_product_instances(query, data["data"]["products"])
+        return [
+            (obj.product_id, obj.product.name, obj.product.brand.name, obj.product.supplier.name,
+             obj.supplier_rating,
+             obj.review_rating, obj.feedbacks, obj.price, obj.position)
+            for obj in instances
+        ]
+
+    def test_backends_extract_same_products(self):
+        """Все доступные декодеры дают те же товары, что и полный разбор"""
+        expected = self._instances(self.page)
+        for backend in available_json_backends():
+            with self.subTest(backend=backend):
+                data = decode_search_page(self.content, backend=backend)
+                self.assertEqual(data["data"]["total"], 30)
+                self.assertEqual(self._instances(data), expected)
+
+    def test_auto_backend_is_stdlib_json(self):
+        """auto не выбирает декодеры, проигрывающие по памяти или CPU"""
+        with self.settings(MARKETPLACE_PARSER={"JSON_BACKEND": "auto"}):
+            self.assertEqual(resolve_json_backend(), "json")
+
+    @unittest.skipUnless("ijson" in available_json_backends(), "Требуется ijson")
+    def test_ijson_reads_total_after_products(self):
+        """ijson находит total и после списка товаров"""
+        content = json.dumps({"data": {"products": self.page["data"]["products"], "total": 30}}).encode()
+
+        data = decode_search_page(content, backend="ijson")
+
+        self.assertEqual(data["data"]["total"], 30)
+        self.assertEqual(len(data["data"]["products"]), 30)
+
+    def test_slim_products_keep_only_used_fields(self):
+        """Потоковые декодеры не переносят лишние поля товара"""
+        for backend in set(available_json_backends()) - {"json"}:
+            with self.subTest(backend=backend):
+                product = decode_search_page(self.content, backend=backend)["data"]["products"][1]
+                self.assertNotIn("colors", product)
+                self.assertEqual(product["sizes"], [{"price": {"product": 100101}}])
+
+
+class ProductResultIndexTests(TransactionTestCase):
+    """Тесты индексов и ограничений таблицы результатов"""
+
+    def setUp(self):
+        self.query = SearchQueryModel.objects.create(query_text="кроссовки", is_completed=True)
+        service = MarketplaceParserService()
+        page = build_search_page(FakeMarketplaceConfig(total=50, page_size=50), "кроссовки", 1)
+        service._process_products(self.query, page["data"]["products"])
+
+    def _result_queryset(self, params):
+        view = ProductResultViewSet()
+        view.request = Request(APIRequestFactory().get("/", params))
+        return view.get_queryset().filter(search_query=self.query)
+
+    @unittest.skipUnless(connection.vendor == "sqlite", "План запроса в формате SQLite")
+    def test_sorted_pages_use_index(self):
+        """
+        Страница отсортированных результатов читается по индексу без filesort
+
+        Поля каталога (название, бренд, поставщик) сортируются после JOIN:
+        строки запроса читаются по индексу, каталог - по ключу, без полного
+        просмотра таблиц.
+        """
+        for field in ProductResultModel.SORT_FIELDS:
+            for direction in ("asc", "desc"):
+                with self.subTest(field=field, direction=direction):
+                    queryset = self._result_queryset({f"{field}_sort": direction})
+                    plan = queryset[10:20].explain()
+                    self.assertIn("USING INDEX pr_query_", plan)
+                    self.assertNotIn("SCAN", plan)
+                    if field not in ("name", "brand", "supplier"):
+                        self.assertNotIn("TEMP B-TREE", plan)
+
+    def test_duplicate_products_are_ignored(self):
+        """Повторная вставка товара в тот же запрос не создает дубль"""
+        page = build_search_page(FakeMarketplaceConfig(total=50, page_size=50), "кроссовки", 1)
+        MarketplaceParserService()._process_products(self.query, page["data"]["products"])
+
+        self.assertEqual(self.query.results.count(), 50)
+
+
+class KeysetPaginationTests(TransactionTestCase):
+    """Тесты курсорной пагинации результатов"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.query = SearchQueryModel.objects.create(query_text="часы", is_completed=True, total_results=25)
+        for i in range(25):
+            create_product_result(
+                search_query=self.query,
+                external_id=30000 + i,
+                name=f"Товар {i % 4}",
+                brand="Бренд",
+                supplier="Поставщик",
+                supplier_rating=4.0,
+                review_rating=4.0,
+                feedbacks=i,
+                # Повторяющиеся цены проверяют разрешение равных значений по id
+                price=1000 + (i % 5) * 100,
+            )
+        self.url = reverse("products-result")
+
+    def _walk(self, params):
+        """Обход всех страниц по ссылкам next"""
+        response = self.client.get(self.url, {"id": self.query.id, "pagination": "cursor", **params})
+        ids = []
+        while True:
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertNotIn("count", response.data)
+            ids.extend(item["id"] for item in response.data["results"])
+            if not response.data["next"]:
+                return ids, response
+            response = self.client.get(response.data["next"])
+
+    def test_cursor_walk_matches_page_numbers(self):
+        """Обход курсором дает тот же порядок, что и постраничный вывод"""
+        for params in ({}, {"price_sort": "asc"}, {"price_sort": "desc"}, {"name_sort": "asc", "feedbacks_sort": "desc"}):
+            with self.subTest(params=params):
+                ids, _ = self._walk({"page_size": 7, **params})
+                response = self.client.get(self.url, {"id": self.query.id, "page_size": 100, **params})
+                self.assertEqual(ids, [item["id"] for item in response.data["results"]])
+                self.assertEqual(len(ids), 25)
+
+    def test_previous_link(self):
+        """Ссылка previous возвращает предыдущую страницу"""
+        first = self.client.get(self.url, {"id": self.query.id, "pagination": "cursor", "price_sort": "asc", "page_size": 5})
+        self.assertIsNone(first.data["previous"])
+        second = self.client.get(first.data["next"])
+        back = self.client.get(second.data["previous"])
+
+        self.assertEqual(back.data["results"], first.data["results"])
+        self.assertIsNone(back.data["previous"])
+
+    def test_invalid_cursor(self):
+        """Поврежденный курсор не приводит к ошибке сервера"""
+        response = self.client.get(self.url, {"id": self.query.id, "cursor": "не курсор"})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class ResultCountTests(TransactionTestCase):
+    """Тесты сохраненного количества результатов вместо COUNT(*)"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.query = SearchQueryModel.objects.create(query_text="сумка")
+        for i in range(12):
+            create_product_result(
+                search_query=self.query, external_id=40000 + i, name=f"Сумка {i}", brand="Бренд",
+                supplier="Поставщик", supplier_rating=4.0, review_rating=4.0, feedbacks=i, price=1000,
+            )
+
+    def _get_result_page(self):
+        url = reverse("products-result")
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, {"id": self.query.id, "page_size": 5})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        count_queries = [q["sql"] for q in queries if "COUNT(" in q["sql"].upper()]
+        return response, count_queries
+
+    def test_completed_query_uses_stored_count(self):
+        """Для завершенного запроса пагинация не выполняет COUNT(*)"""
+        self.assertEqual(MarketplaceParserService.complete_search_query(self.query.id), 12)
+
+        response, count_queries = self._get_result_page()
+
+        self.assertEqual(count_queries, [])
+        self.assertEqual(response.data["count"], 12)
+        self.assertEqual(response.data["total_pages"], 3)
+
+    def test_running_query_counts_live(self):
+        """Пока парсинг идет, количество считается по БД"""
+        response, count_queries = self._get_result_page()
+
+        self.assertEqual(len(count_queries), 1)
+        self.assertEqual(response.data["count"], 12)
+
+    def test_migration_recounts_stale_totals(self):
+        """Миграция 0010 исправляет total_results, завышенный удалением дублей"""
+        recount_total_results = import_module(
+            "parser.migrations.0010_recount_total_results"
+        ).recount_total_results
+        SearchQueryModel.objects.filter(id=self.query.id).update(is_completed=True, total_results=15)
+
+        recount_total_results(django_apps, None)
+
+        self.query.refresh_from_db()
+        self.assertEqual((self.query.total_results, self.query.results_version), (12, 1))
+        response, _ = self._get_result_page()
+        self.assertEqual(response.data["total_pages"], 3)
+
+    def test_detail_serializer_results_count(self):
+        """results_count завершенного запроса берется из total_results"""
+        MarketplaceParserService.complete_search_query(self.query.id)
+        self.query.refresh_from_db()
+
+        with CaptureQueriesContext(connection) as queries:
+            data = SearchQueryDetailSerializer(self.query).data
+
+        self.assertEqual(data["results_count"], 12)
+        self.assertEqual(len(queries), 0)
+
+
+class ResultPageCacheTests(TransactionTestCase):
+    """Тесты кэша страниц результатов и ETag"""
+
+    def setUp(self):
+        self.client = APIClient()
+        get_results_cache().clear()
+        self.query = SearchQueryModel.objects.create(query_text="шарф")
+        for i in range(6):
+            create_product_result(
+                search_query=self.query, external_id=50000 + i, name=f"Шарф {i}", brand="Бренд",
+                supplier="Поставщик", supplier_rating=4.0, review_rating=4.0, feedbacks=i, price=500 + i,
+            )
+        MarketplaceParserService.complete_search_query(self.query.id)
+        self.url = reverse("products-result")
+
+    def _get(self, params, **headers):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(self.url, {"id": self.query.id, **params}, headers=headers)
+        return response, len(queries)
+
+    def test_repeat_request_served_from_cache(self):
+        """Повторный запрос страницы не обращается к таблице результатов"""
+        first, first_queries = self._get({"price_sort": "desc", "page_size": 3})
+        second, second_queries = self._get({"page_size": 3, "price_sort": "desc"})
+
+        self.assertEqual(second.status_code, status.HTTP_200_OK)
+        self.assertEqual(second.data, first.data)
+        self.assertEqual(second["ETag"], first["ETag"])
+        # Остается только чтение самого поискового запроса
+        self.assertEqual(second_queries, 1)
+        self.assertGreater(first_queries, second_queries)
+
+    def test_if_none_match_returns_304(self):
+        """Клиент с актуальным ETag получает 304 без тела"""
+        first, _ = self._get({"page": 2, "page_size": 3})
+        response, _ = self._get({"page": 2, "page_size": 3}, **{"If-None-Match": first["ETag"]})
+
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(response.content, b"")
+
+    def test_if_none_match_list(self):
+        """If-None-Match сравнивается по тегам списка: W/ и * совпадают, подстрока - нет"""
+        first, _ = self._get({"page_size": 3})
+        etag = first["ETag"]
+        cases = {
+            f'"other", {etag}': status.HTTP_304_NOT_MODIFIED,
+            f"W/{etag}": status.HTTP_304_NOT_MODIFIED,
+            "*": status.HTTP_304_NOT_MODIFIED,
+            # Значение, содержащее актуальный ETag внутри, с ним не совпадает
+            f'"prefix{etag}"': status.HTTP_200_OK,
+            etag[:-2] + '"': status.HTTP_200_OK,
+        }
+        for header, expected in cases.items():
+            with self.subTest(header=header):
+                response, _ = self._get({"page_size": 3}, **{"If-None-Match": header})
+                self.assertEqual(response.status_code, expected)
+
+    def test_reparse_invalidates_cache(self):
+        """Изменение результатов меняет ETag и содержимое страницы"""
+        first, _ = self._get({"page_size": 100})
+        ProductResultModel.objects.filter(search_query=self.query).first().delete()
+        MarketplaceParserService.complete_search_query(self.query.id)
+
+        response, _ = self._get({"page_size": 100}, **{"If-None-Match": first["ETag"]})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(response["ETag"], first["ETag"])
+        self.assertEqual(len(response.data["results"]), 5)
+
+    def test_running_query_is_not_cached(self):
+        """Результаты идущего парсинга не кэшируются"""
+        SearchQueryModel.objects.filter(id=self.query.id).update(is_completed=False)
+        invalidate_results(self.query.id)
+
+        response, _ = self._get({})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertFalse(response.has_header("ETag"))
+
+
+class ProductResultFastSerializerTests(TransactionTestCase):
+    """Тесты быстрой сериализации страниц результатов"""
+
+    def setUp(self):
+        self.query = SearchQueryModel.objects.create(query_text="пальто")
+        for i in range(5):
+            create_product_result(
+                search_query=self.query, external_id=60000 + i, name=f"Пальто \"{i}\"", brand="Бренд",
+                supplier="Поставщик", supplier_rating=4.5 + i / 10, review_rating=4.0, feedbacks=i,
+                price=1999.99 + i,
+            )
+
+    def test_output_matches_model_serializer(self):
+        """Быстрый путь дает тот же JSON, что и ProductResultSerializer"""
+        queryset = (
+            ProductResultModel.objects.with_catalog()
+            .filter(search_query=self.query)
+            .order_by("-price", "-id")
+        )
+
+        expected = ProductResultSerializer(queryset, many=True).data
+        actual = serialize_product_rows(queryset.values(*PRODUCT_RESULT_COLUMNS))
+
+        self.assertEqual(actual, expected)
+        renderer = JSONRenderer()
+        self.assertEqual(renderer.render(actual), renderer.render(expected))
+
+    def test_result_endpoint_shape(self):
+        """Эндпоинт результатов отдает строки с полями модели"""
+        response = APIClient().get(reverse("products-result"), {"id": self.query.id})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        first = response.data["results"][0]
+        self.assertEqual(tuple(first), PRODUCT_RESULT_FIELDS)
+        self.assertEqual(first["search_query"], self.query.id)
+
+
+class ProductResultExportTests(TransactionTestCase):
+    """Тесты потоковой выгрузки результатов"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.query = SearchQueryModel.objects.create(query_text="рюкзак")
+        for i in range(7):
+            create_product_result(
+                search_query=self.query, external_id=70000 + i, name=f"Рюкзак, модель {i}", brand="Бренд",
+                supplier="Поставщик", supplier_rating=4.0, review_rating=4.0, feedbacks=i, price=3000 - i * 10,
+            )
+        self.url = reverse("products-export")
+
+    def _export(self, params, **headers):
+        response = self.client.get(self.url, {"id": self.query.id, **params}, headers=headers)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.streaming)
+        return b"".join(response.streaming_content).decode()
+
+    def test_ndjson_matches_result_rows(self):
+        """NDJSON содержит все строки в формате и порядке result"""
+        content = self._export({"export_format": "ndjson", "price_sort": "asc"})
+        exported = [json.loads(line) for line in content.splitlines()]
+
+        response = self.client.get(
+            reverse("products-result"), {"id": self.query.id, "price_sort": "asc", "page_size": 100}
+        )
+        expected = json.loads(JSONRenderer().render(response.data["results"]))
+        self.assertEqual(exported, expected)
+
+    def test_csv_export(self):
+        """CSV с заголовком, экранированием и сортировкой"""
+        content = self._export({"feedbacks_sort": "desc"}, Accept="text/csv")
+        rows = list(csv.reader(io.StringIO(content)))
+
+        self.assertEqual(tuple(rows[0]), PRODUCT_RESULT_FIELDS)
+        self.assertEqual(len(rows), 8)
+        self.assertEqual(rows[1][PRODUCT_RESULT_FIELDS.index("name")], "Рюкзак, модель 6")
+        self.assertEqual(rows[-1][PRODUCT_RESULT_FIELDS.index("feedbacks")], "0")
+
+    def test_invalid_requests(self):
+        """Неверный формат и несуществующий запрос"""
+        response = self.client.get(self.url, {"id": self.query.id, "export_format": "xml"})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        response = self.client.get(self.url, {"id": 99999})
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+class ParsePipelineTests(FakeMarketplaceTestCase):
+    """Тесты конвейера загрузка -> преобразование -> запись"""
+
+    def setUp(self):
+        super().setUp()
+        self.server.config = FakeMarketplaceConfig(total=950, page_size=100)
+        self.query = SearchQueryModel.objects.create(query_text="кроссовки")
+
+    def test_single_writer_in_calling_thread(self):
+        """Без общего писателя все записи выполняет вызывающий поток"""
+        writer_threads = set()
+        original_bulk_create = ProductResultModel.objects.bulk_create
+
+        def tracking_bulk_create(*args, **kwargs):
+            writer_threads.add(threading.get_ident())
+            return original_bulk_create(*args, **kwargs)
+
+        service = MarketplaceParserService()
+        with self.override_parser_settings(DB_WRITER="direct"), \
+                patch.object(ProductResultModel.objects, "bulk_create", side_effect=tracking_bulk_create):
+            service.run_parsing(self.query.id, self.query.query_text)
+
+        self.assertEqual(writer_threads, {threading.get_ident()})
+        self.query.refresh_from_db()
+        self.assertTrue(self.query.is_completed)
+        self.assertEqual(self.query.total_results, 950)
+
+        stats = service.last_pipeline_stats
+        self.assertEqual(stats["fetch"]["items"], 10)
+        self.assertEqual(stats["transform"]["products"], 950)
+        self.assertEqual(stats["write"]["products"], 950)
+        # Пакеты записи объединяют страницы
+        self.assertLess(stats["write"]["items"], 10)
+        self.assertIn("write", get_pipeline_totals())
+
+    def test_backpressure_with_slow_writer(self):
+        """При медленной записи загрузчики ждут, а не копят страницы"""
+        pipeline = ParsePipeline(
+            MarketplaceParserService(), self.query, self.query.query_text,
+            fetchers=4, queue_size=1, write_batch_size=1,
+        )
+        original_bulk_create = ProductResultModel.objects.bulk_create
+        max_buffered = []
+
+        def slow_bulk_create(*args, **kwargs):
+            max_buffered.append(pipeline._fetched.qsize() + pipeline._transformed.qsize())
+            time.sleep(0.02)
+            return original_bulk_create(*args, **kwargs)
+
+        with patch.object(ProductResultModel.objects, "bulk_create", side_effect=slow_bulk_create):
+            written = pipeline.run(range(1, 11))
+
+        self.assertEqual(written, 950)
+        # В очередях не больше страниц, чем их суммарная емкость
+        self.assertLessEqual(max(max_buffered), 2)
+
+    def test_prefetched_pages_exceeding_queue(self):
+        """Готовых страниц больше емкости очередей - конвейер не блокируется"""
+        config = FakeMarketplaceConfig(total=950, page_size=100)
+        pages = {page: build_search_page(config, "кроссовки", page)["data"]["products"] for page in range(1, 11)}
+        pipeline = ParsePipeline(
+            MarketplaceParserService(), self.query, self.query.query_text, queue_size=1
+        )
+
+        self.assertEqual(pipeline.run([], prefetched=pages), 950)
+        self.assertEqual(self.server.requests_count, 0)
+
+    def test_pages_from_iterator(self):
+        """Номера страниц берутся из итератора без построения списка"""
+        pages = (page for page in range(1, 1_000_000))
+        pipeline = ParsePipeline(MarketplaceParserService(), self.query, self.query.query_text)
+
+        self.assertEqual(pipeline.run(pages, last_page=10), 950)
+        # Загрузка остановилась на последней странице выдачи
+        self.assertEqual(self.server.requests_count, 10)
+        self.assertIsNotNone(next(pages, None))
+
+    def test_write_error_stops_pipeline(self):
+        """Ошибка записи останавливает конвейер и пробрасывается"""
+        pipeline = ParsePipeline(
+            MarketplaceParserService(), self.query, self.query.query_text,
+            fetchers=2, queue_size=1, write_batch_size=1,
+        )
+        with patch.object(ProductResultModel.objects, "bulk_create", side_effect=RuntimeError("диск")):
+            with self.assertRaises(RuntimeError):
+                pipeline.run(range(1, 11))
+
+        self.assertGreaterEqual(pipeline.stats["write"].errors, 1)
+        self.assertLess(self.server.requests_count, 10)
+
+
+class CoalescingWriterTests(TransactionTestCase):
+    """Тесты общего писателя результатов"""
+
+    def setUp(self):
+        self.query = SearchQueryModel.objects.create(query_text="куртка")
+        self.writer = CoalescingWriter(flush_rows=10000, flush_interval=0.2)
+
+    def tearDown(self):
+        self.writer.close()
+
+    def _instances(self, start: int, count: int, search_query_id: int | None = None):
+        return [
+            build_product_result(
+                search_query_id or self.query.id, external_id=start + i,
+                name="Куртка", brand="Бренд", supplier="Поставщик", supplier_rating=4.0,
+                review_rating=4.0, feedbacks=1, price=100,
+            )
+            for i in range(count)
+        ]
+
+    def test_concurrent_batches_coalesce(self):
+        """Пакеты одновременных парсингов пишутся общими транзакциями"""
+        futures = [self.writer.submit(self._instances(index * 100, 50)) for index in range(20)]
+
+        self.assertEqual([future.result() for future in futures], [50] * 20)
+        self.assertEqual(ProductResultModel.objects.count(), 1000)
+        stats = self.writer.stats
+        self.assertEqual(stats["submissions"], 20)
+        self.assertLess(stats["flushes"], 20)
+
+    def test_failed_batch_does_not_lose_others(self):
+        """Ошибка одного пакета не откатывает пакеты других парсингов"""
+        good = self.writer.submit(self._instances(0, 10))
+        bad = self.writer.submit(self._instances(100, 10, search_query_id=999999))
+        other = self.writer.submit(self._instances(200, 10))
+
+        self.assertEqual(good.result(), 10)
+        self.assertEqual(other.result(), 10)
+        with self.assertRaises(Exception):
+            bad.result()
+        self.assertEqual(ProductResultModel.objects.count(), 20)
+        self.assertEqual(self.writer.stats["fallback_flushes"], 1)
+
+
+class IngestBackendTests(TransactionTestCase):
+    """Тесты выбора и работы backend записи результатов"""
+
+    def setUp(self):
+        self.query = SearchQueryModel.objects.create(query_text="платье")
+
+    def _instances(self, external_ids, **fields):
+        return [
+            build_product_result(
+                self.query.id, external_id=external_id,
+                **{"name": "Платье", "brand": "Бренд", "supplier": "Поставщик", "supplier_rating": 4.5,
+                   "review_rating": 4.0, "feedbacks": 3, "price": 1999.5, **fields},
+            )
+            for external_id in external_ids
+        ]
+
+    def test_backend_resolved_by_vendor(self):
+        """auto выбирает COPY только для PostgreSQL"""
+        expected = "copy" if connection.vendor == "postgresql" else "bulk_create"
+        self.assertEqual(resolve_ingest_backend(), expected)
+
+        if connection.vendor != "postgresql":
+            with override_settings(MARKETPLACE_PARSER={"INGEST_BACKEND": "copy"}):
+                with self.assertRaises(ImproperlyConfigured):
+                    resolve_ingest_backend()
+
+    def test_copy_rows_encoding(self):
+        """CSV для COPY: ссылка на каталог, NULL и приведение типов"""
+        instances = self._instances([1], name='Платье "миди",\nс поясом', brand="")
+
+        content = PostgresCopyIngestBackend().encode_rows(instances)
+        row = next(csv.reader(io.StringIO(content)))
+        columns = [field.column for field in PostgresCopyIngestBackend().fields]
+        values = dict(zip(columns, row))
+
+        self.assertEqual(values["search_query_id"], str(self.query.id))
+        # Строки товара хранятся в каталоге, результат ссылается на него
+        self.assertNotIn("name", values)
+        self.assertEqual(values["product_id"], "1")
+        self.assertEqual(values["price"], "1999")
+        self.assertTrue(values["created_at"])
+        # NULL - пустая строка в кавычках, читается как NULL через FORCE_NULL
+        self.assertEqual(values["removed_at"], "")
+
+    def test_duplicates_skipped(self):
+        """Повторная запись тех же товаров не создает дублей"""
+        with transaction.atomic():
+            insert_products(self._instances(range(5)))
+        with transaction.atomic():
+            insert_products(self._instances(range(3, 8)))
+
+        self.assertEqual(ProductResultModel.objects.filter(search_query=self.query).count(), 8)
+
+    @unittest.skipUnless(connection.vendor == "postgresql", "COPY поддерживается только PostgreSQL")
+    def test_copy_backend_counts_inserted_rows(self):
+        """COPY возвращает количество фактически добавленных строк"""
+        backend = PostgresCopyIngestBackend()
+        with transaction.atomic():
+            self.assertEqual(backend.insert(self._instances(range(5))), 5)
+            self.assertEqual(backend.insert(self._instances(range(3, 8))), 3)
+
+
+class ProductCatalogTests(TransactionTestCase):
+    """Тесты каталога товаров, общего для поисковых запросов"""
+
+    def setUp(self):
+        self.service = MarketplaceParserService()
+        self.page = build_search_page(FakeMarketplaceConfig(total=50, page_size=50), "шапка", 1)
+
+    def _parse(self, query: SearchQueryModel) -> SearchQueryModel:
+        self.service._process_products(query, self.page["data"]["products"])
+        self.service.complete_search_query(query.id)
+        return query
+
+    def test_overlapping_queries_share_catalog(self):
+        """Товар из нескольких запросов хранится в каталоге один раз"""
+        self._parse(SearchQueryModel.objects.create(query_text="шапка"))
+        second = SearchQueryModel.objects.create(query_text="шапка зимняя")
+        with CaptureQueriesContext(connection) as queries:
+            self._parse(second)
+
+        self.assertEqual(ProductModel.objects.count(), 50)
+        self.assertEqual(BrandModel.objects.count(), 7)
+        self.assertEqual(SupplierModel.objects.count(), 5)
+        self.assertEqual(ProductResultModel.objects.count(), 100)
+        # Второй запрос пишет только ссылки на каталог
+        catalog_inserts = [
+            query["sql"] for query in queries.captured_queries
+            if query["sql"].startswith("INSERT") and "product_results" not in query["sql"]
+        ]
+        self.assertEqual(catalog_inserts, [])
+        self.assertEqual(
+            list(second.results.order_by("position").values_list("position", flat=True)[:3]), [1, 2, 3]
+        )
+
+    def test_result_keeps_response_shape(self):
+        """Ответ результатов содержит поля товара из каталога"""
+        query = self._parse(SearchQueryModel.objects.create(query_text="шапка"))
+        response = APIClient().get(reverse("products-result"), {"id": query.id, "brand_sort": "desc"})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        item = response.data["results"][0]
+        self.assertEqual(tuple(item), PRODUCT_RESULT_FIELDS)
+        self.assertEqual(item["brand"], "Бренд 6")
+        product = ProductModel.objects.get(external_id=item["external_id"])
+        self.assertEqual((item["name"], item["supplier"]), (product.name, product.supplier.name))
+
+    def test_changed_names_updated_only_on_request(self):
+        """Парсинг сохраняет первое название товара, обновление - последнее"""
+        query = self._parse(SearchQueryModel.objects.create(query_text="шапка"))
+        renamed = build_product_result(
+            query.id, external_id=1_000_000, name="Новое название", brand="Новый бренд",
+            supplier="Поставщик 0", supplier_rating=4.0, review_rating=3.0, feedbacks=0, price=1000,
+        )
+
+        with transaction.atomic():
+            self.assertEqual(save_catalog([renamed]), 0)
+        self.assertEqual(ProductModel.objects.get(external_id=1_000_000).name, "шапка 0")
+
+        with transaction.atomic():
+            self.assertEqual(save_catalog([renamed], update=True), 1)
+        product = ProductModel.objects.get(external_id=1_000_000)
+        self.assertEqual((product.name, product.brand.name), ("Новое название", "Новый бренд"))
+
+    def test_catalog_update_invalidates_other_queries(self):
+        """Обновление товара каталога видно во всех запросах с ним и меняет их версию"""
+        first = self._parse(SearchQueryModel.objects.create(query_text="шапка"))
+        second = self._parse(SearchQueryModel.objects.create(query_text="шапка зимняя"))
+        other = SearchQueryModel.objects.create(query_text="шарф")
+        first.refresh_from_db()
+        second.refresh_from_db()
+        renamed = build_product_result(
+            first.id, external_id=1_000_000, name="Новое название", brand="Новый бренд",
+            supplier="Поставщик 0", supplier_rating=4.0, review_rating=3.0, feedbacks=0, price=1000,
+        )
+
+        with transaction.atomic():
+            save_catalog([renamed], update=True)
+
+        for query in (first, second):
+            version = query.results_version
+            query.refresh_from_db()
+            self.assertEqual(query.results_version, version + 1)
+            result = query.results.with_catalog().get(product_id=1_000_000)
+            self.assertEqual((result.name, result.brand), ("Новое название", "Новый бренд"))
+        other.refresh_from_db()
+        self.assertEqual(other.results_version, 0)
+
+    def test_migration_fills_positions(self):
+        """Миграция 0011 нумерует результаты без позиции по порядку записи"""
+        fill_positions = import_module(
+            "parser.migrations.0011_product_result_sort_columns"
+        ).fill_positions
+        query = self._parse(SearchQueryModel.objects.create(query_text="шапка"))
+        ids = list(query.results.order_by("id").values_list("id", flat=True))
+        query.results.filter(id__in=ids[10:]).update(position=0)
+
+        fill_positions(django_apps, None)
+
+        self.assertEqual(
+            list(query.results.order_by("id").values_list("position", flat=True)), list(range(1, 51))
+        )
+
+    def test_known_products_read_by_primary_key(self):
+        """Пакет из известных каталогу товаров - один SELECT по ключу, без записи каталога"""
+        first = self._parse(SearchQueryModel.objects.create(query_text="шапка"))
+        known = [
+            build_product_result(
+                first.id, external_id=1_000_000 + i, name="Другое название", brand="Другой бренд",
+                supplier="Другой поставщик", supplier_rating=4.0, review_rating=3.0, feedbacks=0,
+                price=1000,
+            )
+            for i in range(10)
+        ]
+
+        with transaction.atomic(), self.assertNumQueries(1):
+            self.assertEqual(save_catalog(known), 0)
+
+
+class DeepCrawlTests(FakeMarketplaceTestCase):
+    """Тесты глубокого обхода выдачи"""
+
+    def _crawl(self, total: int, max_page: int | None = None, **query_options):
+        self.server.config = FakeMarketplaceConfig(total=total, page_size=100, max_page=max_page)
+        query = SearchQueryModel.objects.create(query_text="носки", **query_options)
+        service = MarketplaceParserService()
+        service.run_parsing(query.id, query.query_text)
+        query.refresh_from_db()
+        return query, service.last_pipeline_stats["crawl"]
+
+    def test_regular_parsing_limited_to_max_pages(self):
+        """Без deep_crawl обход ограничен MAX_PAGES"""
+        query, crawl = self._crawl(2500)
+
+        self.assertEqual(query.total_results, 1000)
+        self.assertEqual(crawl["pages_planned"], MarketplaceParserService.MAX_PAGES)
+
+    def test_deep_crawl_walks_all_pages(self):
+        """deep_crawl загружает всю выдачу"""
+        query, crawl = self._crawl(2550, deep_crawl=True)
+
+        self.assertEqual(query.total_results, 2550)
+        self.assertEqual(self.server.requests_count, 26)
+        self.assertIsNone(crawl["stop_reason"])
+
+    def test_deep_crawl_page_cap(self):
+        """max_pages запроса ограничивает глубокий обход"""
+        query, _ = self._crawl(2500, deep_crawl=True, max_pages=12)
+
+        self.assertEqual(query.total_results, 1200)
+        self.assertEqual(self.server.requests_count, 12)
+
+    def test_stops_on_repeated_page(self):
+        """Повтор последней страницы останавливает обход"""
+        query, crawl = self._crawl(100000, max_page=15, deep_crawl=True)
+
+        self.assertEqual(query.total_results, 1500)
+        self.assertEqual(crawl["stop_reason"], "duplicate_page")
+        self.assertEqual(crawl["last_page"], 15)
+        # Сверх конца выдачи загружены только страницы, уже бывшие в работе
+        self.assertLessEqual(self.server.requests_count, 16 + parser_settings("PIPELINE_FETCHERS"))
+
+    def test_async_engine_stops_on_repeated_page(self):
+        """Асинхронный движок тоже останавливается на повторе страницы"""
+        self.server.config = FakeMarketplaceConfig(total=100000, page_size=100, max_page=3)
+        query = SearchQueryModel.objects.create(query_text="носки", deep_crawl=True, max_pages=40)
+        engine = AsyncParsingEngine(concurrency=2)
+        try:
+            engine.run(query.id, query.query_text)
+        finally:
+            engine.close()
+
+        query.refresh_from_db()
+        self.assertEqual(query.total_results, 300)
+        self.assertLess(self.server.requests_count, 40)
+
+    def test_create_with_deep_crawl(self):
+        """Параметры глубокого обхода принимаются при создании запроса"""
+        with patch.object(MarketplaceParserService, "start_parsing"):
+            response = APIClient().post(
+                reverse("search-list"), {"query_text": "шапка", "deep_crawl": True, "max_pages": 50}
+            )
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        query = SearchQueryModel.objects.get(query_text="шапка")
+        self.assertTrue(query.deep_crawl)
+        self.assertEqual(query.max_pages, 50)
+
+
+class CrawlControlTests(SimpleTestCase):
+    """Тесты определения конца выдачи и адаптивного лимита загрузок"""
+
+    @staticmethod
+    def _page(*ids):
+        return [{"id": product_id} for product_id in ids]
+
+    def test_empty_page_ends_crawl(self):
+        progress = CrawlProgress(last_page=50)
+        self.assertTrue(progress.register(1, self._page(1, 2)))
+        self.assertFalse(progress.register(7, []))
+
+        self.assertEqual(progress.last_page, 6)
+        self.assertEqual(progress.stop_reason, "empty_page")
+        self.assertFalse(progress.should_fetch(7))
+
+    def test_out_of_order_duplicate(self):
+        """Из двух одинаковых страниц повтором считается страница с большим номером"""
+        progress = CrawlProgress(last_page=50)
+        self.assertTrue(progress.register(6, self._page(5, 6)))
+        self.assertTrue(progress.register(4, self._page(5, 6)))
+        self.assertEqual(progress.last_page, 5)
+        self.assertFalse(progress.register(5, self._page(6, 5)))
+
+        self.assertEqual(progress.last_page, 4)
+        self.assertEqual(progress.stop_reason, "duplicate_page")
+
+    def test_restored_page_detects_duplicate(self):
+        """Отпечаток страницы из контрольной точки учитывается после рестарта"""
+        progress = CrawlProgress(last_page=50)
+        progress.restore(8, page_fingerprint(self._page(7, 8)))
+        self.assertFalse(progress.register(9, self._page(8, 7)))
+
+        self.assertEqual(progress.last_page, 8)
+        self.assertEqual(progress.stop_reason, "duplicate_page")
+
+    def test_limit_follows_latency(self):
+        limiter = AdaptiveConcurrencyLimiter(min_limit=1, max_limit=8, initial_limit=2)
+        for _ in range(10):
+            limiter._update(0.05)
+        self.assertEqual(limiter.limit, 8)
+
+        # Сервер замедлился в 10 раз: лимит снижается до минимума
+        for _ in range(100):
+            limiter._update(0.5)
+        self.assertEqual(limiter.limit, 1)
+        self.assertEqual(limiter.peak_limit, 8)
+
+    def test_slot_limits_concurrency(self):
+        limiter = AdaptiveConcurrencyLimiter(min_limit=2, max_limit=2)
+        active, peak = [0], [0]
+        lock = threading.Lock()
+
+        def work():
+            with limiter.slot():
+                with lock:
+                    active[0] += 1
+                    peak[0] = max(peak[0], active[0])
+                time.sleep(0.01)
+                with lock:
+                    active[0] -= 1
+
+        threads = [threading.Thread(target=work) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(peak[0], 2)
+
+
+class ThrottlingTests(FakeMarketplaceTestCase):
+    """Тесты общего лимита частоты и повторов на заглушке, отвечающей 429"""
+
+    # Медленный старт и быстрые повторы: тест укладывается в секунды
+    PARSER_SETTINGS = {
+        "RATE_LIMIT": 40.0, "RATE_LIMIT_MAX": 200.0, "RATE_LIMIT_BURST": 5,
+        "HTTP_RETRY_BACKOFF": 0.01, "HTTP_RETRY_MAX_BACKOFF": 0.2, "HTTP_MAX_RETRIES": 6,
+    }
+
+    def _parse(self, **config):
+        self.server.config = FakeMarketplaceConfig(total=2000, page_size=100, **config)
+        query = SearchQueryModel.objects.create(query_text="кеды", deep_crawl=True)
+        service = MarketplaceParserService()
+        service.run_parsing(query.id, query.query_text)
+        query.refresh_from_db()
+        return query, service
+
+    def test_throttled_parsing_loses_no_pages(self):
+        """Ответы 429 повторяются: сохраняются все страницы выдачи"""
+        query, service = self._parse(rate_limit=20, rate_burst=3, retry_after="0.05")
+
+        self.assertGreater(self.server.throttled_count, 0)
+        self.assertEqual(query.total_results, 2000)
+        self.assertEqual(service.last_pipeline_stats["crawl"]["failed_pages"], [])
+        self.assertGreater(get_rate_limiter().throttled_count, 0)
+
+    def test_async_engine_retries_throttled_pages(self):
+        self.server.config = FakeMarketplaceConfig(total=1000, rate_limit=20, rate_burst=3,
+                                                   retry_after="0.05")
+        query = SearchQueryModel.objects.create(query_text="кеды")
+        engine = AsyncParsingEngine(concurrency=8)
+        try:
+            engine.run(query.id, query.query_text)
+        finally:
+            engine.close()
+
+        query.refresh_from_db()
+        self.assertGreater(self.server.throttled_count, 0)
+        self.assertEqual(query.total_results, 1000)
+
+    def test_exhausted_retries_fail_parsing(self):
+        """Страница, не загруженная после всех повторов, не пропускается молча"""
+        query = SearchQueryModel.objects.create(query_text="кеды")
+        self.server.config = FakeMarketplaceConfig(rate_limit=0.001, rate_burst=1, retry_after=None)
+
+        with self.override_parser_settings(HTTP_MAX_RETRIES=1, HTTP_RETRY_MAX_BACKOFF=0.01):
+            with self.assertRaises(IncompleteParsingError) as raised:
+                MarketplaceParserService().run_parsing(query.id, query.query_text)
+
+        self.assertEqual(raised.exception.pages, [2, 3])
+        query.refresh_from_db()
+        self.assertFalse(query.is_completed)
+
+    def test_service_error_is_not_invalid_query(self):
+        """Сбой маркетплейса на первой странице не помечает запрос невалидным"""
+        query = SearchQueryModel.objects.create(query_text="кеды")
+        self.server.config = FakeMarketplaceConfig(rate_limit=0.001, rate_burst=0, retry_after=None)
+
+        with self.override_parser_settings(HTTP_MAX_RETRIES=0):
+            with self.assertRaises(IncompleteParsingError):
+                MarketplaceParserService().run_parsing(query.id, query.query_text)
+
+        query.refresh_from_db()
+        self.assertFalse(query.is_completed)
+
+
+class RateLimiterTests(SimpleTestCase):
+    """Тесты token bucket, AIMD и задержек повторов"""
+
+    def test_bucket_reserves_in_order(self):
+        bucket = TokenBucket(rate=10, burst=2)
+        waits = [bucket.reserve() for _ in range(4)]
+
+        self.assertEqual(waits[:2], [0.0, 0.0])
+        self.assertAlmostEqual(waits[2], 0.1, delta=0.01)
+        self.assertAlmostEqual(waits[3], 0.2, delta=0.01)
+
+    def test_aimd(self):
+        limiter = AdaptiveRateLimiter(rate=10, burst=1, min_rate=1, max_rate=12, cooldown=60)
+        for _ in range(100):
+            limiter.on_success()
+        self.assertEqual(limiter.rate, 12)
+
+        # Пачка отказов уменьшает частоту один раз за cooldown
+        limiter.on_throttle()
+        limiter.on_throttle()
+        self.assertEqual(limiter.rate, 6)
+        self.assertEqual(limiter.throttled_count, 2)
+
+    def test_retry_after_pauses_requests(self):
+        limiter = AdaptiveRateLimiter(rate=100, burst=100, min_rate=1, max_rate=100)
+        limiter.on_throttle(retry_after=2)
+        self.assertAlmostEqual(limiter.reserve(), 2, delta=0.05)
+
+    def test_parse_retry_after(self):
+        self.assertEqual(parse_retry_after("3"), 3)
+        self.assertEqual(parse_retry_after("0.5"), 0.5)
+        self.assertIsNone(parse_retry_after("скоро"))
+        http_date = (timezone.now() + timedelta(seconds=30)).strftime("%a, %d %b %Y %H:%M:%S GMT")
+        self.assertAlmostEqual(parse_retry_after(http_date), 30, delta=2)
+
+    def test_backoff_jitter_bounds(self):
+        policy = RetryPolicy(max_retries=5, backoff=0.5, max_backoff=3)
+        for attempt in range(6):
+            delays = [policy.delay(attempt, None) for _ in range(50)]
+            self.assertTrue(all(0 <= delay <= min(3, 0.5 * 2 ** attempt) for delay in delays))
+        self.assertEqual(len(set(delays)), 50)
+
+
+class ParseCheckpointTests(FakeMarketplaceTestCase):
+    """Тесты контрольных точек страниц и возобновления парсинга"""
+
+    def _fail_after_first_page(self, query):
+        """Парсинг, в котором страницы после первой не загружаются"""
+        self.server.config = FakeMarketplaceConfig(rate_limit=0.001, rate_burst=1, retry_after=None)
+        with self.override_parser_settings(HTTP_MAX_RETRIES=0):
+            with self.assertRaises(IncompleteParsingError):
+                MarketplaceParserService().run_parsing(query.id, query.query_text)
+        self.server.config = FakeMarketplaceConfig()
+        self.server.requests_count = 0
+
+    def test_pages_are_checkpointed(self):
+        query = SearchQueryModel.objects.create(query_text="пальто")
+        MarketplaceParserService().run_parsing(query.id, query.query_text)
+
+        pages = list(query.pages.values_list("page", "status", "products_count", "reported_total"))
+        self.assertEqual(pages, [
+            (1, "done", 100, 250), (2, "done", 100, 250), (3, "done", 50, 250),
+        ])
+
+    def test_resume_fetches_only_missing_pages(self):
+        """Повторный запуск загружает только страницы с ошибкой"""
+        query = SearchQueryModel.objects.create(query_text="пальто")
+        self._fail_after_first_page(query)
+        self.assertEqual(
+            list(query.pages.values_list("page", "status")),
+            [(1, "done"), (2, "failed"), (3, "failed")],
+        )
+
+        service = MarketplaceParserService()
+        service.run_parsing(query.id, query.query_text)
+
+        query.refresh_from_db()
+        self.assertTrue(query.is_completed)
+        self.assertEqual(query.total_results, 250)
+        self.assertEqual(self.server.requests_count, 2)
+        self.assertEqual(service.last_pipeline_stats["crawl"]["resumed_pages"], 1)
+        self.assertFalse(query.pages.exclude(status=ParsePageModel.Status.DONE).exists())
+
+    def test_async_engine_resumes(self):
+        query = SearchQueryModel.objects.create(query_text="пальто")
+        self._fail_after_first_page(query)
+
+        engine = AsyncParsingEngine(concurrency=2)
+        try:
+            engine.run(query.id, query.query_text)
+        finally:
+            engine.close()
+
+        query.refresh_from_db()
+        self.assertEqual(query.total_results, 250)
+        self.assertEqual(self.server.requests_count, 2)
+
+    def test_transform_error_marks_page_failed(self):
+        """Страница с ошибкой обработки отмечается failed и дозагружается возобновлением"""
+        query = SearchQueryModel.objects.create(query_text="пальто")
+        build_instances = MarketplaceParserService._build_product_instances
+
+        def failing_build_instances(service, search_query, products, page=1):
+            if page == 2:
+                raise ValueError("неверные данные")
+            return build_instances(service, search_query, products, page)
+
+        with patch.object(MarketplaceParserService, "_build_product_instances", failing_build_instances), \
+                self.assertLogs("parser.pipeline", "ERROR"):
+            with self.assertRaises(IncompleteParsingError) as raised:
+                MarketplaceParserService().run_parsing(query.id, query.query_text)
+
+        self.assertEqual(raised.exception.pages, [2])
+        self.assertEqual(
+            list(query.pages.values_list("page", "status", "error")),
+            [(1, "done", ""), (2, "failed", "ошибка обработки страницы: неверные данные"), (3, "done", "")],
+        )
+
+        MarketplaceParserService().run_parsing(query.id, query.query_text)
+        query.refresh_from_db()
+        self.assertTrue(query.is_completed)
+        self.assertEqual(query.results.count(), 250)
+
+    def test_async_engine_write_error_marks_page_failed(self):
+        """Страница с ошибкой записи не теряется: парсинг не завершается"""
+        query = SearchQueryModel.objects.create(query_text="пальто")
+        process_products = MarketplaceParserService._process_products
+
+        def failing_process_products(service, search_query, products, page=None, reported_total=0):
+            if page == 2:
+                raise RuntimeError("диск")
+            return process_products(service, search_query, products, page, reported_total)
+
+        engine = AsyncParsingEngine(concurrency=2)
+        try:
+            with patch.object(MarketplaceParserService, "_process_products", failing_process_products), \
+                    self.assertLogs("parser.async_engine", "ERROR"):
+                with self.assertRaises(IncompleteParsingError) as raised:
+                    engine.run(query.id, query.query_text)
+        finally:
+            engine.close()
+
+        self.assertEqual(raised.exception.pages, [2])
+        query.refresh_from_db()
+        self.assertFalse(query.is_completed)
+        self.assertEqual(
+            list(query.pages.values_list("page", "status")),
+            [(1, "done"), (2, "failed"), (3, "done")],
+        )
+
+    def test_resume_action(self):
+        """Возобновление через API ставит задание, которое дозагружает страницы"""
+        query = SearchQueryModel.objects.create(query_text="пальто")
+        self._fail_after_first_page(query)
+
+        with self.override_parser_settings(JOB_BACKEND="queue"):
+            response = APIClient().post(reverse("search-resume", args=[query.id]))
+            self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+            self.assertEqual(response.data, {"pages_done": 1, "failed_pages": [2, 3]})
+
+            # Повторное возобновление до выполнения задания отклоняется
+            response = APIClient().post(reverse("search-resume", args=[query.id]))
+            self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+
+            ParseWorker(concurrency=1, poll_interval=0.05).run(once=True)
+
+        query.refresh_from_db()
+        self.assertTrue(query.is_completed)
+        self.assertEqual(query.results.count(), 250)
+        self.assertEqual(self.server.requests_count, 2)
+
+        response = APIClient().post(reverse("search-resume", args=[query.id]))
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+
+
+class RefreshTests(FakeMarketplaceTestCase):
+    """Тесты обновления результатов запроса сравнением с сохраненными"""
+
+    def setUp(self):
+        super().setUp()
+        self.query = SearchQueryModel.objects.create(query_text="куртка")
+        MarketplaceParserService().run_parsing(self.query.id, self.query.query_text)
+
+    def _refresh(self, **config):
+        self.server.config = FakeMarketplaceConfig(**config)
+        service = MarketplaceParserService()
+        service.run_parsing(self.query.id, self.query.query_text, refresh=True)
+        self.query.refresh_from_db()
+        return service.last_pipeline_stats
+
+    def test_unchanged_results_are_not_written(self):
+        stats = self._refresh()
+
+        self.assertEqual(
+            stats["refresh"], {"inserted": 0, "updated": 0, "unchanged": 250, "removed": 0, "history": 0}
+        )
+        self.assertEqual(stats["write"]["products"], 0)
+        self.assertEqual(self.query.total_results, 250)
+
+    def test_changed_new_and_removed_products(self):
+        stats = self._refresh(total=240, revision=5)
+
+        self.assertEqual(
+            stats["refresh"], {"inserted": 0, "updated": 24, "unchanged": 216, "removed": 10, "history": 48}
+        )
+        self.assertEqual(self.query.total_results, 240)
+        self.assertEqual(self.query.results.get(product_id=1_000_010).price, 1000 + 10 + 5)
+        self.assertEqual(self.query.results.filter(removed_at__isnull=False).count(), 10)
+
+        response = APIClient().get(reverse("products-result"), {"id": self.query.id})
+        self.assertEqual(response.data["count"], 240)
+
+        # Пропавшие товары возвращаются в выдачу (у 1_000_240 с новой ценой), новые добавляются
+        stats = self._refresh(total=260, revision=5)
+        self.assertEqual(
+            stats["refresh"], {"inserted": 10, "updated": 10, "unchanged": 240, "removed": 0, "history": 2}
+        )
+        self.assertEqual(self.query.total_results, 260)
+        self.assertFalse(self.query.results.filter(removed_at__isnull=False).exists())
+
+    def test_refresh_action(self):
+        self.server.config = FakeMarketplaceConfig(revision=1)
+        with self.override_parser_settings(JOB_BACKEND="queue"):
+            response = APIClient().post(reverse("search-refresh", args=[self.query.id]))
+            self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+            self.assertEqual(self.query.jobs.get().kind, ParseJobModel.Kind.REFRESH)
+
+            response = APIClient().post(reverse("search-refresh", args=[self.query.id]))
+            self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+
+            ParseWorker(concurrency=1, poll_interval=0.05).run(once=True)
+
+        self.assertEqual(self.query.results.get(product_id=1_000_000).price, 1001)
+        self.assertEqual(self.query.results.count(), 250)
+
+
+class PriceHistoryTests(FakeMarketplaceTestCase):
+    """Тесты истории цен"""
+
+    def setUp(self):
+        super().setUp()
+        self.query = SearchQueryModel.objects.create(query_text="рюкзак")
+        MarketplaceParserService().run_parsing(self.query.id, self.query.query_text)
+        self.product = self.query.results.get(product_id=1_000_010)
+
+    def _refresh(self, revision: int):
+        self.server.config = FakeMarketplaceConfig(revision=revision)
+        service = MarketplaceParserService()
+        service.run_parsing(self.query.id, self.query.query_text, refresh=True)
+        return service.last_pipeline_stats["refresh"]
+
+    def _series(self, **params):
+        response = APIClient().get(reverse("products-history", args=[self.product.id]), params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return [point["price"] for point in response.data["series"]]
+
+    def test_history_written_only_on_change(self):
+        self.assertFalse(PriceHistoryModel.objects.exists())
+        self.assertEqual(self._series(), [1010])
+
+        self.assertEqual(self._refresh(revision=0)["history"], 0)
+        # Первое изменение: исходные значения и новые для 25 товаров
+        self.assertEqual(self._refresh(revision=3)["history"], 50)
+        self.assertEqual(self._refresh(revision=3)["history"], 0)
+        self.assertEqual(self._refresh(revision=7)["history"], 25)
+
+        self.assertEqual(self._series(), [1010, 1013, 1017])
+        self.assertEqual(self.product.history.count(), 3)
+        last = self.product.history.last()
+        self.assertEqual(str(last), f"{self.product.id} - {last.observed_at:%d.%m.%Y %H:%M}: 1017")
+        # Товар без изменений цены истории не получает
+        self.assertFalse(self.query.results.get(product_id=1_000_011).history.exists())
+
+    def test_series_period_and_price_changes(self):
+        self._refresh(revision=3)
+        between = timezone.now()
+        time.sleep(0.01)
+        self._refresh(revision=7)
+
+        # Ряд начинается со значения на момент since
+        self.assertEqual(self._series(since=between.isoformat()), [1013, 1017])
+        self.assertEqual(self._series(until=between.isoformat()), [1010, 1013])
+
+        response = APIClient().get(
+            reverse("products-price-changes"),
+            {"id": self.query.id, "since": between.isoformat(), "page_size": 100},
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["count"], 25)
+        change = next(item for item in response.data["results"] if item["id"] == self.product.id)
+        self.assertEqual((change["old_price"], change["new_price"], change["delta"]), (1013, 1017, 4))
+
+    def test_series_after_last_change(self):
+        """Период после последнего изменения содержит значение на его начало"""
+        self._refresh(revision=3)
+        since = timezone.now()
+
+        response = APIClient().get(
+            reverse("products-history", args=[self.product.id]), {"since": since.isoformat()}
+        )
+
+        [point] = response.data["series"]
+        self.assertEqual(point["price"], 1013)
+        self.assertEqual(parse_datetime(point["observed_at"]), since)
+        # Товар без истории не менялся: его значение действует и в периоде
+        unchanged = self.query.results.get(product_id=1_000_011)
+        self.assertEqual(
+            [point["price"] for point in get_price_series(unchanged, since=since)], [unchanged.price]
+        )
+
+    def test_price_changes_read_only_period(self):
+        """Изменения цен читают историю только товаров, менявшихся в периоде"""
+        self._refresh(revision=3)
+        between = timezone.now()
+        time.sleep(0.01)
+        self._refresh(revision=7)
+
+        changes = get_price_changes(self.query.id, since=between)
+        before = get_price_changes(self.query.id, since=between - timedelta(hours=1), until=between)
+
+        self.assertEqual(len(changes), 25)
+        change = next(item for item in changes if item["id"] == self.product.id)
+        self.assertEqual(
+            (change["old_price"], change["new_price"], change["name"]), (1013, 1017, self.product.product.name)
+        )
+        # На момент since товаров еще не было: сравнивать не с чем
+        self.assertEqual(before, [])
+        self.assertEqual(get_price_changes(self.query.id, since=timezone.now()), [])
+
+    def test_invalid_parameters(self):
+        url = reverse("products-price-changes")
+        self.assertEqual(APIClient().get(url, {"id": self.query.id}).status_code, 400)
+        self.assertEqual(
+            APIClient().get(url, {"id": self.query.id, "since": "вчера"}).status_code, 400
+        )
+        self.assertEqual(APIClient().get(url, {"id": 999999, "since": "2025-01-01"}).status_code, 404)
+
+
+class DroppingEventBroker(InMemoryEventBroker):
+    """Брокер другого процесса: события парсинга до слушателя не доходят"""
+
+    def publish(self, topic: str, event: dict) -> int:
+        return 0
+
+
+class ProgressEventTests(FakeMarketplaceTestCase):
+    """Тесты потока событий хода парсинга (SSE)"""
+
+    PARSER_SETTINGS = {**FakeMarketplaceTestCase.PARSER_SETTINGS, "EVENTS_KEEPALIVE": 0.5}
+
+    @staticmethod
+    def _events(chunks) -> list[tuple[str, dict]]:
+        events = []
+        content = "".join(chunk.decode() for chunk in chunks)
+        for block in content.split("\n\n"):
+            fields = dict(
+                line.split(": ", 1) for line in block.splitlines() if not line.startswith(":")
+            )
+            if "event" in fields:
+                events.append((fields["event"], json.loads(fields["data"])))
+        return events
+
+    @staticmethod
+    def _parse(query: SearchQueryModel):
+        try:
+            MarketplaceParserService()._parse_marketplace(query.id, query.query_text)
+        finally:
+            connection.close()
+
+    def test_stream_reports_pages_and_completion(self):
+        """Слушатель получает записанные страницы и завершение парсинга"""
+        query = SearchQueryModel.objects.create(query_text="свитер")
+        response = APIClient().get(
+            reverse("search-events", args=[query.id]), HTTP_ACCEPT="text/event-stream"
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response["Content-Type"], "text/event-stream")
+
+        chunks = iter(response.streaming_content)
+        # Первый фрагмент - состояние до начала парсинга (слушатель уже подписан)
+        [(event_type, snapshot)] = self._events([next(chunks)])
+        self.assertEqual((event_type, snapshot["pages_done"]), ("progress", 0))
+
+        thread = threading.Thread(target=self._parse, args=(query,))
+        thread.start()
+        events = self._events(chunks)
+        thread.join()
+
+        self.assertEqual([event_type for event_type, _ in events], ["page"] * 3 + ["completed"])
+        self.assertEqual(sorted(data["page"] for _, data in events[:3]), [1, 2, 3])
+        self.assertEqual(events[2][1]["pages_done"], 3)
+        self.assertEqual(events[2][1]["products_total"], 250)
+        self.assertEqual(events[3][1]["total_results"], 250)
+
+    def test_completed_query_stream_ends(self):
+        """Для завершенного запроса поток сразу отдает состояние и завершение"""
+        query = SearchQueryModel.objects.create(query_text="свитер", is_completed=True, total_results=5)
+        response = APIClient().get(reverse("search-events", args=[query.id]))
+
+        events = self._events(response.streaming_content)
+        self.assertEqual([event_type for event_type, _ in events], ["progress", "completed"])
+        self.assertEqual(events[1][1]["total_results"], 5)
+
+    def test_stream_with_queue_backend(self):
+        """Парсинг воркером очереди виден в потоке по контрольным точкам в БД"""
+        settings = self.override_parser_settings(
+            JOB_BACKEND="queue", EVENTS_POLL_INTERVAL=0.05,
+            EVENTS_BACKEND="parser.tests.DroppingEventBroker",
+        )
+        settings.enable()
+        reset_event_broker()
+        self.addCleanup(reset_event_broker)
+        self.addCleanup(settings.disable)
+
+        query = SearchQueryModel.objects.create(query_text="жилет")
+        MarketplaceParserService().start_parsing(query.id, query.query_text)
+        response = APIClient().get(reverse("search-events", args=[query.id]))
+        chunks = iter(response.streaming_content)
+        self.assertEqual(self._events([next(chunks)])[0][1]["pages_done"], 0)
+
+        def work():
+            try:
+                ParseWorker(concurrency=1, poll_interval=0.05).run(once=True)
+            finally:
+                connection.close()
+
+        thread = threading.Thread(target=work)
+        thread.start()
+        events = self._events(chunks)
+        thread.join()
+
+        self.assertEqual(events[-1][0], "completed")
+        self.assertEqual(events[-1][1]["total_results"], 250)
+        pages = [data for event_type, data in events if event_type == "page"]
+        self.assertEqual(sorted(data["page"] for data in pages), [1, 2, 3])
+        self.assertEqual(pages[-1]["products_total"], 250)
+
+    def test_streams_are_limited(self):
+        """Сверх EVENTS_MAX_STREAMS поток не открывается, место освобождается при закрытии"""
+        query = SearchQueryModel.objects.create(query_text="жилет")
+        client = APIClient()
+        with self.override_parser_settings(EVENTS_MAX_STREAMS=1):
+            first = client.get(reverse("search-events", args=[query.id]))
+            second = client.get(reverse("search-events", args=[query.id]))
+            self.assertEqual(second.status_code, status.HTTP_503_SERVICE_UNAVAILABLE)
+            self.assertEqual(active_streams_count(), 1)
+
+            first.close()
+            self.assertEqual(active_streams_count(), 0)
+            third = client.get(reverse("search-events", args=[query.id]))
+            self.assertEqual(third.status_code, status.HTTP_200_OK)
+            third.close()
+
+    def test_slow_listener_keeps_latest_events(self):
+        """Отстающий слушатель теряет старые события, а не блокирует публикацию"""
+        broker = InMemoryEventBroker(queue_size=2)
+        with broker.subscribe("search:1") as subscription:
+            for page in range(1, 4):
+                self.assertEqual(broker.publish("search:1", {"page": page}), 1)
+            self.assertEqual([subscription.get(0)["page"], subscription.get(0)["page"]], [2, 3])
+            self.assertIsNone(subscription.get(0))
+
+        self.assertEqual(broker.publish("search:1", {"page": 4}), 0)
+        self.assertEqual(broker.subscribers_count("search:1"), 0)
+
+
+class FirstPageCacheTests(FakeMarketplaceTestCase):
+    """Тесты кэша первой страницы, общего для проверки запроса и парсинга"""
+
+    def test_parse_reuses_validated_first_page(self):
+        """Парсинг после проверки запроса не запрашивает первую страницу повторно"""
+        response = APIClient().post(
+            reverse("search-validate-query"), {"query": "Пиджак  "}, format="json"
+        )
+        self.assertEqual(response.data, {"total": 250})
+        self.assertEqual(self.server.requests_count, 1)
+
+        query = SearchQueryModel.objects.create(query_text="пиджак")
+        MarketplaceParserService().run_parsing(query.id, query.query_text)
+
+        # Страницы 2 и 3; первая взята из кэша и удалена из него
+        self.assertEqual(self.server.requests_count, 3)
+        self.assertEqual(query.results.count(), 250)
+        self.assertIsNone(MarketplaceParserService().take_cached_first_page("пиджак"))
+
+    def test_concurrent_validations_share_request(self):
+        """Одновременные проверки одного запроса ждут один запрос к маркетплейсу"""
+        calls = []
+        started = threading.Event()
+
+        def slow_get_data(query_text, page=1, return_data=False):
+            calls.append(query_text)
+            started.set()
+            time.sleep(0.2)
+            return True, 10, [], None
+
+        service = MarketplaceParserService()
+        with patch.object(MarketplaceParserService, "get_data", side_effect=slow_get_data):
+            results = []
+            threads = [
+                threading.Thread(target=lambda: results.append(service.get_first_page("шорты")))
+                for _ in range(5)
+            ]
+            threads[0].start()
+            started.wait()
+            for thread in threads[1:]:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            # Повторная проверка отвечает из кэша
+            service.get_first_page("ШОРТЫ")
+
+        self.assertEqual(calls, ["шорты"])
+        self.assertEqual(results, [(True, 10, [], None)] * 5)
+
+    def test_upstream_errors_are_not_cached(self):
+        """Сбой маркетплейса не кэшируется: следующая проверка повторяет запрос"""
+        with self.override_parser_settings(HTTP_MAX_RETRIES=0):
+            self.server.config = FakeMarketplaceConfig(rate_limit=0.001, rate_burst=1)
+            service = MarketplaceParserService()
+            self.assertTrue(service.get_first_page("брюки")[0])
+            self.assertFalse(service.get_first_page("брюки 2")[0])
+            self.assertFalse(service.get_first_page("брюки 2")[0])
+
+        self.assertEqual(self.server.requests_count, 3)
+
+    def test_queue_worker_reuses_validated_first_page(self):
+        """Воркер очереди берет первую страницу, полученную проверкой в веб-процессе"""
+        APIClient().post(reverse("search-validate-query"), {"query": "Плащ"}, format="json")
+
+        with self.override_parser_settings(JOB_BACKEND="queue"):
+            query = SearchQueryModel.objects.create(query_text="плащ")
+            MarketplaceParserService().start_parsing(query.id, query.query_text)
+            ParseWorker(concurrency=1, poll_interval=0.05).run(once=True)
+
+        self.assertEqual(query.results.count(), 250)
+        self.assertEqual(self.server.requests_count, 3)
+
+    def test_first_page_cache(self):
+        cache = FirstPageCache("first_page", ttl=60)
+        cache.set("пальто зимнее", (True, 1, [], None))
+
+        self.assertEqual(cache.pop("пальто зимнее"), (True, 1, [], None))
+        self.assertIsNone(cache.get("пальто зимнее"))
+        self.assertEqual((cache.hits, cache.misses), (1, 1))
+        disabled = FirstPageCache("first_page", ttl=0)
+        disabled.set("пальто", (True, 1, [], None))
+        self.assertIsNone(cache.get("пальто"))
+        self.assertEqual(normalize_query("  Куртка \t Зимняя "), "куртка зимняя")
+
+    def test_single_flight_propagates_errors(self):
+        flight = SingleFlight()
+        with self.assertRaises(ValueError):
+            flight.do("key", lambda: int("x"))
+        self.assertEqual(flight.do("key", lambda: 1), 1)
+        self.assertEqual(flight.in_flight(), 0)
+
+
+class BulkSubmissionTests(FakeMarketplaceTestCase):
+    """Тесты пакетного создания поисковых запросов"""
+
+    def test_bulk_creates_new_queries_and_enqueues_jobs(self):
+        """Существующие и повторные тексты не создаются, задания ставятся одним INSERT"""
+        existing = SearchQueryModel.objects.create(query_text="сумка")
+        payload = {"queries": ["сумка", "ремень", "кошелек", "ремень "]}
+
+        with self.override_parser_settings(JOB_BACKEND="queue"):
+            with CaptureQueriesContext(connection) as queries:
+                response = APIClient().post(reverse("search-bulk"), payload, format="json")
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        results = response.data["results"]
+        self.assertEqual(
+            [(item["query_text"], item["status"]) for item in results],
+            [("сумка", "exists"), ("ремень", "created"), ("кошелек", "created"), ("ремень", "duplicate")],
+        )
+        self.assertEqual(results[0]["id"], existing.id)
+        self.assertEqual(results[1]["id"], results[3]["id"])
+        self.assertEqual(
+            set(ParseJobModel.objects.values_list("search_query_id", flat=True)),
+            {results[1]["id"], results[2]["id"]},
+        )
+        inserts = [q["sql"] for q in queries.captured_queries if q["sql"].startswith("INSERT")]
+        self.assertEqual(len(inserts), 2)
+        self.assertEqual(self.server.requests_count, 0)
+
+        # Повторная отправка ничего не создает
+        with self.override_parser_settings(JOB_BACKEND="queue"):
+            response = APIClient().post(reverse("search-bulk"), payload, format="json")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(ParseJobModel.objects.count(), 2)
+
+    def test_bulk_validation(self):
+        client = APIClient()
+        self.assertEqual(
+            client.post(reverse("search-bulk"), {"queries": []}, format="json").status_code,
+            status.HTTP_400_BAD_REQUEST,
+        )
+        with self.override_parser_settings(BULK_MAX_QUERIES=2):
+            response = client.post(reverse("search-bulk"), {"queries": ["a", "b", "c"]}, format="json")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(SearchQueryModel.objects.exists())
+
+    def test_parse_pool_limits_concurrency(self):
+        """Пул запускает не больше заданного количества парсингов одновременно"""
+        pool = ParseThreadPool(workers=2)
+        lock = threading.Lock()
+        running, peak, done = [0], [0], threading.Semaphore(0)
+
+        def task():
+            with lock:
+                running[0] += 1
+                peak[0] = max(peak[0], running[0])
+            time.sleep(0.05)
+            with lock:
+                running[0] -= 1
+            done.release()
+
+        for _ in range(6):
+            pool.submit(task)
+        for _ in range(6):
+            self.assertTrue(done.acquire(timeout=5))
+
+        self.assertEqual(peak[0], 2)
+        self.assertEqual(pool.queue_depth, 0)
+
+
+class MetricsTests(FakeMarketplaceTestCase):
+    """Тесты метрик парсера и API"""
+
+    def test_parsing_records_metrics(self):
+        """Парсинг учитывает загрузки страниц, пакеты записи и скорость"""
+        fetches = FETCH_SECONDS.count(engine="threads")
+        inserts = DB_INSERT_BATCH_ROWS.count(backend="bulk_create")
+        parses = PRODUCTS_PER_SECOND.count(engine="threads")
+        query = SearchQueryModel.objects.create(query_text="шапка")
+
+        written = MarketplaceParserService().run_parsing(query.id, query.query_text)
+
+        self.assertEqual(written, 250)
+        self.assertEqual(FETCH_SECONDS.count(engine="threads"), fetches + 3)
+        self.assertGreater(DB_INSERT_BATCH_ROWS.count(backend="bulk_create"), inserts)
+        self.assertEqual(PRODUCTS_PER_SECOND.count(engine="threads"), parses + 1)
+        self.assertEqual(ACTIVE_PARSE_JOBS.value(engine="threads"), 0)
+
+    def test_page_failures_by_reason(self):
+        failures = PAGE_FAILURES.value(reason="http_429")
+        with self.override_parser_settings(HTTP_MAX_RETRIES=0):
+            self.server.config = FakeMarketplaceConfig(rate_limit=0.001, rate_burst=1)
+            MarketplaceParserService.get_data("носки", page=1)
+            MarketplaceParserService.get_data("носки", page=2)
+
+        self.assertEqual(PAGE_FAILURES.value(reason="http_429"), failures + 1)
+
+    def test_metrics_endpoint(self):
+        """/metrics отдает время ответа result по сортировке в формате Prometheus"""
+        query = SearchQueryModel.objects.create(query_text="шарф")
+        client = APIClient()
+        before = RESULT_SECONDS.count(sort="-price")
+        client.get(reverse("products-result"), {"id": query.id, "price_sort": "desc"})
+        self.assertEqual(RESULT_SECONDS.count(sort="-price"), before + 1)
+
+        response = client.get(reverse("metrics"))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response["Content-Type"].startswith("text/plain; version=0.0.4"))
+        body = response.content.decode()
+        self.assertIn("# TYPE api_products_result_seconds histogram", body)
+        self.assertIn('api_products_result_seconds_count{sort="-price"} ', body)
+        self.assertIn("parser_pool_queue_depth ", body)
+
+    def test_histogram_exposition(self):
+        registry = MetricsRegistry()
+        histogram = Histogram("demo_seconds", "Пример", ("kind",), buckets=(0.1, 1), registry=registry)
+        histogram.observe(0.05, kind='a"b')
+        histogram.observe(0.5, kind='a"b')
+
+        self.assertEqual(registry.render(), "\n".join([
+            "# HELP demo_seconds Пример",
+            "# TYPE demo_seconds histogram",
+            'demo_seconds_bucket{kind="a\\"b",le="0.1"} 1',
+            'demo_seconds_bucket{kind="a\\"b",le="1"} 2',
+            'demo_seconds_bucket{kind="a\\"b",le="+Inf"} 2',
+            'demo_seconds_sum{kind="a\\"b"} 0.55',
+            'demo_seconds_count{kind="a\\"b"} 2',
+        ]) + "\n")
+
+
+    def _demo_registry(self, requests: int, jobs: int, seconds: float) -> MetricsRegistry:
+        """Набор метрик "процесса" со значениями счетчика, Gauge и гистограммы"""
+        registry = MetricsRegistry("demo")
+        Counter("demo_requests_total", "Запросы", ("path",), registry=registry).inc(requests, path="/")
+        Gauge("demo_jobs", "Задания", registry=registry).set(jobs)
+        Histogram("demo_seconds", "Время", buckets=(0.1, 1), registry=registry).observe(seconds)
+        return registry
+
+    def test_snapshots_of_processes_are_summed(self):
+        """С METRICS_DIR /metrics суммирует снимки процессов, Gauge - только работающих"""
+        registry = self._demo_registry(requests=2, jobs=3, seconds=0.5)
+        with tempfile.TemporaryDirectory() as directory, \
+                self.override_parser_settings(METRICS_DIR=directory, METRICS_FLUSH_INTERVAL=1.0):
+            self._demo_registry(requests=5, jobs=4, seconds=0.05).write_snapshot(
+                directory, "demo-other-1.json"
+            )
+            stopped = self._demo_registry(requests=1, jobs=10, seconds=5).write_snapshot(
+                directory, "demo-other-2.json"
+            )
+            os.utime(stopped, (time.time() - 120, time.time() - 120))
+
+            body = registry.render()
+
+            self.assertTrue(os.path.exists(os.path.join(directory, registry.snapshot_filename())))
+            # Снимок остановленного процесса перенесен в общий файл и удален
+            self.assertFalse(os.path.exists(stopped))
+            self.assertTrue(os.path.exists(os.path.join(directory, registry.retired_filename())))
+            # Повторное чтение не учитывает перенесенный снимок дважды
+            self.assertEqual(registry.render(), body)
+        self.assertIn('demo_requests_total{path="/"} 8', body)
+        self.assertIn("demo_jobs 7", body)
+        self.assertIn('demo_seconds_bucket{le="0.1"} 1', body)
+        self.assertIn('demo_seconds_bucket{le="+Inf"} 3', body)
+        self.assertIn("demo_seconds_count 3", body)
+
+    def test_snapshot_files_are_per_process(self):
+        """Процесс с тем же pid пишет свой снимок, поток записи - только с METRICS_DIR"""
+        first = self._demo_registry(requests=1, jobs=1, seconds=0.1)
+        second = self._demo_registry(requests=1, jobs=1, seconds=0.1)
+
+        self.assertNotEqual(first.snapshot_filename(), second.snapshot_filename())
+        self.assertFalse(first._flusher_started)
+        with tempfile.TemporaryDirectory() as directory, \
+                self.override_parser_settings(METRICS_DIR=directory):
+            with patch.object(threading, "Thread") as thread:
+                Counter("demo_other_total", "Запросы", registry=first).inc()
+        thread.return_value.start.assert_called_once()
+        self.assertTrue(first._flusher_started)
+
+    def test_worker_jobs(self):
+        """Глубина очереди пула воркера: захваченные задания, ждущие потока"""
+        worker = ParseWorker(concurrency=2)
+        running, queued, finished = (concurrent.futures.Future() for _ in range(3))
+        running.set_running_or_notify_cancel()
+        finished.set_result(None)
+        worker._active = {running: None, queued: None, finished: None}
+
+        self.assertEqual(get_worker_jobs(), {"queued": 1, "running": 1})
+        body = APIClient().get(reverse("metrics")).content.decode()
+        self.assertIn('parser_worker_jobs{state="queued"} 1', body)
+        self.assertIn('parser_pipeline_queue_depth{queue="fetched"} 0', body)
+
+
+class ParseBenchmarkTests(FakeMarketplaceTestCase):
+    """Тесты заглушки маркетплейса с задержками и сбоями и прогона бенчмарка"""
+
+    def test_fake_server_faults(self):
+        """Задержка, случайные 503 и размер ответа задаются конфигурацией"""
+        self.server.config = FakeMarketplaceConfig(latency=0.05, error_rate=0.5, padding=1000, seed=7)
+        client = get_http_client()
+        started = time.perf_counter()
+        responses = [client.get(self.server.search_url, params={"query": "пальто"}) for _ in range(10)]
+
+        self.assertGreaterEqual(time.perf_counter() - started, 0.5)
+        statuses = [response.status_code for response in responses]
+        self.assertEqual(statuses.count(503), self.server.errors_count)
+        self.assertTrue(0 < self.server.errors_count < 10)
+        page = next(response for response in responses if response.status_code == 200)
+        self.assertEqual(len(page.json()["data"]["products"][0]["description"]), 1000)
+
+    def test_run_parse_benchmark(self):
+        """Прогон парсит все запросы целиком, сбои заглушки покрываются повторами"""
+        self.server.config = FakeMarketplaceConfig(error_rate=0.1, seed=3)
+        with self.override_parser_settings(HTTP_RETRY_BACKOFF=0.01):
+            result = run_parse_benchmark(self.server, 3)
+
+        self.assertEqual(result["rows"], 750)
+        self.assertEqual(result["pages"], 9)
+        self.assertEqual(result["failed_pages"], 0)
+        self.assertEqual(result["requests"], 9 + result["server_errors"])
+        self.assertGreater(result["rows_per_second"], 0)
+        self.assertLessEqual(result["job_p50_seconds"], result["job_p99_seconds"])
+        self.assertGreater(result["peak_rss_mb"], 0)
+
+
+class ApiLoadTests(TransactionTestCase):
+    """Тесты нагрузочного прогона API"""
+
+    def test_plan_covers_shapes(self):
+        plan = build_api_plan(
+            [1, 2], 250, sorts=["", "price_sort=desc"], page_sizes=[10, 100], depths=[1, 50],
+            history_page_sizes=[10], requests_count=18,
+        )
+
+        self.assertEqual(len(plan), 18)
+        shapes = {(item["endpoint"], item["sort"], item["page_size"], item["page"]) for item in plan}
+        # 2 сортировки x 2 размера x 2 глубины + история; глубина 50 ограничена последней страницей
+        self.assertEqual(len(shapes), 9)
+        self.assertIn(("result", "price_sort=desc", 100, 3), shapes)
+        self.assertIn(("history", "default", 10, 1), shapes)
+        self.assertTrue(all(item["params"]["id"] in (1, 2) for item in plan if item["endpoint"] == "result"))
+
+    def test_run_api_load(self):
+        """Прогон считает пропускную способность, перцентили и SQL-запросы по группам"""
+        search_query = seed_search_query("нагрузка", 150)
+        # Данные как после парсинга: сквозные позиции и контрольные точки страниц
+        self.assertEqual(
+            list(search_query.results.order_by("position").values_list("position", flat=True)),
+            list(range(1, 151)),
+        )
+        self.assertEqual(
+            list(search_query.pages.values_list("page", "status", "reported_total")),
+            [(1, "done", 150), (2, "done", 150)],
+        )
+        plan = build_api_plan(
+            [search_query.id], 150, sorts=["price_sort=asc", "name_sort=desc"], page_sizes=[10],
+            depths=[1, 2], history_page_sizes=[10], requests_count=20,
+        )
+
+        result = run_api_load(plan, concurrency=4)
+
+        total = result["total"]
+        self.assertEqual((total["requests"], total["errors"], total["concurrency"]), (20, 0, 4))
+        self.assertGreater(total["requests_per_second"], 0)
+        self.assertGreater(total["queries_avg"], 0)
+        self.assertLessEqual(total["p50_ms"], total["p99_ms"])
+        self.assertEqual(len(result["groups"]), 5)
+        self.assertEqual(sum(group["requests"] for group in result["groups"]), 20)
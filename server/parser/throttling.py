@@ -0,0 +1,263 @@
+import asyncio
+import email.utils
+import random
+import threading
+import time
+
+import httpx
+
+from .conf import parser_settings
+
+# Ответы, после которых запрос повторяется
+RETRY_STATUSES = frozenset({429, 500, 502, 503, 504})
+# Ответы, означающие, что маркетплейс просит снизить частоту запросов
+THROTTLE_STATUSES = frozenset({429, 503})
+
+
+class TokenBucket:
+    """
+    Ограничитель частоты запросов (token bucket)
+
+    Токены пополняются со скоростью rate в секунду, но не больше burst.
+    reserve() сразу списывает токен и возвращает, сколько нужно подождать:
+    долг ожидающих запросов гасится по мере пополнения, и очередность
+    запросов сохраняется без опроса в цикле.
+    """
+
+    def __init__(self, rate: float, burst: float):
+        """
+        Args:
+            rate: Запросов в секунду
+            burst: Максимальный запас токенов
+        """
+        self.rate = rate
+        self.burst = burst
+        self._tokens = burst
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float):
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def reserve(self) -> float:
+        """
+        Списание токена
+
+        Returns:
+            float: Время ожидания до выполнения запроса (сек.)
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            self._tokens -= 1
+            return self._wait(now)
+
+    def try_acquire(self) -> bool:
+        """Списание токена без ожидания, если он есть"""
+        with self._lock:
+            self._refill(time.monotonic())
+            if self._tokens < 1:
+                return False
+            self._tokens -= 1
+            return True
+
+    def _wait(self, now: float) -> float:
+        return max(0.0, -self._tokens / self.rate)
+
+
+class AdaptiveRateLimiter(TokenBucket):
+    """
+    Общий для процесса ограничитель запросов к маркетплейсу (AIMD)
+
+    Каждый успешный ответ увеличивает частоту аддитивно: примерно на
+    increase запросов в секунду за каждую секунду без ограничений.
+    Ответ 429/503 уменьшает частоту вдвое (не чаще раза в cooldown секунд,
+    чтобы пачка отказов от уже отправленных запросов не обнулила ее)
+    и, если указан Retry-After, приостанавливает все запросы процесса.
+    Так частота держится у предела, который маркетплейс принимает.
+    """
+
+    def __init__(self, rate: float, burst: float, min_rate: float, max_rate: float,
+                 increase: float = 1.0, decrease: float = 0.5, cooldown: float = 1.0):
+        """
+        Args:
+            rate: Начальная частота (запросов в секунду)
+            burst: Максимальный запас токенов
+            min_rate: Нижняя граница частоты
+            max_rate: Верхняя граница частоты
+            increase: Прирост частоты в секунду работы без ограничений
+            decrease: Множитель частоты при ограничении
+            cooldown: Минимальный интервал между уменьшениями (сек.)
+        """
+        super().__init__(min(max(rate, min_rate), max_rate), burst)
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.increase = increase
+        self.decrease = decrease
+        self.cooldown = cooldown
+        self.throttled_count = 0
+        self._paused_until = 0.0
+        self._last_decrease = float("-inf")
+
+    def _wait(self, now: float) -> float:
+        return max(super()._wait(now), self._paused_until - now)
+
+    def on_success(self):
+        """Учет успешного ответа: аддитивное увеличение частоты"""
+        with self._lock:
+            self.rate = min(self.max_rate, self.rate + self.increase / self.rate)
+
+    def on_throttle(self, retry_after: float | None = None):
+        """Учет ответа 429/503: мультипликативное уменьшение частоты и пауза"""
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            self.throttled_count += 1
+            if retry_after:
+                self._paused_until = max(self._paused_until, now + retry_after)
+            if now - self._last_decrease >= self.cooldown:
+                self.rate = max(self.min_rate, self.rate * self.decrease)
+                # Накопленный запас не должен сразу снова превысить лимит
+                self._tokens = min(self._tokens, 0.0)
+                self._last_decrease = now
+
+
+def parse_retry_after(value: str | None) -> float | None:
+    """
+    Значение заголовка Retry-After в секундах
+
+    Поддерживаются оба формата: число секунд и HTTP-дата.
+    """
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        moment = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, moment.timestamp() - time.time())
+
+
+class RetryPolicy:
+    """Повторы запросов с экспоненциальной задержкой и случайным разбросом"""
+
+    def __init__(self, max_retries: int | None = None, backoff: float | None = None,
+                 max_backoff: float | None = None):
+        """
+        Args:
+            max_retries: Количество повторов после первой попытки
+            backoff: Базовая задержка (сек.)
+            max_backoff: Максимальная задержка (сек.)
+        """
+        self.max_retries = parser_settings("HTTP_MAX_RETRIES") if max_retries is None else max_retries
+        self.backoff = parser_settings("HTTP_RETRY_BACKOFF") if backoff is None else backoff
+        self.max_backoff = parser_settings("HTTP_RETRY_MAX_BACKOFF") if max_backoff is None else max_backoff
+
+    def delay(self, attempt: int, response: httpx.Response | None) -> float:
+        """
+        Задержка перед повтором
+
+        Retry-After ответа имеет приоритет. Иначе "full jitter":
+        случайное время от 0 до backoff * 2^attempt, чтобы одновременно
+        получившие отказ запросы не повторялись синхронно.
+        """
+        if response is not None:
+            retry_after = parse_retry_after(response.headers.get("Retry-After"))
+            if retry_after is not None:
+                return min(retry_after, self.max_backoff)
+        return random.uniform(0, min(self.max_backoff, self.backoff * 2 ** attempt))
+
+
+def _should_retry(response: httpx.Response) -> bool:
+    return response.status_code in RETRY_STATUSES
+
+
+def _register_response(limiter: AdaptiveRateLimiter, response: httpx.Response):
+    if response.status_code in THROTTLE_STATUSES:
+        limiter.on_throttle(parse_retry_after(response.headers.get("Retry-After")))
+    elif response.status_code < 400:
+        limiter.on_success()
+
+
+def send_with_retries(send) -> httpx.Response:
+    """
+    Выполнение запроса через общий ограничитель с повторами
+
+    Args:
+        send: Функция без аргументов, выполняющая запрос
+
+    Returns:
+        httpx.Response: Последний ответ (после исчерпания повторов - неуспешный)
+
+    Raises:
+        httpx.TransportError: Если сетевая ошибка повторилась во всех попытках
+    """
+    limiter = get_rate_limiter()
+    policy = RetryPolicy()
+    for attempt in range(policy.max_retries + 1):
+        time.sleep(limiter.reserve())
+        try:
+            response = send()
+        except httpx.TransportError:
+            if attempt == policy.max_retries:
+                raise
+            time.sleep(policy.delay(attempt, None))
+            continue
+
+        _register_response(limiter, response)
+        if not _should_retry(response) or attempt == policy.max_retries:
+            return response
+        time.sleep(policy.delay(attempt, response))
+    raise AssertionError("unreachable")
+
+
+async def async_send_with_retries(send) -> httpx.Response:
+    """Асинхронный аналог send_with_retries (send возвращает корутину)"""
+    limiter = get_rate_limiter()
+    policy = RetryPolicy()
+    for attempt in range(policy.max_retries + 1):
+        await asyncio.sleep(limiter.reserve())
+        try:
+            response = await send()
+        except httpx.TransportError:
+            if attempt == policy.max_retries:
+                raise
+            await asyncio.sleep(policy.delay(attempt, None))
+            continue
+
+        _register_response(limiter, response)
+        if not _should_retry(response) or attempt == policy.max_retries:
+            return response
+        await asyncio.sleep(policy.delay(attempt, response))
+    raise AssertionError("unreachable")
+
+
+_limiter: AdaptiveRateLimiter | None = None
+_limiter_lock = threading.Lock()
+
+
+def get_rate_limiter() -> AdaptiveRateLimiter:
+    """Общий для всех парсингов процесса ограничитель запросов к маркетплейсу"""
+    global _limiter
+    if _limiter is None:
+        with _limiter_lock:
+            if _limiter is None:
+                _limiter = AdaptiveRateLimiter(
+                    rate=parser_settings("RATE_LIMIT"),
+                    burst=parser_settings("RATE_LIMIT_BURST"),
+                    min_rate=parser_settings("RATE_LIMIT_MIN"),
+                    max_rate=parser_settings("RATE_LIMIT_MAX"),
+                    increase=parser_settings("RATE_LIMIT_INCREASE"),
+                )
+    return _limiter
+
+
+def reset_rate_limiter():
+    """Сброс ограничителя: следующий запрос создаст новый с текущими настройками"""
+    global _limiter
+    with _limiter_lock:
+        _limiter = None
@@ -1,6 +1,6 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from .views import SearchQueryViewSet, ProductResultViewSet
+from .views import SearchQueryViewSet, ProductResultViewSet, metrics
 
 router = DefaultRouter()
 router.register(r'search', SearchQueryViewSet, basename='search')
@@ -8,4 +8,5 @@ router.register(r'products', ProductResultViewSet, basename='products')
 
 urlpatterns = [
     path('api/', include(router.urls)),
+    path('metrics', metrics, name='metrics'),
 ] 
\ No newline at end of file
@@ -1,38 +1,31 @@
+import time
+
+from django.http import HttpResponse, StreamingHttpResponse
 from rest_framework import viewsets, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
-from rest_framework.pagination import PageNumberPagination
-from .models import SearchQueryModel, ProductResultModel
+from .models import ParseJobModel, ParsePageModel, SearchQueryModel, ProductResultModel
 from .serializers import (
     SearchQuerySerializer,
     ProductResultSerializer,
     CreateSearchQuerySerializer,
+    BulkSearchQuerySerializer,
     QueryTextSerializer,
+    PRODUCT_RESULT_COLUMNS,
+    format_datetime,
+    serialize_product_rows,
 )
+from .bulk import CREATED, create_search_queries
+from .cache import build_etag, build_results_cache_key, etag_matches, get_results_cache
+from .conf import parser_settings
+from .events import SSE_RETRY_MS, open_progress_stream
+from .export import EXPORT_CONTENT_TYPES, StreamingContentNegotiation, iter_export
+from .history import get_price_changes, get_price_series, parse_period
+from .metrics import CONTENT_TYPE as METRICS_CONTENT_TYPE, RESULT_SECONDS, render_metrics
+from .pagination import KeysetPagination, StandardResultsSetPagination
 from .services import MarketplaceParserService
 
 
-class StandardResultsSetPagination(PageNumberPagination):
-    """Стандартная пагинация по 10 элементов"""
-
-    page_size = 10
-    max_page_size = 100
-    page_size_query_param = "page_size"
-
-    def get_paginated_response(self, data):
-        """Дополняем стандартный ответ информацией о текущей странице"""
-        return Response(
-            {
-                "count": self.page.paginator.count,
-                "next": self.get_next_link(),
-                "previous": self.get_previous_link(),
-                "current_page": self.page.number,
-                "total_pages": self.page.paginator.num_pages,
-                "results": data,
-            }
-        )
-
-
 class SearchQueryViewSet(viewsets.ModelViewSet):
     """ViewSet для управления поисковыми запросами"""
 
@@ -63,8 +56,8 @@ class SearchQueryViewSet(viewsets.ModelViewSet):
 
             query_text = serializer.validated_data["query_text"]
 
-            # Создаем новый запрос
-            search_query = SearchQueryModel.objects.create(query_text=query_text)
+            # Создаем новый запрос (с параметрами глубокого обхода, если заданы)
+            search_query = SearchQueryModel.objects.create(**serializer.validated_data)
 
             # Запускаем парсинг в фоне
             parser_service = MarketplaceParserService()
@@ -78,6 +71,32 @@ class SearchQueryViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_400_BAD_REQUEST,
             )
 
+    @action(detail=False, methods=["post"])
+    def bulk(self, request):
+        """
+        Пакетное создание поисковых запросов и запуск их парсинга
+
+        Принимает JSON: {"queries": ["текст", ...]}
+        Возвращает id и статус каждого запроса в порядке запроса:
+        created, exists (уже был добавлен) или duplicate (повтор в пакете).
+        Парсинги новых запросов ставятся в очередь с общим лимитом
+        одновременных парсингов.
+        """
+        serializer = BulkSearchQuerySerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        items, created = create_search_queries(serializer.validated_data["queries"])
+        if created:
+            MarketplaceParserService().start_parsing_many(created)
+
+        response_status = (
+            status.HTTP_201_CREATED
+            if any(item["status"] == CREATED for item in items)
+            else status.HTTP_200_OK
+        )
+        return Response({"results": items}, status=response_status)
+
     def destroy(self, request, *args, **kwargs):
         """
         Удаление поискового запроса и связанных результатов
@@ -94,6 +113,90 @@ class SearchQueryViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_400_BAD_REQUEST,
             )
 
+    @action(detail=True, methods=["post"])
+    def resume(self, request, pk=None):
+        """
+        Возобновление прерванного парсинга
+
+        POST /api/search/{id}/resume/
+        Загружаются только страницы без контрольной точки или с ошибкой,
+        уже записанные страницы повторно не запрашиваются.
+        """
+        search_query = self.get_object()
+        failed_pages = list(
+            search_query.pages.filter(status=ParsePageModel.Status.FAILED).values_list("page", flat=True)
+        )
+        if search_query.is_completed and not failed_pages:
+            return Response(
+                {"error": "Парсинг уже завершен"}, status=status.HTTP_409_CONFLICT
+            )
+        if search_query.jobs.filter(
+            status__in=[ParseJobModel.Status.PENDING, ParseJobModel.Status.RUNNING]
+        ).exists():
+            return Response(
+                {"error": "Парсинг уже выполняется"}, status=status.HTTP_409_CONFLICT
+            )
+
+        SearchQueryModel.objects.filter(id=search_query.id).update(is_completed=False)
+        MarketplaceParserService().start_parsing(search_query.id, search_query.query_text)
+
+        return Response(
+            {
+                "pages_done": search_query.pages.filter(status=ParsePageModel.Status.DONE).count(),
+                "failed_pages": failed_pages,
+            },
+            status=status.HTTP_202_ACCEPTED,
+        )
+
+    @action(detail=True, methods=["post"])
+    def refresh(self, request, pk=None):
+        """
+        Обновление результатов завершенного поискового запроса
+
+        POST /api/search/{id}/refresh/
+        Выдача загружается заново и сравнивается с сохраненными товарами:
+        записываются только новые и изменившиеся, пропавшие отмечаются удаленными.
+        """
+        search_query = self.get_object()
+        if not search_query.is_completed or search_query.jobs.filter(
+            status__in=[ParseJobModel.Status.PENDING, ParseJobModel.Status.RUNNING]
+        ).exists():
+            return Response(
+                {"error": "Парсинг уже выполняется"}, status=status.HTTP_409_CONFLICT
+            )
+
+        MarketplaceParserService().start_parsing(
+            search_query.id, search_query.query_text, refresh=True
+        )
+        return Response(status=status.HTTP_202_ACCEPTED)
+
+    @action(detail=True, methods=["get"], content_negotiation_class=StreamingContentNegotiation)
+    def events(self, request, pk=None):
+        """
+        Поток событий хода парсинга (Server-Sent Events)
+
+        GET /api/search/{id}/events/
+        Первое событие progress - текущее состояние (записано страниц и товаров),
+        далее page/page_failed по мере записи страниц и completed или error
+        в конце, после чего поток закрывается. Заменяет опрос
+        GET /api/search/{id}/ в ожидании is_completed. Если в процессе уже
+        открыто EVENTS_MAX_STREAMS потоков, отвечает 503: клиент
+        возвращается к опросу.
+        """
+        search_query = self.get_object()
+        stream = open_progress_stream(search_query.id)
+        if stream is None:
+            return Response(
+                {"error": "Слишком много потоков событий, используйте GET /api/search/{id}/"},
+                status=status.HTTP_503_SERVICE_UNAVAILABLE,
+                headers={"Retry-After": str(SSE_RETRY_MS // 1000)},
+            )
+        response = StreamingHttpResponse(stream, content_type="text/event-stream")
+        response["Cache-Control"] = "no-cache"
+        # nginx не должен буферизовать поток событий
+        response["X-Accel-Buffering"] = "no"
+        return response
+
     @action(detail=False, methods=["post"])
     def validate_query(self, request):
         """
@@ -122,11 +225,10 @@ class SearchQueryViewSet(viewsets.ModelViewSet):
                     status=status.HTTP_409_CONFLICT,
                 )
 
-            # Используем сервис для проверки запроса
+            # Используем сервис для проверки запроса: первая страница
+            # кэшируется и достается парсингу, если запрос будет создан
             parser_service = MarketplaceParserService()
-            is_valid, total_results, _, error_message = parser_service.get_data(
-                query, return_data=False
-            )
+            is_valid, total_results, _, error_message = parser_service.get_first_page(query)
 
             if is_valid:
                 return Response(
@@ -163,7 +265,18 @@ class ProductResultViewSet(viewsets.ReadOnlyModelViewSet):
 
     serializer_class = ProductResultSerializer
     pagination_class = StandardResultsSetPagination
-    queryset = ProductResultModel.objects.all()
+    # Товары, пропавшие из выдачи при обновлении, в результаты не попадают
+    queryset = ProductResultModel.objects.active().with_catalog()
+
+    @property
+    def paginator(self):
+        """Курсорная пагинация для result по запросу клиента, иначе постраничная"""
+        if not hasattr(self, '_paginator'):
+            if self.action == 'result' and KeysetPagination.is_requested(self.request):
+                self._paginator = KeysetPagination()
+            else:
+                self._paginator = self.pagination_class()
+        return self._paginator
     
     def get_queryset(self):
         """
@@ -178,77 +291,58 @@ class ProductResultViewSet(viewsets.ReadOnlyModelViewSet):
         - price_sort: asc/desc - сортировка по цене
         """
         queryset = super().get_queryset()
-        
-        # Получаем параметры запроса
-        if not hasattr(self, 'request') or not self.request:
-            return queryset
-            
-        params = self.request.query_params
-        
-        # Применяем сортировку на основе параметров запроса
-        order_fields = []
-        
-        # Сортировка по названию
-        name_sort = params.get('name_sort')
-        if name_sort:
-            if name_sort.lower() == 'desc':
-                order_fields.append('-name')
-            elif name_sort.lower() == 'asc':
-                order_fields.append('name')
-        
-        # Сортировка по бренду
-        brand_sort = params.get('brand_sort')
-        if brand_sort:
-            if brand_sort.lower() == 'desc':
-                order_fields.append('-brand')
-            elif brand_sort.lower() == 'asc':
-                order_fields.append('brand')
-        
-        # Сортировка по поставщику
-        supplier_sort = params.get('supplier_sort')
-        if supplier_sort:
-            if supplier_sort.lower() == 'desc':
-                order_fields.append('-supplier')
-            elif supplier_sort.lower() == 'asc':
-                order_fields.append('supplier')
-        
-        # Сортировка по рейтингу поставщика
-        supplier_rating_sort = params.get('supplier_rating_sort')
-        if supplier_rating_sort:
-            if supplier_rating_sort.lower() == 'desc':
-                order_fields.append('-supplier_rating')
-            elif supplier_rating_sort.lower() == 'asc':
-                order_fields.append('supplier_rating')
-        
-        # Сортировка по рейтингу отзывов
-        review_rating_sort = params.get('review_rating_sort')
-        if review_rating_sort:
-            if review_rating_sort.lower() == 'desc':
-                order_fields.append('-review_rating')
-            elif review_rating_sort.lower() == 'asc':
-                order_fields.append('review_rating')
-        
-        # Сортировка по количеству отзывов
-        feedbacks_sort = params.get('feedbacks_sort')
-        if feedbacks_sort:
-            if feedbacks_sort.lower() == 'desc':
-                order_fields.append('-feedbacks')
-            elif feedbacks_sort.lower() == 'asc':
-                order_fields.append('feedbacks')
-        
-        # Сортировка по цене
-        price_sort = params.get('price_sort')
-        if price_sort:
-            if price_sort.lower() == 'desc':
-                order_fields.append('-price')
-            elif price_sort.lower() == 'asc':
-                order_fields.append('price')
-        
+
         # Применяем сортировку, если были указаны параметры
+        order_fields = self.get_order_fields()
         if order_fields:
             queryset = queryset.order_by(*order_fields)
-        
+
         return queryset
+
+    def initial(self, request, *args, **kwargs):
+        self._started_at = time.perf_counter()
+        super().initial(request, *args, **kwargs)
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        """Учет времени ответа result по сортировке (метрика api_products_result_seconds)"""
+        response = super().finalize_response(request, response, *args, **kwargs)
+        if self.action == 'result' and hasattr(self, '_started_at'):
+            RESULT_SECONDS.observe(time.perf_counter() - self._started_at, sort=self.get_sort_key())
+        return response
+
+    def get_sort_key(self) -> str:
+        """Сортировка запроса для метрик: поля без tiebreaker id или default"""
+        return ",".join(self.get_order_fields()[:-1]) or "default"
+
+    def get_order_fields(self) -> list[str]:
+        """
+        Поля сортировки из параметров *_sort запроса
+
+        id в конце делает порядок стабильным и совпадает с составными
+        индексами (search_query_id, <поле>, id) при сортировке по одному полю.
+
+        Returns:
+            list[str]: Поля для order_by или пустой список без сортировки
+        """
+        if not hasattr(self, 'request') or not self.request:
+            return []
+
+        params = self.request.query_params
+        order_fields = []
+
+        # Порядок полей определяет приоритет сортировки
+        for field in ProductResultModel.SORT_FIELDS:
+            direction = params.get(f'{field}_sort', '').lower()
+            if direction == 'desc':
+                order_fields.append(f'-{field}')
+            elif direction == 'asc':
+                order_fields.append(field)
+
+        if order_fields:
+            tiebreaker = '-id' if order_fields[-1].startswith('-') else 'id'
+            order_fields.append(tiebreaker)
+
+        return order_fields
     
     @action(detail=False, methods=["get"])
     def result(self, request):
@@ -284,41 +378,26 @@ class ProductResultViewSet(viewsets.ReadOnlyModelViewSet):
         try:
             # Проверяем существование поискового запроса
             search_query = SearchQueryModel.objects.get(id=int(query_id))
-            queryset = self.get_queryset().filter(search_query=search_query)
-            
-            # Формируем базовый URL для пагинации с сохранением всех фильтров
-            # кроме page и page_size, которые будут добавлены пагинатором
-            filter_params = params.copy()
-            if 'page' in filter_params:
-                filter_params.pop('page')
-            if 'page_size' in filter_params:
-                filter_params.pop('page_size')
-            
-            # Добавляем информацию о поисковом запросе для контекста
-            search_query_info = {
-                "id": search_query.id,
-                "query_text": search_query.query_text,
-                "is_completed": search_query.is_completed,
-                "total_results": search_query.total_results,
-                "created_at": search_query.created_at,
-                "filters": dict(filter_params)
-            }
-            
-            # Применяем пагинацию
-            page = self.paginate_queryset(queryset)
-            if page is not None:
-                serializer = self.get_serializer(page, many=True)
-                response = self.get_paginated_response(serializer.data)
-                # Добавляем информацию о запросе в ответ
-                response.data["search_query"] = search_query_info
-                return response
-            
-            serializer = self.get_serializer(queryset, many=True)
-            return Response({
-                "search_query": search_query_info,
-                "results": serializer.data
-            })
-            
+
+            # Результаты идущего парсинга меняются, кэшируем только завершенные
+            if not search_query.is_completed:
+                return Response(self._get_result_data(search_query))
+
+            cache_key = build_results_cache_key(search_query, request.get_host(), params)
+            etag = build_etag(cache_key)
+            headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+
+            if etag_matches(etag, request.headers.get("If-None-Match", "")):
+                return Response(status=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+            cache = get_results_cache()
+            data = cache.get(cache_key)
+            if data is None:
+                data = self._get_result_data(search_query)
+                cache.set(cache_key, data, parser_settings("RESULTS_CACHE_TIMEOUT"))
+
+            return Response(data, headers=headers)
+
         except SearchQueryModel.DoesNotExist:
             return Response(
                 {"error": f"Поисковый запрос с ID {query_id} не найден"},
@@ -329,3 +408,167 @@ class ProductResultViewSet(viewsets.ReadOnlyModelViewSet):
                 {"error": f"Ошибка при получении результатов: {str(e)}"},
                 status=status.HTTP_400_BAD_REQUEST
             )
+
+    @action(detail=False, methods=["get"], content_negotiation_class=StreamingContentNegotiation)
+    def export(self, request):
+        """
+        Потоковая выгрузка всех результатов поискового запроса
+
+        GET /api/products/export/?id=1&export_format=csv
+
+        Параметры:
+        - id: ID поискового запроса (обязательный)
+        - export_format: csv/ndjson (по умолчанию csv)
+
+        Поддерживаются те же параметры *_sort, что и в result.
+        """
+        params = request.query_params
+        query_id = params.get('id')
+        if not query_id or not query_id.isdigit():
+            return Response(
+                {"error": "Необходимо указать корректный параметр id"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        export_format = params.get('export_format', 'csv').lower()
+        if export_format not in EXPORT_CONTENT_TYPES:
+            return Response(
+                {"error": f"Неподдерживаемый формат выгрузки: {export_format}"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        if not SearchQueryModel.objects.filter(id=int(query_id)).exists():
+            return Response(
+                {"error": f"Поисковый запрос с ID {query_id} не найден"},
+                status=status.HTTP_404_NOT_FOUND
+            )
+
+        queryset = self.get_queryset().filter(search_query_id=int(query_id))
+        response = StreamingHttpResponse(
+            iter_export(queryset, export_format),
+            content_type=EXPORT_CONTENT_TYPES[export_format],
+        )
+        response["Content-Disposition"] = (
+            f'attachment; filename="search_{query_id}.{export_format}"'
+        )
+        return response
+
+    @action(detail=True, methods=["get"])
+    def history(self, request, pk=None):
+        """
+        История цены, отзывов и рейтингов товара
+
+        GET /api/products/{id}/history/?since=2025-01-01T00:00:00Z
+
+        Параметры:
+        - since, until: границы периода (ISO 8601, необязательные)
+        """
+        try:
+            since, until = parse_period(request.query_params)
+        except ValueError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        # История доступна и для товаров, пропавших из выдачи
+        product = ProductResultModel.objects.filter(pk=pk).first()
+        if product is None:
+            return Response(
+                {"error": f"Товар с ID {pk} не найден"}, status=status.HTTP_404_NOT_FOUND
+            )
+
+        series = get_price_series(product, since, until)
+        for point in series:
+            point["observed_at"] = format_datetime(point["observed_at"])
+        return Response({"id": product.id, "external_id": product.product_id, "series": series})
+
+    @action(detail=False, methods=["get"])
+    def price_changes(self, request):
+        """
+        Изменения цен товаров поискового запроса между двумя моментами
+
+        GET /api/products/price_changes/?id=1&since=2025-01-01T00:00:00Z
+
+        Параметры:
+        - id: ID поискового запроса (обязательный)
+        - since: момент, с ценами которого сравниваем (обязательный),
+          например время предыдущего обновления
+        - until: момент, цены которого сравниваем (по умолчанию - текущие)
+        """
+        params = request.query_params
+        query_id = params.get('id')
+        if not query_id or not query_id.isdigit():
+            return Response(
+                {"error": "Необходимо указать корректный параметр id"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        try:
+            since, until = parse_period(params)
+        except ValueError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        if since is None:
+            return Response(
+                {"error": "Необходимо указать параметр since"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        if not SearchQueryModel.objects.filter(id=int(query_id)).exists():
+            return Response(
+                {"error": f"Поисковый запрос с ID {query_id} не найден"},
+                status=status.HTTP_404_NOT_FOUND
+            )
+
+        changes = get_price_changes(int(query_id), since, until)
+        page = self.paginate_queryset(changes)
+        if page is not None:
+            return self.get_paginated_response(page)
+        return Response(changes)
+
+    def _get_result_data(self, search_query: SearchQueryModel) -> dict:
+        """Данные страницы результатов поискового запроса"""
+        # Строки читаются как словари и сериализуются без ModelSerializer
+        queryset = self.get_queryset().filter(search_query=search_query).values(
+            *PRODUCT_RESULT_COLUMNS
+        )
+
+        # Формируем базовый URL для пагинации с сохранением всех фильтров
+        # кроме page и page_size, которые будут добавлены пагинатором
+        filter_params = self.request.query_params.copy()
+        for param in ('page', 'page_size', 'cursor', 'pagination'):
+            if param in filter_params:
+                filter_params.pop(param)
+
+        # Добавляем информацию о поисковом запросе для контекста
+        search_query_info = {
+            "id": search_query.id,
+            "query_text": search_query.query_text,
+            "is_completed": search_query.is_completed,
+            "total_results": search_query.total_results,
+            "created_at": search_query.created_at,
+            "filters": dict(filter_params)
+        }
+
+        # Для завершенного запроса количество уже сохранено в total_results,
+        # живой COUNT(*) нужен только пока парсинг идет
+        if search_query.is_completed and isinstance(self.paginator, StandardResultsSetPagination):
+            self.paginator.known_count = search_query.total_results
+
+        # Применяем пагинацию
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            data = self.get_paginated_response(serialize_product_rows(page)).data
+            # Добавляем информацию о запросе в ответ
+            data["search_query"] = search_query_info
+            return data
+
+        return {
+            "search_query": search_query_info,
+            "results": serialize_product_rows(queryset)
+        }
+
+
+def metrics(request):
+    """
+    Метрики процесса в текстовом формате Prometheus
+
+    GET /metrics
+    """
+    return HttpResponse(render_metrics(), content_type=METRICS_CONTENT_TYPE)
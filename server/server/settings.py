@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -112,9 +113,54 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        'OPTIONS': {
+            # WAL: чтение API не блокируется записью парсера;
+            # synchronous=NORMAL в режиме WAL безопасен и не делает fsync
+            # на каждую транзакцию
+            'init_command': 'PRAGMA journal_mode=WAL; PRAGMA synchronous=NORMAL',
+            # Ожидание снятия блокировки вместо немедленного "database is locked"
+            'timeout': 20,
+            # BEGIN IMMEDIATE берет блокировку записи в начале транзакции:
+            # ожидание по timeout работает, а не падает при повышении блокировки
+            'transaction_mode': 'IMMEDIATE',
+        },
+        # Тестовая БД в файле: парсер и воркер пишут в нее из нескольких
+        # потоков, а общий кэш in-memory SQLite не ждет снятия блокировок
+        'TEST': {
+            'NAME': BASE_DIR / 'test_db.sqlite3',
+        },
     }
 }
 
+# Cache
+# https://docs.djangoproject.com/en/5.2/topics/cache/
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    # Кэш страниц результатов: LRU в памяти процесса с ограничением размера.
+    # Для общего кэша нескольких воркеров gunicorn достаточно заменить BACKEND
+    # (например, на django.core.cache.backends.redis.RedisCache)
+    'results': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'results',
+        'OPTIONS': {
+            'MAX_ENTRIES': 2000,
+        },
+    },
+    # Первые страницы выдачи, полученные проверкой запроса: файлы в томе,
+    # общем для контейнеров server и worker, поэтому страницу использует
+    # парсинг в любом процессе (FIRST_PAGE_CACHE_ALIAS)
+    'first_page': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': BASE_DIR / 'cache' / 'first_page',
+        'OPTIONS': {
+            'MAX_ENTRIES': 256,
+        },
+    },
+}
+
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
@@ -166,3 +212,19 @@ REST_FRAMEWORK = {
         'rest_framework.renderers.BrowsableAPIRenderer',
     ],
 }
+
+# Настройки парсера маркетплейса (значения по умолчанию в parser/conf.py)
+MARKETPLACE_PARSER = {
+    'HTTP_TIMEOUT': 10.0,
+    'HTTP_CONNECT_TIMEOUT': 5.0,
+    'HTTP_MAX_CONNECTIONS': 100,
+    'HTTP_MAX_KEEPALIVE_CONNECTIONS': 20,
+    'HTTP2': True,
+    # Парсинг выполняет отдельный процесс: manage.py parse_worker
+    'JOB_BACKEND': 'queue',
+    'WORKER_CONCURRENCY': 4,
+    'RESULTS_CACHE_ALIAS': 'results',
+    # Общий каталог снимков метрик веб-воркеров gunicorn и воркера очереди
+    # (см. docker-compose.yml); без него /metrics отдает метрики одного процесса
+    'METRICS_DIR': os.environ.get('METRICS_DIR'),
+}